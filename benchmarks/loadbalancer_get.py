@@ -0,0 +1,59 @@
+"""
+Micro-benchmark for rendering ``GET /loadbalancers/<id>`` responses.
+
+Compares :obj:`mimic.canned_responses.loadbalancer.get_load_balancers`,
+which renders a shallow copy of the stored load balancer, with deep-copying
+the stored load balancer with its nodes listed in it, as earlier versions
+did, for load balancers with 1, 100 and 1000 nodes.  Run with::
+
+    python benchmarks/loadbalancer_get.py
+"""
+
+from __future__ import print_function
+
+from copy import deepcopy
+from timeit import repeat
+
+from twisted.internet.task import Clock
+
+from mimic.canned_responses.loadbalancer import (
+    Region_Tenant_CLBs, add_load_balancer, add_node, get_load_balancers)
+
+
+def store_with_nodes(count):
+    """
+    Create a load balancer store holding one load balancer with ``count``
+    nodes.
+    """
+    store = Region_Tenant_CLBs(Clock())
+    add_load_balancer("tenant", store, {"name": "lb", "protocol": "HTTP"},
+                      1, 0)
+    add_node(store, [{"address": "10.0.{0}.{1}".format(i // 256, i % 256),
+                      "port": 80, "condition": "ENABLED"}
+                     for i in range(count)], 1, 0)
+    return store
+
+
+def main(number=1000):
+    """
+    Time both ways of rendering for each size of load balancer, and print
+    the best per-call cost of each.
+    """
+    for count in (1, 100, 1000):
+        store = store_with_nodes(count)
+
+        def shallow():
+            get_load_balancers(store, 1)
+
+        def deep():
+            get_load_balancers(store, 1)
+            deepcopy(store.with_nodes(1))
+
+        for name, f in [("shallow", shallow), ("deepcopy", deep)]:
+            best = min(repeat(f, number=number, repeat=3))
+            print("{0:>5} nodes {1:>9}: {2:.1f} usec/call".format(
+                count, name, best / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Micro-benchmark for :obj:`mimic.core.MimicCore.uri_for_service`.
+
+Compares the cost of computing a URI prefix from scratch with the cost of
+looking up a previously computed one.  Run with::
+
+    python benchmarks/uri_for_service.py
+"""
+
+from __future__ import print_function
+
+from timeit import repeat
+
+from twisted.internet.task import Clock
+
+from mimic.core import MimicCore
+
+
+def main(number=100000):
+    """
+    Time both code paths and print the best per-call cost of each.
+    """
+    core = MimicCore.fromPlugins(Clock())
+    service_id = list(core._uuid_to_api.keys())[0]
+    args = ("ORD", service_id, "http://localhost:8900/")
+
+    def uncached():
+        core._build_uri_for_service(*args)
+
+    def cached():
+        core.uri_for_service(*args)
+
+    for name, f in [("uncached", uncached), ("cached", cached)]:
+        best = min(repeat(f, number=number, repeat=3))
+        print("{0:>10}: {1:.3f} usec/call".format(
+            name, best / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@
 """
 Canned response for get auth token
 """
+import json
 from datetime import datetime, timedelta
 
 
@@ -24,25 +25,15 @@ def format_timestamp(dt):
     return dt.strftime('%Y-%m-%dT%H:%M:%S.999-05:00')
 
 
-def get_token(tenant_id,
-              entry_generator,
-              prefix_for_endpoint,
-              timestamp=format_timestamp,
-              response_token=HARD_CODED_TOKEN,
-              response_user_id=HARD_CODED_USER_ID,
-              response_user_name=HARD_CODED_USER_NAME,
-              response_roles=HARD_CODED_ROLES):
+def service_catalog(tenant_id, entry_generator, prefix_for_endpoint):
     """
-    Canned response for authentication, with service catalog containing
-    endpoints only for services implemented by Mimic.
+    Canned service catalog, as included in the response to authentication.
 
-    :param callable timestamp: A callable, like format_timestamp, which takes a
-        datetime and returns a string.
     :param entry_generator: A callable, like canned_entries, which takes a
-        datetime and returns an iterable of Entry.
+        tenant ID and returns an iterable of Entry.
 
-    :return: a JSON-serializable dictionary matching the format of the JSON
-             response for the identity ``/v2/tokens`` request.
+    :return: a JSON-serializable list matching the format of the
+             ``serviceCatalog`` in the identity ``/v2/tokens`` response.
     """
     def entry_json():
         for entry in entry_generator(tenant_id):
@@ -60,26 +51,60 @@ def get_token(tenant_id,
                 "type": entry.type,
                 "endpoints": list(endpoint_json())
             }
+    return list(entry_json())
 
-    return {
-        "access": {
-            "token": {
-                # TODO: This token should be synthesized and stored in an
-                # auth_store-style argument, alongside impersonation tokens.
-                "id": response_token,
-                "expires": timestamp(datetime.now() + timedelta(days=1)),
-                "tenant": {
-                    "id": tenant_id,
-                    "name": tenant_id},
-                "RAX-AUTH:authenticatedBy": ["PASSWORD"]},
-            "serviceCatalog": list(entry_json()),
-            "user": {
-                "id": response_user_id,
-                "name": response_user_name,
-                "roles": response_roles,
-            }
+
+def _token_and_user(tenant_id, timestamp, response_token, response_user_id,
+                    response_user_name, response_roles):
+    """
+    The ``token`` and ``user`` portions of the response to authentication.
+
+    :return: a 2-tuple of JSON-serializable dictionaries.
+    """
+    return (
+        {
+            # TODO: This token should be synthesized and stored in an
+            # auth_store-style argument, alongside impersonation tokens.
+            "id": response_token,
+            "expires": timestamp(datetime.now() + timedelta(days=1)),
+            "tenant": {
+                "id": tenant_id,
+                "name": tenant_id},
+            "RAX-AUTH:authenticatedBy": ["PASSWORD"]},
+        {
+            "id": response_user_id,
+            "name": response_user_name,
+            "roles": response_roles,
         }
-    }
+    )
+
+
+def get_token_json(tenant_id,
+                   service_catalog_json,
+                   timestamp=format_timestamp,
+                   response_token=HARD_CODED_TOKEN,
+                   response_user_id=HARD_CODED_USER_ID,
+                   response_user_name=HARD_CODED_USER_NAME,
+                   response_roles=HARD_CODED_ROLES):
+    """
+    Canned response for authentication, with service catalog containing
+    endpoints only for services implemented by Mimic.  The service catalog
+    has already been serialized, since it is cached; only the token and user
+    are serialized here, and ``service_catalog_json`` is included verbatim.
+
+    :param str service_catalog_json: the JSON serialization of the result of
+        :func:`service_catalog`.
+    :param callable timestamp: A callable, like format_timestamp, which takes a
+        datetime and returns a string.
+
+    :return: the JSON response body for the identity ``/v2/tokens`` request.
+    :rtype: ``str``
+    """
+    token, user = _token_and_user(tenant_id, timestamp, response_token,
+                                  response_user_id, response_user_name,
+                                  response_roles)
+    return '{{"access": {{"token": {0}, "serviceCatalog": {1}, "user": {2}}}}}'.format(
+        json.dumps(token), service_catalog_json, json.dumps(user))
 
 
 def get_endpoints(tenant_id, entry_generator, prefix_for_endpoint):
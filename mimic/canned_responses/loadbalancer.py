@@ -3,23 +3,317 @@
 Canned response for add/get/list/delete load balancers and
 add/get/delete/list nodes
 """
+from bisect import bisect_right, insort
 from random import randrange
-from copy import deepcopy
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    # Python 2.6
+    from ordereddict import OrderedDict
+
 from mimic.util.helper import (not_found_response, invalid_resource,
-                               set_resource_status, seconds_to_timestamp)
-from twisted.python import log
+                               seconds_to_timestamp, next_version)
+from mimic.util.logger import Logger
+
+
+_log = Logger("mimic.loadbalancer")
+
+#: The timed transitions of load balancers: for each status, the status a
+#: load balancer moves to once it has had that status for a while (``None``
+#: meaning that it is removed altogether), the key of the load balancer's
+#: metadata giving that while in seconds, and the number of seconds if the
+#: metadata does not give one.
+TIMED_TRANSITIONS = {
+    "BUILD": ("ACTIVE", "lb_building", 10),
+    "PENDING-UPDATE": ("ACTIVE", "lb_pending_update", 0),
+    "PENDING-DELETE": ("DELETED", "lb_pending_delete", 10),
+    "DELETED": (None, None, 3600),
+}
+
+#: The transitions of ``ACTIVE`` load balancers when they are changed: the
+#: status a load balancer moves to if its metadata has the given key, in
+#: increasing order of precedence.
+CHANGE_TRANSITIONS = [
+    ("lb_pending_update", "PENDING-UPDATE"),
+    ("lb_pending_delete", "PENDING-DELETE"),
+    ("lb_error_state", "ERROR"),
+]
 
 
 class Region_Tenant_CLBs(object):
     """
     Object that stores a store of CLB and CLB Metadata info
+
+    :ivar dict versions: the version stamp of each load balancer, replaced
+        whenever it changes; see :obj:`mimic.util.helper.next_version`.
+    :ivar int version: a version stamp for the store as a whole, replaced
+        whenever any of its load balancers changes.
+    :ivar dict nodes: for each load balancer, an :obj:`OrderedDict` of its
+        nodes by node ID, in the order they were added; the nodes are kept
+        here rather than in the load balancer, and only listed in it when it
+        is rendered.
+    :ivar dict node_addresses: for each load balancer, the IDs of its nodes
+        by ``(address, port)``.
+    :ivar list ids: the IDs of the load balancers, in ascending order, which
+        is the order in which they are listed.
+    :ivar clock: the :obj:`IReactorTime` provider on which the timed
+        transitions of the load balancers (see :obj:`TIMED_TRANSITIONS`) are
+        scheduled.
     """
-    def __init__(self):
+    def __init__(self, clock):
         """
-        There are two stores - the lb info, and the metadata info
+        There are two stores - the lb info, and the metadata info - along
+        with indexes of the nodes of each lb
         """
+        self.clock = clock
+        self._transitions = {}
         self.lbs = {}
         self.meta = {}
+        self.versions = {}
+        self.version = next_version()
+        self.nodes = {}
+        self.node_addresses = {}
+        self.ids = []
+        self._summaries = {}
+
+    def touch(self, lb_id):
+        """
+        Record that the given load balancer has been added or has changed.
+        """
+        self.versions[lb_id] = self.version = next_version()
+
+    def add(self, lb_id, lb):
+        """
+        Add a new load balancer, or replace one with the same ID, and
+        schedule its first timed transition, if any.  The list of nodes the
+        load balancer is created with, if any, is taken out of it and kept
+        in :obj:`nodes`.
+        """
+        if lb_id not in self.lbs:
+            insort(self.ids, lb_id)
+        self.lbs[lb_id] = lb
+        self.index_nodes(lb_id)
+        self.touch(lb_id)
+        self.schedule_transition(lb_id)
+
+    def remove(self, lb_id):
+        """
+        Remove the given load balancer.
+        """
+        del self.lbs[lb_id]
+        del self.ids[bisect_right(self.ids, lb_id) - 1]
+        self._summaries.pop(lb_id, None)
+        pending = self._transitions.pop(lb_id, None)
+        if pending is not None and pending.active():
+            pending.cancel()
+        self.versions.pop(lb_id, None)
+        self.nodes.pop(lb_id, None)
+        self.node_addresses.pop(lb_id, None)
+        self.version = next_version()
+
+    def set_status(self, lb_id, status, when):
+        """
+        Move the given load balancer to the given status, recording the
+        given time (in seconds) as the time it was updated, and schedule its
+        next timed transition, if any.
+        """
+        lb = self.lbs[lb_id]
+        if lb["status"] != status:
+            _log.debug("Load balancer %(lb_id)s is now %(status)s",
+                       lb_id=lb_id, status=status)
+        lb["status"] = status
+        lb["updated"]["time"] = when
+        self.touch(lb_id)
+        self.schedule_transition(lb_id)
+
+    def schedule_transition(self, lb_id):
+        """
+        Schedule the timed transition of the given load balancer out of its
+        current status, counting from the time it was last updated, in place
+        of any transition already scheduled.
+        """
+        pending = self._transitions.pop(lb_id, None)
+        if pending is not None and pending.active():
+            pending.cancel()
+        transition = TIMED_TRANSITIONS.get(self.lbs[lb_id]["status"])
+        if transition is None:
+            return
+        status, key, default = transition
+        due = (self.lbs[lb_id]["updated"]["time"] +
+               int(self.meta[lb_id].get(key) or default))
+        # Transitions are timed from when they became due, not from when the
+        # clock got round to them, so that advancing the clock a long way
+        # makes every transition due in that time, in turn.
+        self._transitions[lb_id] = self.clock.callLater(
+            max(0, due - self.clock.seconds()), self._transition, lb_id,
+            status, due)
+
+    def _transition(self, lb_id, status, when):
+        """
+        Make a timed transition of the given load balancer to the given
+        status, or remove it if the status is ``None``.
+        """
+        del self._transitions[lb_id]
+        if status is None:
+            _log.debug("Load balancer %(lb_id)s is purged", lb_id=lb_id)
+            self.remove(lb_id)
+        else:
+            self.set_status(lb_id, status, when)
+
+    def changed(self, lb_id, when):
+        """
+        Record that the given load balancer was changed at the given time,
+        moving it out of ``ACTIVE`` as its metadata calls for (see
+        :obj:`CHANGE_TRANSITIONS`).
+        """
+        status = self.lbs[lb_id]["status"]
+        if status != "ACTIVE":
+            return
+        for key, candidate in CHANGE_TRANSITIONS:
+            if key in self.meta[lb_id]:
+                status = candidate
+        self.set_status(lb_id, status, when)
+
+    def dump(self):
+        """
+        Get a picklable representation of the load balancers and their
+        metadata, as ``(lb_id, lb, meta)`` tuples.
+        """
+        return [(lb_id, self.with_nodes(lb_id), self.meta[lb_id])
+                for lb_id in self.ids]
+
+    def entry(self, lb_id):
+        """
+        Get a picklable representation of the given load balancer and its
+        metadata, as ``(lb, meta)``, or ``None`` if there is no such load
+        balancer.
+        """
+        if lb_id not in self.lbs:
+            return None
+        return (self.with_nodes(lb_id), self.meta[lb_id])
+
+    def apply(self, lb_id, entry):
+        """
+        Make the given load balancer match the representation returned by
+        :obj:`entry`: replace it, or remove it if ``entry`` is ``None``.
+        """
+        if entry is None:
+            if lb_id in self.lbs:
+                self.remove(lb_id)
+            return
+        lb, meta = entry
+        self.meta[lb_id] = meta
+        self.add(lb_id, lb)
+
+    @classmethod
+    def load(cls, state, clock):
+        """
+        Re-create a store from the representation returned by :obj:`dump`,
+        scheduling the timed transitions of the load balancers as of when
+        they were last updated.
+        """
+        store = cls(clock)
+        for lb_id, lb, meta in state:
+            store.apply(lb_id, (lb, meta))
+        return store
+
+    def summary(self, lb_id):
+        """
+        Get the representation of the given load balancer in lists of load
+        balancers, which is rendered once for each version of the load
+        balancer and shared by every list until it changes.
+        """
+        version = self.versions[lb_id]
+        cached = self._summaries.get(lb_id)
+        if cached is None or cached[0] != version:
+            cached = self._summaries[lb_id] = (
+                version, _prep_for_list([self.with_nodes(lb_id)])[0])
+        return cached[1]
+
+    def page(self, marker=None, limit=None):
+        """
+        Get the IDs of the load balancers with IDs greater than ``marker``
+        (if given), in ascending order, up to ``limit`` of them (if given).
+        """
+        start = 0 if marker is None else bisect_right(self.ids, marker)
+        if limit is None:
+            return self.ids[start:]
+        return self.ids[start:start + limit]
+
+    def index_nodes(self, lb_id):
+        """
+        Index the nodes a new load balancer was created with, taking them out
+        of the load balancer.
+        """
+        self.nodes[lb_id] = OrderedDict()
+        self.node_addresses[lb_id] = {}
+        self._index(lb_id, self.lbs[lb_id].pop("nodes", []))
+
+    def _index(self, lb_id, nodes):
+        """
+        Add the given nodes to the end of the nodes of the given load
+        balancer, and to its indexes.
+
+        :raise ValueError: if any two of the nodes of the load balancer
+            would have the same ID; no nodes are added.
+        """
+        by_id = self.nodes[lb_id]
+        by_address = self.node_addresses[lb_id]
+        ids = [node["id"] for node in nodes]
+        if len(set(ids)) < len(ids) or any(node_id in by_id
+                                           for node_id in ids):
+            raise ValueError(
+                "Duplicate node ID on load balancer {0}".format(lb_id))
+        for node in nodes:
+            by_id[node["id"]] = node
+            by_address[(node["address"], node["port"])] = node["id"]
+
+    def node_list(self, lb_id):
+        """
+        Get the nodes of the given load balancer, in the order they were
+        added.
+        """
+        return list(self.nodes[lb_id].values())
+
+    def with_nodes(self, lb_id):
+        """
+        Get a shallow copy of the given load balancer, with its nodes listed
+        in it if it has any, as it is rendered.
+        """
+        lb = dict(self.lbs[lb_id])
+        if self.nodes[lb_id]:
+            lb["nodes"] = self.node_list(lb_id)
+        return lb
+
+    def has_node_at(self, lb_id, address, port):
+        """
+        Whether the given load balancer has a node with the given address and
+        port.
+        """
+        return (address, port) in self.node_addresses[lb_id]
+
+    def add_nodes(self, lb_id, nodes):
+        """
+        Add the given nodes to the end of the given load balancer's nodes.
+        """
+        self._index(lb_id, nodes)
+        self.touch(lb_id)
+
+    def remove_node(self, lb_id, node_id):
+        """
+        Remove the node with the given ID from the given load balancer.
+
+        :return: whether there was such a node.
+        """
+        node = self.nodes[lb_id].pop(node_id, None)
+        if node is None:
+            return False
+        address = (node["address"], node["port"])
+        if self.node_addresses[lb_id].get(address) == node_id:
+            del self.node_addresses[lb_id][address]
+        self.touch(lb_id)
+        return True
 
 
 def load_balancer_example(lb_info, lb_id, status,
@@ -51,7 +345,7 @@ def load_balancer_example(lb_info, lb_id, status,
                   "connectionLogging": lb_info.get("connectionLogging", {"enabled": False}),
                   "contentCaching": {"enabled": False}}
     if lb_info.get("nodes"):
-        lb_example.update({"nodes": _format_nodes_on_lb(lb_info["nodes"])})
+        lb_example.update({"nodes": _format_nodes_on_lb(lb_info["nodes"], {})})
     if lb_info.get("metadata"):
         lb_example.update({"metadata": _format_meta(lb_info["metadata"])})
     return lb_example
@@ -61,8 +355,8 @@ def add_load_balancer(tenant_id, store, lb_info, lb_id, current_timestamp):
     """
     Returns response of a newly created load balancer with
     response code 202, and adds the new lb to the store's lbs.
-    Note: ``store.lbs`` has tenant_id added as an extra key in comparison
-    to the lb_example.
+    Note: ``store.lbs`` holds only the lb_example, since the store belongs to
+    a single tenant.
     """
     status = "ACTIVE"
 
@@ -73,35 +367,26 @@ def add_load_balancer(tenant_id, store, lb_info, lb_id, current_timestamp):
         for each in lb_info["metadata"]:
             meta.update({each["key"]: each["value"]})
     store.meta[lb_id] = meta
-    log.msg(store.meta)
+    _log.debug("Load balancer %(lb_id)s has metadata %(meta)r",
+               lb_id=lb_id, meta=meta)
 
     if "lb_building" in store.meta[lb_id]:
         status = "BUILD"
 
-    # Add tenant_id and nodeCount to store.lbs
-    current_timestring = seconds_to_timestamp(current_timestamp)
-    store.lbs[lb_id] = load_balancer_example(lb_info, lb_id, status,
-                                             current_timestring)
-    store.lbs[lb_id].update({"tenant_id": tenant_id})
-    store.lbs[lb_id].update(
-        {"nodeCount": len(store.lbs[lb_id].get("nodes", []))})
-
-    # and remove before returning response for add lb
-    new_lb = _lb_without_tenant(store, lb_id)
+    # The times are kept as seconds, and only formatted in responses.
+    store.add(lb_id, load_balancer_example(lb_info, lb_id, status,
+                                           current_timestamp))
 
-    return {'loadBalancer': new_lb}, 202
+    return {'loadBalancer': _lb_response(store, lb_id)}, 202
 
 
-def get_load_balancers(store, lb_id, current_timestamp):
+def get_load_balancers(store, lb_id):
     """
     Returns the load balancers with the given lb id, with response
     code 200. If no load balancers are found returns 404.
     """
     if lb_id in store.lbs:
-        _verify_and_update_lb_state(store, lb_id, False, current_timestamp)
-        log.msg(store.lbs[lb_id]["status"])
-        new_lb = _lb_without_tenant(store, lb_id)
-        return {'loadBalancer': new_lb}, 200
+        return {'loadBalancer': _lb_response(store, lb_id)}, 200
     return not_found_response("loadbalancer"), 404
 
 
@@ -120,20 +405,18 @@ def del_load_balancer(store, lb_id, current_timestamp):
             # Dont doubt this to be 422, it is 400!
             return invalid_resource(msg, 400), 400
 
-        _verify_and_update_lb_state(store, lb_id, True, current_timestamp)
+        store.changed(lb_id, current_timestamp)
 
         if any([store.lbs[lb_id]["status"] == "ACTIVE",
                 store.lbs[lb_id]["status"] == "ERROR",
                 store.lbs[lb_id]["status"] == "PENDING-UPDATE"]):
-            del store.lbs[lb_id]
+            store.remove(lb_id)
             return b'', 202
 
         if store.lbs[lb_id]["status"] == "PENDING-DELETE":
             return b'', 202
 
         if store.lbs[lb_id]["status"] == "DELETED":
-            _verify_and_update_lb_state(store, lb_id,
-                                        current_timestamp=current_timestamp)
             msg = "Must provide valid load balancers: {0} could not be found.".format(lb_id)
             # Dont doubt this to be 422, it is 400!
             return invalid_resource(msg, 400), 400
@@ -141,23 +424,29 @@ def del_load_balancer(store, lb_id, current_timestamp):
     return not_found_response("loadbalancer"), 404
 
 
-def list_load_balancers(tenant_id, store, current_timestamp):
+def list_load_balancers(tenant_id, store, limit=None, marker=None):
     """
     Returns the list of load balancers with the given tenant id with response
     code 200. If no load balancers are found returns empty list.
+
+    :param str limit: the maximum number of load balancers to list.
+    :param str marker: the ID of the last load balancer of the previous
+        page; only load balancers with greater IDs are listed.
     """
-    response = dict(
-        (k, v) for (k, v) in store.lbs.items()
-        if tenant_id == v['tenant_id']
-    )
-    for each in response:
-        _verify_and_update_lb_state(store, each, False, current_timestamp)
-        log.msg(store.lbs[each]["status"])
-    updated_resp = dict(
-        (k, v) for (k, v) in store.lbs.items()
-        if tenant_id == v['tenant_id']
-    )
-    return {'loadBalancers': _prep_for_list(updated_resp.values()) or []}, 200
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            return invalid_resource("limit param must be an integer", 400), 400
+        if limit < 0:
+            return invalid_resource("limit param must be positive", 400), 400
+    if marker is not None:
+        try:
+            marker = int(marker)
+        except ValueError:
+            return invalid_resource("marker param must be an integer", 400), 400
+    return {'loadBalancers': [store.summary(lb_id) for lb_id
+                              in store.page(marker, limit)]}, 200
 
 
 def add_node(store, node_list, lb_id, current_timestamp):
@@ -166,54 +455,47 @@ def add_node(store, node_list, lb_id, current_timestamp):
     """
     if lb_id in store.lbs:
 
-        _verify_and_update_lb_state(store, lb_id, False, current_timestamp)
-
         if store.lbs[lb_id]["status"] != "ACTIVE":
             resource = invalid_resource(
                 "Load Balancer '{0}' has a status of {1} and is considered "
                 "immutable.".format(lb_id, store.lbs[lb_id]["status"]), 422)
             return (resource, 422)
 
-        nodes = _format_nodes_on_lb(node_list)
-
-        if store.lbs[lb_id].get("nodes"):
-            for existing_node in store.lbs[lb_id]["nodes"]:
-                for new_node in node_list:
-                    if (existing_node["address"] == new_node["address"] and
-                            existing_node["port"] == new_node["port"]):
-                        resource = invalid_resource(
-                            "Duplicate nodes detected. One or more nodes "
-                            "already configured on load balancer.", 413)
-                        return (resource, 413)
-
-            store.lbs[lb_id]["nodes"] = store.lbs[lb_id]["nodes"] + nodes
-        else:
-            store.lbs[lb_id]["nodes"] = nodes
-            store.lbs[lb_id]["nodeCount"] = len(store.lbs[lb_id]["nodes"])
-            _verify_and_update_lb_state(store, lb_id,
-                                        current_timestamp=current_timestamp)
+        addresses = set()
+        for new_node in node_list:
+            address = (new_node["address"], new_node["port"])
+            if (address in addresses or
+                    store.has_node_at(lb_id, *address)):
+                resource = invalid_resource(
+                    "Duplicate nodes detected. One or more nodes "
+                    "already configured on load balancer.", 413)
+                return (resource, 413)
+            addresses.add(address)
+
+        nodes = _format_nodes_on_lb(node_list, store.nodes[lb_id])
+        first_nodes = not store.nodes[lb_id]
+        store.add_nodes(lb_id, nodes)
+        if first_nodes:
+            store.changed(lb_id, current_timestamp)
         return {"nodes": nodes}, 200
 
     return not_found_response("loadbalancer"), 404
 
 
-def get_nodes(store, lb_id, node_id, current_timestamp):
+def get_nodes(store, lb_id, node_id):
     """
     Returns the node on the load balancer
     """
     if lb_id in store.lbs:
-        _verify_and_update_lb_state(store, lb_id, False, current_timestamp)
-
         if store.lbs[lb_id]["status"] == "DELETED":
             return (
                 invalid_resource(
                     "The loadbalancer is marked as deleted.", 410),
                 410)
 
-        if store.lbs[lb_id].get("nodes"):
-            for each in store.lbs[lb_id]["nodes"]:
-                if node_id == each["id"]:
-                    return {"node": each}, 200
+        node = store.nodes[lb_id].get(node_id)
+        if node is not None:
+            return {"node": node}, 200
         return not_found_response("node"), 404
 
     return not_found_response("loadbalancer"), 404
@@ -226,55 +508,40 @@ def delete_node(store, lb_id, node_id, current_timestamp):
     """
     if lb_id in store.lbs:
 
-        _verify_and_update_lb_state(store, lb_id, False, current_timestamp)
-
         if store.lbs[lb_id]["status"] != "ACTIVE":
             resource = invalid_resource(
                 "Load Balancer '{0}' has a status of {1} and is considered "
                 "immutable.".format(lb_id, store.lbs[lb_id]["status"]), 422)
             return (resource, 422)
 
-        _verify_and_update_lb_state(store, lb_id,
-                                    current_timestamp=current_timestamp)
+        store.changed(lb_id, current_timestamp)
 
-        if store.lbs[lb_id].get("nodes"):
-            for each in store.lbs[lb_id]["nodes"]:
-                if each["id"] == node_id:
-                    index = store.lbs[lb_id]["nodes"].index(each)
-                    del store.lbs[lb_id]["nodes"][index]
-                    if not store.lbs[lb_id]["nodes"]:
-                        del store.lbs[lb_id]["nodes"]
-                    store.lbs[lb_id].update({"nodeCount": len(store.lbs[lb_id].get("nodes", []))})
-                    return None, 202
+        if store.remove_node(lb_id, node_id):
+            return None, 202
 
         return not_found_response("node"), 404
 
     return not_found_response("loadbalancer"), 404
 
 
-def list_nodes(store, lb_id, current_timestamp):
+def list_nodes(store, lb_id):
     """
     Returns the list of nodes remaining on the load balancer
     """
     if lb_id in store.lbs:
-        _verify_and_update_lb_state(store, lb_id, False, current_timestamp)
-        if lb_id not in store.lbs:
-            return not_found_response("loadbalancer"), 404
-
         if store.lbs[lb_id]["status"] == "DELETED":
             return invalid_resource("The loadbalancer is marked as deleted.", 410), 410
-        node_list = []
-        if store.lbs[lb_id].get("nodes"):
-            node_list = store.lbs[lb_id]["nodes"]
-        return {"nodes": node_list}, 200
+        return {"nodes": store.node_list(lb_id)}, 200
     else:
         return not_found_response("loadbalancer"), 404
 
 
-def _format_nodes_on_lb(node_list):
+def _format_nodes_on_lb(node_list, taken):
     """
-    create a dict of nodes given the list of nodes
+    create a dict of nodes given the list of nodes, each with an ID distinct
+    from those of the others and from those in ``taken``
     """
+    ids = set(taken)
     nodes = []
     for each in node_list:
         node = {}
@@ -286,6 +553,9 @@ def _format_nodes_on_lb(node_list):
         if each.get("type"):
             node["type"] = each["type"]
         node["id"] = randrange(999999)
+        while node["id"] in ids:
+            node["id"] = randrange(999999)
+        ids.add(node["id"])
         node["status"] = "ONLINE"
         nodes.append(node)
     return nodes
@@ -302,79 +572,39 @@ def _format_meta(metadata_list):
     return meta
 
 
-def _lb_without_tenant(store, lb_id):
+def _lb_response(store, lb_id):
     """
-    returns a copy of the store for the given lb_id, without
-    tenant_id
+    returns the response for the given lb_id: a shallow copy of the
+    stored load balancer, with its nodes listed and its times formatted,
+    which shares everything else (such as the nodes themselves) with the
+    store
     """
-    new_lb = deepcopy(store.lbs[lb_id])
-    del new_lb["tenant_id"]
-    del new_lb["nodeCount"]
+    new_lb = store.with_nodes(lb_id)
+    _format_times(new_lb)
     return new_lb
 
 
+def _format_times(lb):
+    """
+    Replace the created and updated times, in seconds, of the given load
+    balancer response with timestamps.
+    """
+    for entry in ("created", "updated"):
+        lb[entry] = {"time": seconds_to_timestamp(lb[entry]["time"])}
+
+
 def _prep_for_list(lb_list):
     """
-    Removes tenant id and changes the nodes list to 'nodeCount' set to the
-    number of node on the LB
+    Keeps only the summary of each LB, with the nodes list changed to
+    'nodeCount' set to the number of node on the LB
     """
     entries_to_keep = ('name', 'protocol', 'id', 'port', 'algorithm', 'status', 'timeout',
-                       'created', 'virtualIps', 'updated', 'nodeCount')
+                       'created', 'virtualIps', 'updated')
     filtered_lb_list = []
     for each in lb_list:
-        filtered_lb_list.append(dict((entry, each[entry]) for entry in entries_to_keep))
+        filtered_lb = dict((entry, each[entry]) for entry in entries_to_keep)
+        filtered_lb["nodeCount"] = len(each.get("nodes", ()))
+        _format_times(filtered_lb)
+        filtered_lb_list.append(filtered_lb)
     return filtered_lb_list
 
-
-def _verify_and_update_lb_state(store, lb_id, set_state=True,
-                                current_timestamp=None):
-    """
-    Based on the current state, the metadata on the lb and the time since the LB has
-    been in that state, set the appropriate state in store.lbs
-    Note: Reconsider if update metadata is implemented
-    """
-    current_timestring = seconds_to_timestamp(current_timestamp)
-    if store.lbs[lb_id]["status"] == "BUILD":
-        store.meta[lb_id]["lb_building"] = store.meta[lb_id]["lb_building"] or 10
-        store.lbs[lb_id]["status"] = set_resource_status(
-            store.lbs[lb_id]["updated"]["time"],
-            store.meta[lb_id]["lb_building"],
-            current_timestamp=current_timestamp
-        ) or "BUILD"
-
-    elif store.lbs[lb_id]["status"] == "ACTIVE" and set_state:
-        if "lb_pending_update" in store.meta[lb_id]:
-            store.lbs[lb_id]["status"] = "PENDING-UPDATE"
-            log.msg("here")
-            log.msg(store.lbs[lb_id]["status"])
-        if "lb_pending_delete" in store.meta[lb_id]:
-            store.lbs[lb_id]["status"] = "PENDING-DELETE"
-        if "lb_error_state" in store.meta[lb_id]:
-            store.lbs[lb_id]["status"] = "ERROR"
-        store.lbs[lb_id]["updated"]["time"] = current_timestring
-
-    elif store.lbs[lb_id]["status"] == "PENDING-UPDATE":
-        if "lb_pending_update" in store.meta[lb_id]:
-            store.lbs[lb_id]["status"] = set_resource_status(
-                store.lbs[lb_id]["updated"]["time"],
-                store.meta[lb_id]["lb_pending_update"],
-                current_timestamp=current_timestamp
-            ) or "PENDING-UPDATE"
-
-    elif store.lbs[lb_id]["status"] == "PENDING-DELETE":
-        store.meta[lb_id]["lb_pending_delete"] = store.meta[lb_id]["lb_pending_delete"] or 10
-        store.lbs[lb_id]["status"] = set_resource_status(
-            store.lbs[lb_id]["updated"]["time"],
-            store.meta[lb_id]["lb_pending_delete"], "DELETED",
-            current_timestamp=current_timestamp
-        ) or "PENDING-DELETE"
-        store.lbs[lb_id]["updated"]["time"] = current_timestring
-
-    elif store.lbs[lb_id]["status"] == "DELETED":
-        # see del_load_balancer above for an explanation of this state change.
-        store.lbs[lb_id]["status"] = set_resource_status(
-            store.lbs[lb_id]["updated"]["time"], 3600, "DELETING-NOW",
-            current_timestamp=current_timestamp
-        ) or "DELETED"
-        if store.lbs[lb_id]["status"] == "DELETING-NOW":
-            del store.lbs[lb_id]
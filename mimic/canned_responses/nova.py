@@ -8,10 +8,32 @@ from twisted.python.urlpath import URLPath
 
 from mimic.canned_responses.mimic_presets import get_presets
 from mimic.util.helper import (not_found_response, invalid_resource,
-                               set_resource_status)
+                               timestamp_to_seconds, seconds_to_timestamp,
+                               next_version)
 import json
 
 
+def server_links(tenant_id, server_id, compute_uri_prefix):
+    """
+    The links to the server with the given ID.
+    """
+    def url(suffix):
+        return str(URLPath.fromString(compute_uri_prefix).child(suffix))
+
+    return [
+        {
+            "href": url("v2/{0}/servers/{1}".format(
+                tenant_id, server_id
+            )),
+            "rel": "self"
+        },
+        {
+            "href": url("{0}/servers/{1}".format(tenant_id, server_id)),
+            "rel": "bookmark"
+        }
+    ]
+
+
 def server_template(tenant_id, server_info, server_id, status, current_time,
                     ipsegment=lambda: randrange(255),
                     compute_uri_prefix="http://localhost:8902/"):
@@ -62,18 +84,7 @@ def server_template(tenant_id, server_info, server_id, status, current_time,
         },
         "hostId": "33ccb6c82f3625748b6f2338f54d8e9df07cc583251e001355569056",
         "id": server_id,
-        "links": [
-            {
-                "href": url("v2/{0}/servers/{1}".format(
-                    tenant_id, server_id
-                )),
-                "rel": "self"
-            },
-            {
-                "href": url("{0}/servers/{1}".format(tenant_id, server_id)),
-                "rel": "bookmark"
-            }
-        ],
+        "links": server_links(tenant_id, server_id, compute_uri_prefix),
         "metadata": server_info.get('metadata') or {},
         "name": server_info['name'],
         "progress": 100,
@@ -101,10 +112,81 @@ def server_template(tenant_id, server_info, server_id, status, current_time,
     return template
 
 
+class Server(object):
+    """
+    A server in the server cache, holding only what differs from one server
+    to the next; its JSON representation is rendered on demand by
+    :obj:`server_template`, which supplies everything that is the same for
+    every server.
+
+    :ivar str status: the current status of the server.
+    :ivar str vm_state: the status the server was created with.
+    :ivar float created: the time the server was created, in seconds since
+        the epoch.
+    :ivar float updated: the time the server was last updated, in seconds
+        since the epoch.
+    :ivar tuple ip_segments: the random parts of the server's IPv4 addresses.
+    :ivar int version: a version stamp, replaced whenever the server changes;
+        see :obj:`mimic.util.helper.next_version`.
+    """
+
+    __slots__ = ('tenant_id', 'id', 'name', 'status', 'vm_state', 'created',
+                 'updated', 'flavor_ref', 'image_ref', 'metadata',
+                 'ip_segments', 'compute_uri_prefix', 'version')
+
+    def __init__(self, tenant_id, server_info, server_id, status,
+                 current_timestamp, compute_uri_prefix,
+                 ipsegment=lambda: randrange(255)):
+        """
+        Create a server from the ``server`` of a create server request.
+        """
+        self.tenant_id = tenant_id
+        self.id = server_id
+        self.name = server_info['name']
+        self.status = self.vm_state = status
+        self.created = self.updated = current_timestamp
+        self.flavor_ref = server_info['flavorRef']
+        self.image_ref = server_info.get('imageRef')
+        self.metadata = server_info.get('metadata') or {}
+        self.ip_segments = (ipsegment(), ipsegment(), ipsegment())
+        self.compute_uri_prefix = compute_uri_prefix
+        self.version = next_version()
+
+    def json(self):
+        """
+        Get the JSON-serializable data structure of the 'server' key of GET
+        responses for this server.
+        """
+        ip_segments = iter(self.ip_segments)
+        template = server_template(
+            self.tenant_id,
+            {'name': self.name, 'flavorRef': self.flavor_ref,
+             'imageRef': self.image_ref, 'metadata': self.metadata},
+            self.id, self.vm_state, seconds_to_timestamp(self.created),
+            ipsegment=lambda: next(ip_segments),
+            compute_uri_prefix=self.compute_uri_prefix)
+        template['status'] = self.status
+        template['updated'] = seconds_to_timestamp(self.updated)
+        return template
+
+    def brief_json(self):
+        """
+        Get the JSON-serializable data structure describing this server in a
+        list of servers without details.
+        """
+        return {'name': self.name,
+                'links': server_links(self.tenant_id, self.id,
+                                      self.compute_uri_prefix),
+                'id': self.id}
+
+
 def create_server(tenant_id, server_info, server_id, compute_uri_prefix,
-                  s_cache, current_time):
+                  s_cache, current_timestamp):
     """
     Canned response for create server and adds the server to the server cache.
+
+    :param float current_timestamp: The current time, in seconds from the POSIX
+        epoch.
     """
     status = "ACTIVE"
     if 'metadata' in server_info:
@@ -121,17 +203,19 @@ def create_server(tenant_id, server_info, server_id, compute_uri_prefix,
         if 'server_error' in server_info['metadata']:
             status = "ERROR"
 
-    s_cache[server_id] = server_template(
-        tenant_id, server_info, server_id, status,
-        compute_uri_prefix=compute_uri_prefix,
-        current_time=current_time
-    )
+    server = Server(tenant_id, server_info, server_id, status,
+                    current_timestamp, compute_uri_prefix)
+    s_cache[server_id] = server
+    if 'server_building' in server.metadata:
+        s_cache.set_status_later(
+            server_id, "ACTIVE", int(server.metadata['server_building']))
     return (
         {
             'server': {
-                "OS-DCF:diskConfig": s_cache[server_id]['OS-DCF:diskConfig'],
-                "id": s_cache[server_id]['id'],
-                "links": s_cache[server_id]['links'],
+                "OS-DCF:diskConfig": "AUTO",
+                "id": server.id,
+                "links": server_links(tenant_id, server_id,
+                                      compute_uri_prefix),
                 "adminPass": "testpassword"
             }
         },
@@ -139,40 +223,52 @@ def create_server(tenant_id, server_info, server_id, compute_uri_prefix,
     )
 
 
-def get_server(server_id, s_cache, current_timestamp):
+def get_server(server_id, s_cache):
     """
     Verify if the given server_id exists in the server cache.  If true, return
     server data else return None
     """
     if server_id in s_cache:
-        set_server_state(server_id, s_cache, current_timestamp)
-        return {'server': s_cache[server_id]}, 200
+        return {'server': s_cache[server_id].json()}, 200
     else:
         return not_found_response(), 404
 
 
 def list_server(tenant_id, s_cache, name=None,
-                details=True, current_timestamp=None):
+                details=True, limit=None, marker=None, changes_since=None):
     """
-    Return a list of all servers in the server cache with the given tenant_id
+    Return a list of all servers in the server cache, which holds only the
+    servers of the given tenant, in the order they were last updated.
+
+    :param str limit: the maximum number of servers to list.
+    :param str marker: the ID of the last server of the previous page; only
+        servers after it are listed.
+    :param str changes_since: an ISO8601 timestamp; only servers updated at
+        or after it are listed.
     """
-    response = dict(
-        (k, v) for (k, v) in s_cache.items()
-        if tenant_id == v['tenant_id']
-    )
-    for each in response:
-        set_server_state(each, s_cache, current_timestamp)
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            return invalid_resource("limit param must be an integer"), 400
+        if limit < 0:
+            return invalid_resource("limit param must be positive"), 400
+    if marker is not None and marker not in s_cache:
+        return invalid_resource("marker [{0}] not found".format(marker)), 400
+    if changes_since is not None:
+        try:
+            changes_since = timestamp_to_seconds(changes_since)
+        except ValueError:
+            return invalid_resource("Invalid changes-since value"), 400
+    server_ids = None
     if name:
-        response = dict(
-            (k, v) for (k, v) in response.items() if name in v['name']
-        )
+        server_ids = s_cache.ids_named(name)
+    servers = s_cache.servers(server_ids, marker=marker, limit=limit,
+                              updated_since=changes_since)
     if details:
-        return {'servers': [values for values in response.values()]}, 200
+        return {'servers': [server.json() for server in servers]}, 200
     else:
-        return ({'servers': [{'name': values['name'],
-                              'links':values['links'],
-                              'id':values['id']}
-                             for values in response.values()]},
+        return ({'servers': [server.brief_json() for server in servers]},
                 200)
 
 
@@ -181,15 +277,16 @@ def delete_server(server_id, s_cache):
     Returns True if the server was deleted from the cache, else returns false.
     """
     if server_id in s_cache:
-        if 'delete_server_failure' in s_cache[server_id]['metadata']:
+        if 'delete_server_failure' in s_cache[server_id].metadata:
             del_meta = json.loads(
-                s_cache[server_id]['metadata']['delete_server_failure']
+                s_cache[server_id].metadata['delete_server_failure']
             )
             if del_meta['times'] != 0:
                 del_meta['times'] = del_meta['times'] - 1
-                s_cache[server_id]['metadata']['delete_server_failure'] = (
+                s_cache[server_id].metadata['delete_server_failure'] = (
                     json.dumps(del_meta)
                 )
+                s_cache.touch(server_id)
                 return (invalid_resource('server error', del_meta['code']),
                         del_meta['code'])
         del s_cache[server_id]
@@ -203,7 +300,7 @@ def list_addresses(server_id, s_cache):
     Returns the public and private ip address for the given server
     """
     if server_id in s_cache:
-        return {'addresses': s_cache[server_id]['addresses']}, 200
+        return {'addresses': s_cache[server_id].json()['addresses']}, 200
     else:
         return not_found_response(), 404
 
@@ -257,23 +354,3 @@ def get_limit(s_cache):
                           "maxTotalFloatingIps": -1,
                           "maxTotalInstances": 200,
                           "maxTotalRAMSize": 256000}}}
-
-
-def set_server_state(server_id, s_cache, current_timestamp):
-    """
-    If the server status is not active, sets the state of the server based on
-    the server metadata.
-
-    :param str server_id: the ID of a server, a key present in
-        :pyobj:`s_cache`.
-    """
-    if s_cache[server_id]['status'] != "ACTIVE":
-        if 'server_building' in s_cache[server_id]['metadata']:
-            updated_timestring = s_cache[server_id]['updated']
-            status = set_resource_status(
-                updated_timestring,
-                int(s_cache[server_id]['metadata']['server_building']),
-                current_timestamp=current_timestamp
-            )
-            s_cache[server_id]['status'] = (status or
-                                            s_cache[server_id]['status'])
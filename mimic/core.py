@@ -7,14 +7,29 @@ Service catalog hub and integration for Mimic application objects.
 from __future__ import unicode_literals
 
 import binascii
+import hashlib
+import json
 import os
 
 from twisted.python.urlpath import URLPath
 from twisted.plugin import getPlugins
 from mimic import plugins
 
-from mimic.imimic import IAPIMock
+from mimic.canned_responses.auth import service_catalog
+from mimic.imimic import IAPIMock, IPersistentAPIMock
 from mimic.session import SessionStore
+from mimic.util.helper import BoundedCache
+
+
+#: The default number of region resources a :obj:`MimicCore` keeps around.
+DEFAULT_RESOURCE_CACHE_SIZE = 1024
+
+#: The number of URI prefixes a :obj:`MimicCore` remembers.
+URI_PREFIX_CACHE_SIZE = 4096
+
+#: The number of tenant service catalogs (and their serializations) a
+#: :obj:`MimicCore` remembers.
+CATALOG_CACHE_SIZE = 4096
 
 
 class MimicCore(object):
@@ -23,7 +38,9 @@ class MimicCore(object):
     mocks.
     """
 
-    def __init__(self, clock, apis):
+    def __init__(self, clock, apis,
+                 resource_cache_size=DEFAULT_RESOURCE_CACHE_SIZE,
+                 session_backend=None, service_id_seed=None):
         """
         Create a MimicCore with an IReactorTime to do any time-based scheduling
         against.
@@ -34,27 +51,62 @@ class MimicCore(object):
 
         :param apis: an iterable of all :obj:`IAPIMock`s that this MimicCore
             will expose.
+
+        :param int resource_cache_size: the maximum number of region resources
+            (as returned by :obj:`IAPIMock.resource_for_region`) to keep for
+            reuse across requests.
         """
         self._uuid_to_api = {}
-        self.sessions = SessionStore(clock)
+        self._persistent_apis = {}
+        self._region_resources = BoundedCache(resource_cache_size)
+        self._uri_prefixes = BoundedCache(URI_PREFIX_CACHE_SIZE)
+        self._tenant_catalogs = BoundedCache(CATALOG_CACHE_SIZE)
+        self.sessions = SessionStore(clock, session_backend)
 
+        name_counts = {}
         for api in apis:
-            this_api_id = ((api.__class__.__name__) + '-' +
-                           str(binascii.hexlify(os.urandom(3))))
+            name = api.__class__.__name__
+            name_counts[name] = name_counts.get(name, 0) + 1
+            if IPersistentAPIMock.providedBy(api):
+                self._persistent_apis[
+                    "{0}:{1}".format(name, name_counts[name])] = api
+            if service_id_seed is None:
+                suffix = os.urandom(3)
+            else:
+                suffix = hashlib.sha1("{0}:{1}:{2}".format(
+                    service_id_seed, name, name_counts[name]
+                ).encode("utf-8")).digest()[:3]
+            this_api_id = name + '-' + str(binascii.hexlify(suffix))
             self._uuid_to_api[this_api_id] = api
 
+    def persistent_apis(self):
+        """
+        Get the :obj:`IPersistentAPIMock` providers among this core's APIs,
+        each keyed by its class name and its position among the APIs of its
+        class, which stay the same from one run of Mimic to the next.
+
+        :return: a dict mapping keys to APIs.
+        """
+        return dict(self._persistent_apis)
+
     @classmethod
-    def fromPlugins(cls, clock):
+    def fromPlugins(cls, clock, **kwargs):
         """
         Create a :obj:`MimicCore` from all :obj:`IAPIMock` plugins.
+
+        :param kwargs: any other arguments to :obj:`MimicCore`.
         """
-        return cls(clock, list(getPlugins(IAPIMock, plugins)))
+        return cls(clock, list(getPlugins(IAPIMock, plugins)), **kwargs)
 
     def service_with_region(self, region_name, service_id, base_uri):
         """
         Given the name of a region and a mimic internal service ID, get a
         resource for that service.
 
+        Region resources keep all of their state in :obj:`SessionStore`, so
+        the resource built for a given service, region and base URI is cached
+        and reused by subsequent requests rather than being rebuilt.
+
         :param unicode region_name: the name of the region that the service
             resource exists within.
         :param unicode service_id: the UUID for the service for the
@@ -65,13 +117,17 @@ class MimicCore(object):
         :return: A resource.
         :rtype: :obj:`twisted.web.iweb.IResource`
         """
-        if service_id in self._uuid_to_api:
+        key = (service_id, region_name, base_uri)
+        resource = self._region_resources.get(key)
+        if resource is None and service_id in self._uuid_to_api:
             api = self._uuid_to_api[service_id]
-            return api.resource_for_region(
+            resource = api.resource_for_region(
                 region_name,
                 self.uri_for_service(region_name, service_id, base_uri),
                 self.sessions,
             )
+            self._region_resources.set(key, resource)
+        return resource
 
     def uri_for_service(self, region, service_id, base_uri):
         """
@@ -85,6 +141,10 @@ class MimicCore(object):
         generated for this function point to the top of the endpoint's
         hierarchy, not including any tenant information.
 
+        Since service IDs are unique to each API, a given base URI, service ID
+        and region always yield the same prefix, so prefixes are computed once
+        and remembered.
+
         :param unicode region: the name of the region that the service resource
             exists within.
         :param unicode service_id: the UUID for the service for the specified
@@ -95,6 +155,18 @@ class MimicCore(object):
         :return: The full URI locating the service for that region
         :rtype: ``str``
         """
+        key = (base_uri, service_id, region)
+        uri = self._uri_prefixes.get(key)
+        if uri is None:
+            uri = self._build_uri_for_service(region, service_id, base_uri)
+            self._uri_prefixes.set(key, uri)
+        return uri
+
+    def _build_uri_for_service(self, region, service_id, base_uri):
+        """
+        Compute the URI prefix described by :obj:`MimicCore.uri_for_service`
+        without consulting the cache.
+        """
         if region:
             return str(URLPath.fromString(base_uri)
                     .child("mimicking").child(service_id).child(region).child(""))
@@ -122,3 +194,60 @@ class MimicCore(object):
                         endpoint.region, service_id, base_uri
                     )
                 yield entry
+
+    def catalog_for_tenant(self, tenant_id, base_uri):
+        """
+        Get the service catalog for the given tenant ID, as generated by
+        :pyobj:`MimicCore.entries_for_tenant`.
+
+        The catalog for a given tenant ID and base URI is only generated once,
+        so the endpoints in it (and their IDs) are the same every time.
+
+        :param unicode tenant_id: A fictional tenant ID.
+        :param str base_uri: the base uri to use instead of the default - most
+            likely comes from a request URI
+
+        :return: a 2-tuple of a list of :obj:`mimic.catalog.Entry` and a
+            mapping of each of their endpoints to its URI prefix.
+        """
+        entries, prefix_map, _ = self._tenant_catalog(tenant_id, base_uri)
+        return (entries, prefix_map)
+
+    def service_catalog_json(self, tenant_id, base_uri):
+        """
+        Get the service catalog for the given tenant ID and base URI,
+        serialized as the ``serviceCatalog`` of the response to
+        authentication.
+
+        The serialization is made the first time it is requested, and kept
+        with the catalog returned by :obj:`catalog_for_tenant`, so that the
+        two are always forgotten (and regenerated) together.
+
+        :rtype: ``str``
+        """
+        entries, prefix_map, catalog_json = self._tenant_catalog(tenant_id,
+                                                                 base_uri)
+        if catalog_json is None:
+            catalog_json = json.dumps(service_catalog(
+                tenant_id,
+                entry_generator=lambda tenant_id: entries,
+                prefix_for_endpoint=prefix_map.__getitem__))
+            self._tenant_catalogs.set((tenant_id, base_uri),
+                                      (entries, prefix_map, catalog_json))
+        return catalog_json
+
+    def _tenant_catalog(self, tenant_id, base_uri):
+        """
+        Get the cached ``(entries, prefix_map, catalog_json)`` for the given
+        tenant ID and base URI, generating the entries if they are not
+        cached; ``catalog_json`` is ``None`` until it has been serialized.
+        """
+        key = (tenant_id, base_uri)
+        catalog = self._tenant_catalogs.get(key)
+        if catalog is None:
+            prefix_map = {}
+            entries = list(self.entries_for_tenant(tenant_id, prefix_map,
+                                                   base_uri))
+            catalog = (entries, prefix_map, None)
+            self._tenant_catalogs.set(key, catalog)
+        return catalog
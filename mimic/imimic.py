@@ -18,7 +18,127 @@ class IAPIMock(Interface):
             Mimic.
         """
 
-    def resource(uri_prefix, session_store, region=None):
+    def resource_for_region(region, uri_prefix, session_store):  # pragma:nocover
         """
-        Get a resource.
+        Get an :obj:`twisted.web.iweb.IResource` for the given region.
+
+        :param unicode region: the name of the region, from the endpoints of
+            the catalog entries this API generated.
+        :param str uri_prefix: the URI prefix of the service in that region,
+            as computed by :obj:`mimic.core.MimicCore.uri_for_service`.
+        :param session_store: the :obj:`mimic.session.SessionStore` holding
+            all per-tenant state.
+        """
+
+
+class IPersistentAPIMock(IAPIMock):
+    """
+    An :obj:`IPersistentAPIMock` is an API whose per-tenant data (that is,
+    what it attaches to sessions with
+    :obj:`mimic.session.Session.data_for_api`) can be saved in a snapshot
+    and restored from one; see :obj:`mimic.snapshot`.
+    """
+
+    def dump_data(data, pin_blob):  # pragma:nocover
+        """
+        Get a picklable representation of the given data, which is not
+        affected by any later change to the data.
+
+        :param pin_blob: a callable which takes a blob from a
+            :obj:`mimic.util.storage.BlobStore` that the data refers to,
+            keeps it until the snapshot has been written, and returns its
+            key.
+        """
+
+    def load_data(state, session_store, tenant_id,
+                  blob_for_key):  # pragma:nocover
+        """
+        Re-create data from the representation returned by
+        :obj:`dump_data`.
+
+        :param session_store: the :obj:`mimic.session.SessionStore` the data
+            is restored into.
+        :param unicode tenant_id: the tenant whose data it is.
+        :param blob_for_key: a callable which takes a
+            :obj:`mimic.util.storage.BlobStore` and the key of a blob pinned
+            by :obj:`dump_data`, and returns that blob from that store, with
+            a reference taken for the caller.
+        """
+
+    def apply_change(data, change, session_store, tenant_id,
+                     blob_for_key):  # pragma:nocover
+        """
+        Apply a change which this API recorded with
+        :obj:`mimic.session.SessionStore.record`, replaying it from a
+        :obj:`mimic.snapshot.WriteAheadLog`.  Changes record the new state of
+        what they changed, so applying one twice has the same effect as
+        applying it once.
+
+        :param data: the tenant's data, or ``None`` if it has none yet.
+        :param blob_for_key: as for :obj:`load_data`, for the keys of the
+            blobs recorded with the change.
+
+        :return: the tenant's data.
+        """
+
+
+class ISessionBackend(Interface):
+    """
+    An :obj:`ISessionBackend` stores the :obj:`mimic.session.Session` objects
+    of a :obj:`mimic.session.SessionStore`, indexed by token, tenant ID and
+    username key.
+
+    A username key is either a username or, for impersonation sessions, a
+    2-tuple of ``"impersonation"`` and the impersonated username.  ``now``
+    is always the current time in seconds since the epoch; sessions expiring
+    at or before it must not be returned.
+    """
+
+    def add_session(session, username_key, data_token, now):  # pragma:nocover
+        """
+        Store a newly created session.
+
+        :param unicode data_token: the token of the session whose API data
+            ``session`` shares; its own token if it shares none.
+
+        :return: the session now stored for the token and username key of
+            ``session``; this is ``session`` itself unless a conflicting
+            session was stored concurrently.
+        """
+
+    def session_for_token(token, now):  # pragma:nocover
+        """
+        :return: the :obj:`mimic.session.Session` with the given token, or
+            ``None``.
+        """
+
+    def token_for_tenant_id(tenant_id, now):  # pragma:nocover
+        """
+        :return: the token of the latest session for the given tenant ID, or
+            ``None``.
+        """
+
+    def token_for_username(username_key, now):  # pragma:nocover
+        """
+        :return: the token of the session for the given username key, or
+            ``None``.
+        """
+
+    def expire_sessions(now):  # pragma:nocover
+        """
+        Evict expired sessions.
+
+        :return: the number of sessions evicted.
+        """
+
+    def live_sessions(now):  # pragma:nocover
+        """
+        :return: the number of sessions which have not expired.
+        """
+
+    def sessions(now):  # pragma:nocover
+        """
+        :return: a list of 3-tuples of each session which has not expired,
+            its username key and the token of the session whose API data it
+            shares, in the order the sessions were stored.
         """
@@ -9,7 +9,7 @@ from twisted.web.resource import NoResource
 from mimic.canned_responses.mimic_presets import get_presets
 from mimic.rest.mimicapp import MimicApp
 from mimic.rest.auth_api import AuthApi, base_uri_from_request
-from mimic.util.helper import seconds_to_timestamp
+from mimic.util.helper import invalid_resource, seconds_to_timestamp
 
 
 class MimicRoot(object):
@@ -19,15 +19,19 @@ class MimicRoot(object):
 
     app = MimicApp()
 
-    def __init__(self, core, clock=None):
+    def __init__(self, core, clock=None, snapshots=None):
         """
         :param mimic.core.MimicCore core: The core object to dispatch routes
             from.
         :param twisted.internet.task.Clock clock: The clock to advance from the
             ``/mimic/v1.1/tick`` API.
+        :param mimic.snapshot.SnapshotService snapshots: The service to save
+            snapshots with from the ``/mimic/v1.1/snapshot`` API, if any.
         """
         self.core = core
         self.clock = clock
+        self.snapshots = snapshots
+        self._auth_resource = AuthApi(core).app.resource()
 
     @app.route("/", methods=["GET"])
     def help(self, request):
@@ -43,7 +47,7 @@ class MimicRoot(object):
         """
         Get the identity ...
         """
-        return AuthApi(self.core).app.resource()
+        return self._auth_resource
 
     @app.route('/mimic/v1.0/presets', methods=['GET'])
     def get_mimic_presets(self, request):
@@ -61,12 +65,36 @@ class MimicRoot(object):
         body = json.loads(request.content.read())
         amount = body['amount']
         self.clock.advance(amount)
+        self.core.sessions.expire_sessions()
         request.setResponseCode(200)
         return json.dumps({
             "advanced": amount,
             "now": seconds_to_timestamp(self.clock.seconds())
         })
 
+    @app.route("/mimic/v1.1/snapshot", methods=['POST'])
+    def save_snapshot(self, request):
+        """
+        Save a snapshot of all of Mimic's state to its state file, responding
+        once it has been written.  HTTP status code of 400 if Mimic has no
+        state file, 409 if a snapshot is already being written.
+        """
+        if self.snapshots is None:
+            request.setResponseCode(400)
+            return json.dumps(invalid_resource(
+                "Mimic was not started with a state file"))
+        if self.snapshots.saving:
+            request.setResponseCode(409)
+            return json.dumps(invalid_resource(
+                "A snapshot is already being written", 409))
+
+        def written(snapshot):
+            request.setResponseCode(201)
+            return json.dumps({"path": self.snapshots.path,
+                               "sessions": snapshot.sessions,
+                               "blobs": snapshot.blobs})
+        return self.snapshots.save().addCallback(written)
+
     @app.route("/mimicking/<string:service_id>/<string:region_name>",
                branch=True)
     def get_service_resource(self, request, service_id, region_name):
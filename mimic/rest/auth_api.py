@@ -7,7 +7,7 @@ import json
 
 from twisted.web.server import Request
 from twisted.python.urlpath import URLPath
-from mimic.canned_responses.auth import get_token, get_endpoints
+from mimic.canned_responses.auth import get_token_json, get_endpoints
 from mimic.rest.mimicapp import MimicApp
 from mimic.canned_responses.auth import format_timestamp
 from mimic.util.helper import invalid_resource
@@ -60,23 +60,13 @@ class AuthApi(object):
             request.setResponseCode(400)
             return json.dumps(invalid_resource("Invalid JSON request body"))
         request.setResponseCode(200)
-        prefix_map = {
-            # map of entry to URI prefix for that entry
-        }
-
-        def lookup(entry):
-            return prefix_map[entry]
-        return json.dumps(
-            get_token(
-                session.tenant_id,
-                entry_generator=lambda tenant_id:
-                list(self.core.entries_for_tenant(
-                    tenant_id, prefix_map, base_uri_from_request(request))),
-                prefix_for_endpoint=lookup,
-                response_token=session.token,
-                response_user_id=session.user_id,
-                response_user_name=session.username,
-            )
+        return get_token_json(
+            session.tenant_id,
+            self.core.service_catalog_json(session.tenant_id,
+                                           base_uri_from_request(request)),
+            response_token=session.token,
+            response_user_id=session.user_id,
+            response_user_name=session.username,
         )
 
     @app.route('/v1.1/mosso/<string:tenant_id>', methods=['GET'])
@@ -118,13 +108,12 @@ class AuthApi(object):
         """
         # FIXME: TEST
         request.setResponseCode(200)
-        prefix_map = {}
         session = self.core.sessions.session_for_token(token_id)
+        entries, prefix_map = self.core.catalog_for_tenant(
+            session.tenant_id, base_uri_from_request(request))
         return json.dumps(get_endpoints(
             session.tenant_id,
-            entry_generator=lambda tenant_id: list(
-                self.core.entries_for_tenant(tenant_id, prefix_map,
-                                             base_uri_from_request(request))),
+            entry_generator=lambda tenant_id: entries,
             prefix_for_endpoint=prefix_map.get)
         )
 
@@ -6,6 +6,7 @@ from collections import defaultdict
 import json
 from uuid import uuid4
 from six import text_type
+from characteristic import attributes
 from zope.interface import implementer
 from twisted.web.server import Request
 from twisted.plugin import IPlugin
@@ -62,13 +63,24 @@ class DNSApi(object):
                   ])
         ]
 
-    def resource(self, uri_prefix, session_store):
+    def resource_for_region(self, region, uri_prefix, session_store):
         """
         Get an :obj:`twisted.web.iweb.IResource` for the given URI prefix;
         implement :obj:`IAPIMock`.
         """
-        dns = DNS(self, uri_prefix, session_store)
-        return dns.app.resource()
+        return DNSRegion(api_mock=self, uri_prefix=uri_prefix,
+                         session_store=session_store).app.resource()
+
+
+@attributes("api_mock uri_prefix session_store".split())
+class DNSRegion(object):
+    """
+    Klein routes for the DNS API.  None are mocked yet, so every request is
+    not found.
+    """
+
+    app = MimicApp()
+
 '''
 class CloudDNSClient(BaseClient):
     """
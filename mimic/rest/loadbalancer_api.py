@@ -6,25 +6,27 @@ from collections import defaultdict
 import json
 from uuid import uuid4
 from six import text_type
+from six.moves.urllib.parse import urlencode
 from zope.interface import implementer
 from twisted.web.server import Request
 from twisted.plugin import IPlugin
+from twisted.python.urlpath import URLPath
 from mimic.canned_responses.loadbalancer import (
     Region_Tenant_CLBs,
     add_load_balancer, del_load_balancer, list_load_balancers,
     add_node, delete_node, list_nodes, get_load_balancers, get_nodes)
 from mimic.rest.mimicapp import MimicApp
-from mimic.imimic import IAPIMock
+from mimic.imimic import IAPIMock, IPersistentAPIMock
 from mimic.catalog import Entry
 from mimic.catalog import Endpoint
 from random import randrange
-from mimic.util.helper import invalid_resource
+from mimic.util.helper import invalid_resource, ResponseCache
 
 
 Request.defaultContentType = 'application/json'
 
 
-@implementer(IAPIMock, IPlugin)
+@implementer(IAPIMock, IPersistentAPIMock, IPlugin)
 class LoadBalancerApi(object):
     """
     Rest endpoints for mocked Load balancer api.
@@ -50,7 +52,7 @@ class LoadBalancerApi(object):
                   ])
         ]
 
-    def resource(self, uri_prefix, session_store, region=None):
+    def resource_for_region(self, region, uri_prefix, session_store):
         """
         Get an :obj:`twisted.web.iweb.IResource` for the given URI prefix;
         implement :obj:`IAPIMock`.
@@ -59,6 +61,48 @@ class LoadBalancerApi(object):
                                        region)
         return lb_region.app.resource()
 
+    def dump_data(self, data, pin_blob):
+        """
+        Get a picklable representation of the load balancer store of each
+        region; implement :obj:`IPersistentAPIMock`.
+        """
+        return dict((region, store.dump()) for (region, store) in data.items())
+
+    def load_data(self, state, session_store, tenant_id, blob_for_key):
+        """
+        Re-create the load balancer stores of a tenant; implement
+        :obj:`IPersistentAPIMock`.
+        """
+        clock = session_store.clock
+        data = defaultdict(lambda: Region_Tenant_CLBs(clock))
+        for region, store in state.items():
+            data[region] = Region_Tenant_CLBs.load(store, clock)
+        return data
+
+    def apply_change(self, data, change, session_store, tenant_id,
+                     blob_for_key):
+        """
+        Replace or remove a load balancer, as recorded by
+        :obj:`LoadBalancerRegion`; implement :obj:`IPersistentAPIMock`.
+        """
+        if data is None:
+            data = self.load_data({}, session_store, tenant_id, blob_for_key)
+        region, lb_id, entry = change
+        data[region].apply(lb_id, entry)
+        return data
+
+
+def _version_key(kind, store, lb_id):
+    """
+    Get a key for a :obj:`ResponseCache` identifying the current version of
+    the given kind of response about the given load balancer, or ``None`` if
+    there is no such load balancer.
+    """
+    version = store.versions.get(lb_id)
+    if version is None:
+        return None
+    return (kind, version)
+
 
 class LoadBalancerRegion(object):
     """
@@ -72,6 +116,7 @@ class LoadBalancerRegion(object):
         Fetches the load balancer id for a failure, invalid scenarios and
         the count on the number of time 422 should be returned on add node.
         """
+        self._responses = ResponseCache()
         self.uri_prefix = uri_prefix
         self.region_name = region_name
         self._api_mock = api_mock
@@ -84,9 +129,20 @@ class LoadBalancerRegion(object):
         """
         return (self._session_store.session_for_tenant_id(tenant_id)
                 .data_for_api(self._api_mock,
-                              lambda: defaultdict(Region_Tenant_CLBs))
+                              lambda: defaultdict(
+                                  lambda: Region_Tenant_CLBs(
+                                      self._session_store.clock)))
                 [self.region_name])
 
+    def _record(self, tenant_id, lb_id):
+        """
+        Record the current state of a load balancer, after a request which
+        may have changed it.
+        """
+        self._session_store.record(
+            self._api_mock, tenant_id,
+            (self.region_name, lb_id, self.session(tenant_id).entry(lb_id)))
+
     @app.route('/v2/<string:tenant_id>/loadbalancers', methods=['POST'])
     def add_load_balancer(self, request, tenant_id):
         """
@@ -103,6 +159,7 @@ class LoadBalancerRegion(object):
         response_data = add_load_balancer(tenant_id, self.session(tenant_id),
                                           content['loadBalancer'], lb_id,
                                           self._session_store.clock.seconds())
+        self._record(tenant_id, lb_id)
         request.setResponseCode(response_data[1])
         return json.dumps(response_data[0])
 
@@ -111,24 +168,41 @@ class LoadBalancerRegion(object):
         """
         Returns a list of all load balancers created using mimic with response code 200
         """
-        response_data = get_load_balancers(
-            self.session(tenant_id), lb_id,
-            self._session_store.clock.seconds()
-        )
-        request.setResponseCode(response_data[1])
-        return json.dumps(response_data[0])
+        store = self.session(tenant_id)
+        return self._responses.respond(
+            request, _version_key("lb", store, lb_id),
+            lambda: get_load_balancers(store, lb_id))
 
     @app.route('/v2/<string:tenant_id>/loadbalancers', methods=['GET'])
     def list_load_balancers(self, request, tenant_id):
         """
-        Returns a list of all load balancers created using mimic with response code 200
+        Returns a list of all load balancers created using mimic with response code 200,
+        one page at a time if a ``limit`` is given, in which case a full page
+        links to the next one.
         """
-        response_data = list_load_balancers(
-            tenant_id, self.session(tenant_id),
-            self._session_store.clock.seconds()
-        )
-        request.setResponseCode(response_data[1])
-        return json.dumps(response_data[0])
+        store = self.session(tenant_id)
+        args = dict((key, request.args[key][0])
+                    for key in ('limit', 'marker') if key in request.args)
+
+        def render():
+            response_data = list_load_balancers(
+                tenant_id, store, limit=args.get('limit'),
+                marker=args.get('marker'))
+            lbs = response_data[0].get('loadBalancers')
+            if lbs and 'limit' in args and len(lbs) == int(args['limit']):
+                link_args = dict(args, marker=lbs[-1]['id'])
+                response_data[0]['links'] = [{
+                    "href": "{0}?{1}".format(
+                        URLPath.fromString(self.uri_prefix).child(
+                            "v2/{0}/loadbalancers".format(tenant_id)),
+                        urlencode(sorted(link_args.items()))),
+                    "rel": "next"
+                }]
+            return response_data
+
+        return self._responses.respond(
+            request, ("lbs", store.version, tuple(sorted(args.items()))),
+            render)
 
     @app.route('/v2/<string:tenant_id>/loadbalancers/<int:lb_id>', methods=['DELETE'])
     def delete_load_balancer(self, request, tenant_id, lb_id):
@@ -140,6 +214,7 @@ class LoadBalancerRegion(object):
             self.session(tenant_id),
             lb_id, self._session_store.clock.seconds()
         )
+        self._record(tenant_id, lb_id)
         request.setResponseCode(response_data[1])
         return json.dumps(response_data[0])
 
@@ -159,6 +234,7 @@ class LoadBalancerRegion(object):
             self.session(tenant_id), node_list, lb_id,
             self._session_store.clock.seconds()
         )
+        self._record(tenant_id, lb_id)
         request.setResponseCode(response_data[1])
         return json.dumps(response_data[0])
 
@@ -168,10 +244,7 @@ class LoadBalancerRegion(object):
         """
         Returns a 200 response code and list of nodes on the load balancer
         """
-        response_data = get_nodes(
-            self.session(tenant_id), lb_id, node_id,
-            self._session_store.clock.seconds()
-        )
+        response_data = get_nodes(self.session(tenant_id), lb_id, node_id)
         request.setResponseCode(response_data[1])
         return json.dumps(response_data[0])
 
@@ -185,6 +258,7 @@ class LoadBalancerRegion(object):
             self.session(tenant_id), lb_id, node_id,
             self._session_store.clock.seconds()
         )
+        self._record(tenant_id, lb_id)
         request.setResponseCode(response_data[1])
         return json.dumps(response_data[0])
 
@@ -194,7 +268,7 @@ class LoadBalancerRegion(object):
         """
         Returns a 200 response code and list of nodes on the load balancer
         """
-        response_data = list_nodes(self.session(tenant_id), lb_id,
-                                   self._session_store.clock.seconds())
-        request.setResponseCode(response_data[1])
-        return json.dumps(response_data[0])
+        store = self.session(tenant_id)
+        return self._responses.respond(
+            request, _version_key("nodes", store, lb_id),
+            lambda: list_nodes(store, lb_id))
@@ -4,14 +4,21 @@ Contains the base Klein app for Mimic.
 
 from klein import Klein
 
+from mimic.util.logger import timed_route
+
 
 class MimicApp(Klein):
     """
     Base app that extends Klein to override route.
     """
-    def route(self, *args, **kwargs):
+    def route(self, url, *args, **kwargs):
         """
-        Default strict_slashes to False
+        Default strict_slashes to False, and log the latency of a sample of
+        the requests to the route.
         """
         kwargs['strict_slashes'] = False
-        return super(MimicApp, self).route(*args, **kwargs)
+        register = super(MimicApp, self).route(url, *args, **kwargs)
+
+        def deco(f):
+            return register(timed_route(url, f))
+        return deco
@@ -6,12 +6,15 @@ Defines create, delete, get, list servers and get images and flavors.
 from uuid import uuid4
 import json
 import collections
+from bisect import bisect_left, bisect_right
 from random import randrange
 
 from six import text_type
+from six.moves.urllib.parse import urlencode
 
 from zope.interface import implementer
 
+from twisted.python.urlpath import URLPath
 from twisted.web.server import Request
 
 from twisted.plugin import IPlugin
@@ -22,13 +25,14 @@ from mimic.canned_responses.nova import (get_server, list_server, get_limit,
 from mimic.rest.mimicapp import MimicApp
 from mimic.catalog import Entry
 from mimic.catalog import Endpoint
-from mimic.imimic import IAPIMock
-from mimic.util.helper import seconds_to_timestamp, invalid_resource
+from mimic.imimic import IAPIMock, IPersistentAPIMock
+from mimic.util.helper import (invalid_resource, next_version,
+                               ResponseCache, SubstringIndex)
 
 Request.defaultContentType = 'application/json'
 
 
-@implementer(IAPIMock, IPlugin)
+@implementer(IAPIMock, IPersistentAPIMock, IPlugin)
 class NovaApi(object):
     """
     Rest endpoints for mocked Nova Api.
@@ -55,7 +59,7 @@ class NovaApi(object):
             )
         ]
 
-    def resource(self, uri_prefix, session_store, region=None):
+    def resource_for_region(self, region, uri_prefix, session_store):
         """
         Get an :obj:`twisted.web.iweb.IResource` for the given URI prefix;
         implement :obj:`IAPIMock`.
@@ -63,30 +67,435 @@ class NovaApi(object):
         return (NovaRegion(self, uri_prefix, session_store, region)
                 .app.resource())
 
+    def dump_data(self, data, pin_blob):
+        """
+        Get a picklable representation of the server cache of each region;
+        implement :obj:`IPersistentAPIMock`.
+        """
+        return dict((region, s_cache.dump())
+                    for (region, s_cache) in data.items())
+
+    def load_data(self, state, session_store, tenant_id, blob_for_key):
+        """
+        Re-create the server caches of a tenant; implement
+        :obj:`IPersistentAPIMock`.
+        """
+        clock = session_store.clock
+        data = collections.defaultdict(lambda: S_Cache(clock))
+        for region, s_cache in state.items():
+            data[region] = S_Cache.load(s_cache, clock)
+        return data
+
+    def apply_change(self, data, change, session_store, tenant_id,
+                     blob_for_key):
+        """
+        Replace or remove a server, as recorded by :obj:`NovaRegion`;
+        implement :obj:`IPersistentAPIMock`.
+        """
+        if data is None:
+            data = self.load_data({}, session_store, tenant_id, blob_for_key)
+        region, server_id, entry = change
+        data[region].apply(server_id, entry)
+        return data
+
 
-def _list_servers(request, tenant_id, s_cache, details=False, current_timestamp=None):
+def _list_servers(request, tenant_id, s_cache, uri_prefix, responses,
+                  details=False):
     """
-    Return a list of servers, possibly filtered by name, possibly with details
+    Return a list of servers, possibly filtered by name or by the time they
+    were last updated, possibly with details, possibly one page at a time.
+
+    When a ``limit`` is given and the page is full, the response includes a
+    ``next`` link to the following page.
+
+    The response is served from ``responses`` (a
+    :obj:`mimic.util.helper.ResponseCache`) as long as the servers have not
+    changed.
     """
-    server_name = None
-    if 'name' in request.args:
-        server_name = request.args['name'][0]
-    response_data = list_server(tenant_id, s_cache, name=server_name,
-                                details=details,
-                                current_timestamp=current_timestamp)
-    request.setResponseCode(response_data[1])
-    return json.dumps(response_data[0])
+    args = dict((key, request.args[key][0])
+                for key in ('name', 'limit', 'marker', 'changes-since')
+                if key in request.args)
+
+    def render():
+        response_data = list_server(tenant_id, s_cache, name=args.get('name'),
+                                    details=details,
+                                    limit=args.get('limit'),
+                                    marker=args.get('marker'),
+                                    changes_since=args.get('changes-since'))
+        body = response_data[0]
+        servers = body.get('servers')
+        if servers and 'limit' in args and len(servers) == int(args['limit']):
+            link_args = dict(args, marker=servers[-1]['id'])
+            path = "v2/{0}/servers".format(tenant_id)
+            if details:
+                path += "/detail"
+            body['servers_links'] = [{
+                "href": "{0}?{1}".format(
+                    URLPath.fromString(uri_prefix).child(path),
+                    urlencode(sorted(link_args.items()))),
+                "rel": "next"
+            }]
+        return response_data
+
+    return responses.respond(
+        request, ("servers", s_cache.version, details,
+                  tuple(sorted(args.items()))),
+        render)
 
 
 class S_Cache(dict):
     """
-    Sketch: A replacement for s_cache-as-dictionary,
-    s_cache-as-object-with-methods-and-attributes.  It's still a dictionary so
+    A server cache: a mapping of server ID to
+    :obj:`mimic.canned_responses.nova.Server`.  It's still a dictionary so
     that we can continue to treat it as one in the slightly crufty
-    canned_responses module that expects dumb data structures rather than a
-    structured object.
+    canned_responses module, but it also
+    indexes the servers by name and by status, and iterates over server IDs
+    in the order the servers were last updated (that is, created or
+    replaced), which, as long as the clock does not run backwards, is also
+    the order of their ``updated`` timestamps.
+
+    Every way of adding or removing servers that :obj:`dict` offers goes
+    through item assignment and ``del``, and the views of the cache follow
+    the order of its servers; their status must be changed with
+    :obj:`set_status` or :obj:`set_status_later`, so that the indexes stay up
+    to date.
     """
 
+    def __init__(self, clock):
+        """
+        Create an empty server cache.
+
+        :param clock: the :obj:`twisted.internet.interfaces.IReactorTime`
+            on which to schedule changes of status.
+        """
+        dict.__init__(self)
+        self.version = next_version()
+        self._clock = clock
+        self._pending = {}
+        self._names = SubstringIndex()
+        self._statuses = collections.defaultdict(set)
+        self._order = []
+        self._updated = []
+        self._positions = {}
+        self._holes = 0
+
+    def __setitem__(self, server_id, server):
+        """
+        Add or replace a server.  It normally goes at the end of the update
+        order, but a server updated before the last one in the cache (as
+        when a change the cache already holds is replayed over it) is put
+        in its place among the others instead, so that the ``updated``
+        times stay sorted.
+        """
+        if server_id in self:
+            del self[server_id]
+        dict.__setitem__(self, server_id, server)
+        self._names.add(server.name, server_id)
+        self._statuses[server.status].add(server_id)
+        if self._updated and server.updated < self._updated[-1]:
+            position = bisect_right(self._updated, server.updated)
+            self._order.insert(position, server_id)
+            self._updated.insert(position, server.updated)
+            for later in self._order[position + 1:]:
+                if later is not None:
+                    self._positions[later] += 1
+        else:
+            position = len(self._order)
+            self._order.append(server_id)
+            self._updated.append(server.updated)
+        self._positions[server_id] = position
+        self.version = next_version()
+
+    def __delitem__(self, server_id):
+        """
+        Remove a server.
+        """
+        server = self[server_id]
+        dict.__delitem__(self, server_id)
+        pending = self._pending.pop(server_id, None)
+        if pending is not None:
+            pending.cancel()
+        self.version = next_version()
+        self._names.remove(server.name, server_id)
+        self._statuses[server.status].discard(server_id)
+        self._order[self._positions.pop(server_id)] = None
+        self._holes += 1
+        self._compact()
+
+    def _compact(self):
+        """
+        Drop the holes left in the update order by servers which have been
+        removed or moved, once they make up half of it.
+        """
+        if self._holes * 2 > len(self._order):
+            kept = [position for (position, each) in enumerate(self._order)
+                    if each is not None]
+            self._order = [self._order[position] for position in kept]
+            self._updated = [self._updated[position] for position in kept]
+            self._positions = dict((each, position) for (position, each)
+                                   in enumerate(self._order))
+            self._holes = 0
+
+    def __iter__(self):
+        """
+        Iterate over the server IDs in the order the servers were updated.
+        """
+        return (each for each in self._order if each is not None)
+
+    def iterkeys(self):
+        """
+        Iterate over the server IDs in the order the servers were updated.
+        """
+        return iter(self)
+
+    def itervalues(self):
+        """
+        Iterate over the servers in the order they were updated.
+        """
+        return (self[server_id] for server_id in self)
+
+    def iteritems(self):
+        """
+        Iterate over ``(server_id, server)`` pairs in the order the servers
+        were updated.
+        """
+        return ((server_id, self[server_id]) for server_id in self)
+
+    def keys(self):
+        """
+        Get the server IDs in the order the servers were updated.
+        """
+        return list(self.iterkeys())
+
+    def values(self):
+        """
+        Get the servers in the order they were updated.
+        """
+        return list(self.itervalues())
+
+    def items(self):
+        """
+        Get ``(server_id, server)`` pairs in the order the servers were
+        updated.
+        """
+        return list(self.iteritems())
+
+    def update(self, *others, **servers):
+        """
+        Add or replace the servers in the given mappings or sequences of
+        pairs, and keyword arguments, in order.
+        """
+        for other in others + (servers,):
+            pairs = other.items() if hasattr(other, "keys") else other
+            for server_id, server in pairs:
+                self[server_id] = server
+
+    def setdefault(self, server_id, server=None):
+        """
+        Get the server with the given ID, first adding the given server with
+        that ID if there is none.
+        """
+        if server_id not in self:
+            self[server_id] = server
+        return self[server_id]
+
+    def pop(self, server_id, *default):
+        """
+        Remove the server with the given ID and return it, or return
+        ``default`` if there is no such server and it is given.
+        """
+        if server_id not in self:
+            if default:
+                return default[0]
+            raise KeyError(server_id)
+        server = self[server_id]
+        del self[server_id]
+        return server
+
+    def popitem(self):
+        """
+        Remove the most recently updated server, returning ``(server_id,
+        server)``.
+        """
+        for server_id in reversed(self._order):
+            if server_id is not None:
+                return server_id, self.pop(server_id)
+        raise KeyError("popitem(): server cache is empty")
+
+    def clear(self):
+        """
+        Remove every server.
+        """
+        for server_id in list(self):
+            del self[server_id]
+
+    def set_status(self, server_id, status):
+        """
+        Change the status of a server, which counts as updating it: its
+        ``updated`` time becomes the current time, and it moves to the end
+        of the update order, so that listings of the servers changed since
+        some time include it.
+        """
+        server = self[server_id]
+        self._statuses[server.status].discard(server_id)
+        server.status = status
+        self._statuses[status].add(server_id)
+        server.updated = self._clock.seconds()
+        self._order[self._positions[server_id]] = None
+        self._holes += 1
+        self._positions[server_id] = len(self._order)
+        self._order.append(server_id)
+        self._updated.append(server.updated)
+        self._compact()
+        self.touch(server_id)
+
+    def touch(self, server_id):
+        """
+        Record that a server has changed, giving it, and the cache as a whole,
+        a new version stamp.
+        """
+        self[server_id].version = self.version = next_version()
+
+    def set_status_later(self, server_id, status, delay):
+        """
+        Change the status of a server once ``delay`` seconds have passed,
+        unless it is removed first.
+        """
+        if delay <= 0:
+            self.set_status(server_id, status)
+            return
+        previous = self._pending.pop(server_id, None)
+        if previous is not None:
+            previous.cancel()
+        self._pending[server_id] = self._clock.callLater(
+            delay, self._change_status, server_id, status)
+
+    def _change_status(self, server_id, status):
+        """
+        Make a change of status scheduled by :obj:`set_status_later`.
+        """
+        del self._pending[server_id]
+        self.set_status(server_id, status)
+
+    def dump(self):
+        """
+        Get a picklable representation of the servers, in the order they were
+        updated, and of their scheduled changes of status, as ``(status,
+        time)`` pairs by server ID.
+        """
+        return ([self[server_id] for server_id in self],
+                dict((server_id, (call.args[1], call.getTime()))
+                     for (server_id, call) in self._pending.items()))
+
+    def entry(self, server_id):
+        """
+        Get a picklable representation of a server and its scheduled change
+        of status, as ``(server, (status, time))``, ``(server, None)``, or
+        ``None`` if there is no such server.
+        """
+        if server_id not in self:
+            return None
+        call = self._pending.get(server_id)
+        return (self[server_id],
+                None if call is None else (call.args[1], call.getTime()))
+
+    def apply(self, server_id, entry):
+        """
+        Make the server with the given ID match the representation returned
+        by :obj:`entry`: replace it, or remove it if ``entry`` is ``None``.
+        """
+        if entry is None:
+            if server_id in self:
+                del self[server_id]
+            return
+        server, pending = entry
+        self[server_id] = server
+        if pending is not None:
+            status, when = pending
+            self.set_status_later(server_id, status,
+                                  when - self._clock.seconds())
+
+    @classmethod
+    def load(cls, state, clock):
+        """
+        Re-create a server cache from the representation returned by
+        :obj:`dump`, rescheduling the changes of status still to come.
+        """
+        servers, pending = state
+        s_cache = cls(clock)
+        for server in servers:
+            server.version = next_version()
+            s_cache[server.id] = server
+        for server_id, (status, when) in pending.items():
+            s_cache.set_status_later(server_id, status,
+                                     when - clock.seconds())
+        return s_cache
+
+    def servers(self, server_ids=None, marker=None, limit=None,
+                updated_since=None):
+        """
+        Get a list of servers in the order they were updated.
+
+        Without ``server_ids``, this costs time proportional to the number of
+        servers returned, rather than the number of servers in the cache.
+
+        :param server_ids: the IDs of the servers to include, or ``None`` to
+            include every server.
+        :param marker: the ID of a server in the cache; only servers updated
+            after it are included.
+        :param int limit: the maximum number of servers to include.
+        :param float updated_since: include only the servers updated at or
+            after this time, in seconds since the epoch.
+        """
+        start = 0
+        if marker is not None:
+            start = self._positions[marker] + 1
+        if updated_since is not None:
+            start = max(start, bisect_left(self._updated, updated_since))
+        if server_ids is None:
+            page = []
+            position = start
+            while (position < len(self._order) and
+                   (limit is None or len(page) < limit)):
+                server_id = self._order[position]
+                if server_id is not None:
+                    page.append(self[server_id])
+                position += 1
+            return page
+        server_ids = sorted(
+            (server_id for server_id in server_ids
+             if self._positions[server_id] >= start),
+            key=self._positions.__getitem__)
+        return [self[server_id] for server_id in server_ids[:limit]]
+
+    def ids_named(self, fragment):
+        """
+        Get the set of IDs of the servers whose name contains ``fragment``.
+        """
+        return self._names.containing(fragment)
+
+    def ids_with_name_prefix(self, prefix):
+        """
+        Get the set of IDs of the servers whose name starts with ``prefix``.
+        """
+        return self._names.with_prefix(prefix)
+
+    def ids_with_status(self, status):
+        """
+        Get the set of IDs of the servers with the given status.
+        """
+        return set(self._statuses.get(status, ()))
+
+    def ids_without_status(self, status):
+        """
+        Get the set of IDs of the servers with any status but the given one.
+        """
+        result = set()
+        for other, server_ids in self._statuses.items():
+            if other != status:
+                result.update(server_ids)
+        return result
+
 
 class NovaRegion(object):
     """
@@ -94,7 +503,7 @@ class NovaRegion(object):
 
     :ivar dict _tenant_cache: a mapping of tenant_id (bytes) to a "server
         cache" (:obj:`S_Cache`), which itself maps server_id to a
-        JSON-serializable data structure of the 'server' key of GET responses.
+        :obj:`mimic.canned_responses.nova.Server`.
     """
 
     def __init__(self, api_mock, uri_prefix, session_store, name):
@@ -102,6 +511,7 @@ class NovaRegion(object):
         Create a nova region with a given URI prefix (used for generating URIs
         to servers).
         """
+        self._responses = ResponseCache()
         self.uri_prefix = uri_prefix
         self._api_mock = api_mock
         self._session_store = session_store
@@ -114,9 +524,20 @@ class NovaRegion(object):
         """
         return (self._session_store.session_for_tenant_id(tenant_id)
                 .data_for_api(self._api_mock,
-                              lambda: collections.defaultdict(S_Cache))
+                              lambda: collections.defaultdict(
+                                  lambda: S_Cache(self._session_store.clock)))
                 [self._name])
 
+    def _record(self, tenant_id, server_id):
+        """
+        Record the current state of a server, after a request which may have
+        changed it.
+        """
+        self._session_store.record(
+            self._api_mock, tenant_id,
+            (self._name, server_id,
+             self._server_cache_for_tenant(tenant_id).entry(server_id)))
+
     app = MimicApp()
 
     @app.route('/v2/<string:tenant_id>/servers', methods=['POST'])
@@ -135,9 +556,9 @@ class NovaRegion(object):
             tenant_id, content['server'], server_id,
             self.uri_prefix,
             s_cache=self._server_cache_for_tenant(tenant_id),
-            current_time=seconds_to_timestamp(
-                self._session_store.clock.seconds())
+            current_timestamp=self._session_store.clock.seconds()
         )
+        self._record(tenant_id, server_id)
         request.setResponseCode(response_data[1])
         return json.dumps(response_data[0])
 
@@ -146,12 +567,12 @@ class NovaRegion(object):
         """
         Returns a generic get server response, with status 'ACTIVE'
         """
-        response_data = get_server(
-            server_id, self._server_cache_for_tenant(tenant_id),
-            self._session_store.clock.seconds()
-        )
-        request.setResponseCode(response_data[1])
-        return json.dumps(response_data[0])
+        s_cache = self._server_cache_for_tenant(tenant_id)
+        key = None
+        if server_id in s_cache:
+            key = ("server", s_cache[server_id].version)
+        return self._responses.respond(
+            request, key, lambda: get_server(server_id, s_cache))
 
     @app.route('/v2/<string:tenant_id>/servers', methods=['GET'])
     def list_servers(self, request, tenant_id):
@@ -160,8 +581,9 @@ class NovaRegion(object):
         name.
         """
         return _list_servers(request, tenant_id,
-                             s_cache=self._server_cache_for_tenant(tenant_id),
-                             current_timestamp=self._session_store.clock.seconds())
+                             uri_prefix=self.uri_prefix,
+                             responses=self._responses,
+                             s_cache=self._server_cache_for_tenant(tenant_id))
 
     @app.route('/v2/<string:tenant_id>/servers/detail', methods=['GET'])
     def list_servers_with_details(self, request, tenant_id):
@@ -170,8 +592,9 @@ class NovaRegion(object):
         such as the metadata.
         """
         return _list_servers(request, tenant_id, details=True,
-                             s_cache=self._server_cache_for_tenant(tenant_id),
-                             current_timestamp=self._session_store.clock.seconds())
+                             uri_prefix=self.uri_prefix,
+                             responses=self._responses,
+                             s_cache=self._server_cache_for_tenant(tenant_id))
 
     @app.route('/v2/<string:tenant_id>/servers/<string:server_id>', methods=['DELETE'])
     def delete_server(self, request, tenant_id, server_id):
@@ -181,6 +604,7 @@ class NovaRegion(object):
         response_data = delete_server(
             server_id, s_cache=self._server_cache_for_tenant(tenant_id)
         )
+        self._record(tenant_id, server_id)
         request.setResponseCode(response_data[1])
         return json.dumps(response_data[0])
 
@@ -4,23 +4,50 @@
 API mock for OpenStack Swift / Rackspace Cloud Files.
 """
 
+import tarfile
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from functools import partial
+from hashlib import md5
+from io import BytesIO
+from math import ceil
+from mimetypes import guess_type
 from uuid import uuid4, uuid5, NAMESPACE_URL
-from six import text_type
+from six import binary_type, string_types, text_type, unichr
+from six.moves.urllib.parse import parse_qs, unquote
 
 from characteristic import attributes, Attribute
-from json import dumps
+from json import dumps, loads
 
-from mimic.imimic import IAPIMock
+from mimic.imimic import IAPIMock, IPersistentAPIMock
 from twisted.plugin import IPlugin
-from twisted.web.http import CREATED, ACCEPTED, OK
+from twisted.web.http import (
+    CREATED, ACCEPTED, OK, NO_CONTENT, BAD_REQUEST, NOT_FOUND, NOT_MODIFIED,
+    CONFLICT, PRECONDITION_FAILED, PARTIAL_CONTENT, REQUEST_ENTITY_TOO_LARGE,
+    REQUESTED_RANGE_NOT_SATISFIABLE,
+    datetimeToString, stringToDatetime)
 
 from mimic.catalog import Entry
 from mimic.catalog import Endpoint
 from mimic.rest.mimicapp import MimicApp
+from mimic.util.storage import BlobStore, Concatenation, StreamingBody
 from twisted.web.resource import NoResource
 from zope.interface import implementer
 
 
+#: The most entries a container listing may have.
+CONTAINER_LISTING_LIMIT = 10000
+
+#: The most paths a single bulk delete request may delete.
+MAX_BULK_DELETES = 10000
+
+#: The ``tarfile`` stream modes for each ``extract-archive`` format.
+ARCHIVE_MODES = {"tar": "r|", "tar.gz": "r|gz", "tar.bz2": "r|bz2"}
+
+#: The most segments a static large object manifest may list.
+MAX_MANIFEST_SEGMENTS = 1000
+
+
 def normal_tenant_id_to_crazy_mosso_id(normal_tenant_id):
     """
     Convert the tenant ID used by basically everything else (keystone, nova,
@@ -38,17 +65,21 @@ def normal_tenant_id_to_crazy_mosso_id(normal_tenant_id):
     )
 
 
-@implementer(IAPIMock, IPlugin)
+@implementer(IAPIMock, IPersistentAPIMock, IPlugin)
 class SwiftMock(object):
     """
     API mock for Swift.
     """
 
-    def __init__(self, rackspace_flavor=True):
+    def __init__(self, rackspace_flavor=True, blobs=None):
         """
         Construct a SwiftMock, either using Rackspace's tenant-ID translation
         idiom or not.
+
+        :param blobs: the :obj:`mimic.util.storage.BlobStore` to keep the
+            bodies of objects in; by default, a new one.
         """
+        self.blobs = BlobStore() if blobs is None else blobs
         if rackspace_flavor:
             self.translate_tenant = normal_tenant_id_to_crazy_mosso_id
         else:
@@ -65,7 +96,7 @@ class SwiftMock(object):
             ])
         ]
 
-    def resource_for_region(self, uri_prefix, session_store, region=None):
+    def resource_for_region(self, region, uri_prefix, session_store):
         """
         Return an IResource implementing a public Swift region endpoint.
         """
@@ -74,6 +105,43 @@ class SwiftMock(object):
             uri_prefix=uri_prefix,
             session_store=session_store).app.resource()
 
+    def dump_data(self, data, pin_blob):
+        """
+        Get a picklable representation of the containers of a tenant, pinning
+        the blobs of their objects; implement :obj:`IPersistentAPIMock`.
+        """
+        return data.dump(pin_blob)
+
+    def tenant(self, session_store, tenant_id):
+        """
+        Create the storage of a tenant, which records its changes in the
+        given session store.
+        """
+        return SwiftTenantInRegion(
+            self.blobs, session_store.clock,
+            partial(session_store.record, self, tenant_id))
+
+    def load_data(self, state, session_store, tenant_id, blob_for_key):
+        """
+        Re-create the containers of a tenant, with the bodies of their
+        objects in this mock's blob store; implement
+        :obj:`IPersistentAPIMock`.
+        """
+        tenant = self.tenant(session_store, tenant_id)
+        tenant.load(state, lambda key: blob_for_key(self.blobs, key))
+        return tenant
+
+    def apply_change(self, data, change, session_store, tenant_id,
+                     blob_for_key):
+        """
+        Create or delete a container or an object, as recorded by
+        :obj:`SwiftTenantInRegion`; implement :obj:`IPersistentAPIMock`.
+        """
+        if data is None:
+            data = self.tenant(session_store, tenant_id)
+        data.apply(change, lambda key: blob_for_key(self.blobs, key))
+        return data
+
 
 @attributes("api uri_prefix session_store".split())
 class SwiftRegion(object):
@@ -91,15 +159,304 @@ class SwiftRegion(object):
         """
         return (self.session_store.session_for_tenant_id(tenant_id)
                 .data_for_api(self.api,
-                              lambda:
-                              SwiftTenantInRegion().app.resource()))
+                              lambda: self.api.tenant(self.session_store,
+                                                      tenant_id))
+                .app.resource())
+
+
+def parse_ranges(header, size):
+    """
+    Parse the value of a ``Range`` header, for a body of the given size.
+
+    :return: a list of ``(start, end)`` pairs of offsets into the body, with
+        ``end`` exclusive, for each satisfiable range in the header; or
+        ``None`` if the header is not a valid byte range header, and should
+        be ignored.
+    """
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    ranges = []
+    for spec in specs.split(","):
+        first, dash, last = spec.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if not first:
+                start, end = size - int(last), size
+                if start == size:
+                    continue
+            else:
+                start = int(first)
+                end = size
+                if last:
+                    end = int(last) + 1
+                    if end <= start:
+                        return None
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        ranges.append((max(start, 0), min(end, size)))
+    return ranges
+
+
+def _etag_matches(header, etag):
+    """
+    Whether the value of an ``If-None-Match`` header matches the given ETag.
+    """
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag.strip('"') == etag.strip('"'):
+            return True
+    return False
+
+
+def _not_modified(request, etag, last_modified):
+    """
+    Whether the client making the given request already has the current
+    version of a body, according to its ``If-None-Match`` header or, failing
+    that, its ``If-Modified-Since`` header.
+    """
+    if_none_match = request.getHeader("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.getHeader("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = stringToDatetime(if_modified_since.split(";", 1)[0])
+        except ValueError:
+            return False
+        return last_modified <= since
+    return False
+
+
+def _multipart_chunks(body, ranges, boundary, part_headers):
+    """
+    Iterate over the chunks of a ``multipart/byteranges`` response with the
+    given ranges of the body, where ``part_headers`` are the headers of the
+    part for each range.
+    """
+    for (start, end), headers in zip(ranges, part_headers):
+        yield headers
+        for chunk in body.chunks(start, end):
+            yield chunk
+    yield "\r\n--{0}--\r\n".format(boundary).encode("ascii")
+
+
+def serve_body(request, body, content_type, etag, last_modified):
+    """
+    Respond to a ``GET`` or ``HEAD`` request for a body, honouring any
+    ``If-None-Match`` or ``If-Modified-Since`` header and, for a ``GET``, any
+    ``Range`` header.
+
+    Only the requested ranges of the body are read, a chunk at a time, so
+    serving part of a large body costs no more than the part does.
+
+    :param body: an object with a ``size`` and ``chunks(start, end)``,
+        ``retain`` and ``release`` methods, such as a
+        :obj:`mimic.util.storage.MemoryBlob`; it is retained while it is
+        streamed.
+    :param float last_modified: the time the body was last modified, in
+        seconds since the epoch.
+    :return: something a Klein route can return.
+    """
+    last_modified = int(ceil(last_modified))
+    request.setHeader("etag", etag)
+    request.setHeader("last-modified", datetimeToString(last_modified))
+    request.setHeader("accept-ranges", "bytes")
+    if _not_modified(request, etag, last_modified):
+        request.setResponseCode(NOT_MODIFIED)
+        return b""
+
+    ranges = None
+    range_header = request.getHeader("range")
+    if range_header is not None:
+        ranges = parse_ranges(range_header, body.size)
+    if ranges == []:
+        request.setResponseCode(REQUESTED_RANGE_NOT_SATISFIABLE)
+        request.setHeader("content-range", "bytes */{0}".format(body.size))
+        return b""
+
+    if not ranges:
+        request.setHeader("content-type", content_type)
+        length = body.size
+        chunks = body.chunks()
+    elif len(ranges) == 1:
+        [(start, end)] = ranges
+        request.setResponseCode(PARTIAL_CONTENT)
+        request.setHeader("content-type", content_type)
+        request.setHeader("content-range", "bytes {0}-{1}/{2}".format(
+            start, end - 1, body.size))
+        length = end - start
+        chunks = body.chunks(start, end)
+    else:
+        boundary = uuid4().hex
+        request.setResponseCode(PARTIAL_CONTENT)
+        request.setHeader("content-type",
+                          "multipart/byteranges; boundary=" + boundary)
+        part_headers = [
+            ("\r\n--{0}\r\nContent-Type: {1}\r\n"
+             "Content-Range: bytes {2}-{3}/{4}\r\n\r\n").format(
+                 boundary, content_type, start, end - 1,
+                 body.size).encode("ascii")
+            for (start, end) in ranges]
+        length = (sum(end - start for (start, end) in ranges) +
+                  sum(len(headers) for headers in part_headers) +
+                  len(boundary) + 8)
+        chunks = _multipart_chunks(body, ranges, boundary, part_headers)
+
+    request.setHeader("content-length", str(length))
+    if request.method == b"HEAD":
+        return b""
+    return StreamingBody(chunks, body)
+
+
+def _bulk_response(request, summary, errors):
+    """
+    Render the summary of a bulk operation as Swift does: as JSON if the
+    request accepts it, otherwise as plain text.
+
+    :param list summary: pairs of the names and values of the fields of the
+        summary, in order.
+    :param list errors: pairs of the path and status of each entry which
+        failed.
+    """
+    if "application/json" in (request.getHeader("accept") or ""):
+        request.setHeader("content-type", "application/json")
+        body = dict(summary)
+        body["Errors"] = [list(error) for error in errors]
+        return dumps(body)
+    request.setHeader("content-type", "text/plain")
+    lines = ["{0}: {1}".format(name, value) for (name, value) in summary]
+    lines.append("Errors:")
+    lines.extend("{0}, {1}".format(path, status) for (path, status) in errors)
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _bulk_status(errors, success):
+    """
+    The overall status of a bulk operation with the given errors, or the
+    given status if there were none.
+    """
+    if not errors:
+        return success
+    if any(status.startswith("5") for (path, status) in errors):
+        return "502 Bad Gateway"
+    return "400 Bad Request"
+
+
+def _has_parameter(request, name):
+    """
+    Whether the query string of the request has the given parameter, even
+    with no value (which :obj:`twisted.web.server.Request.args` leaves out).
+    """
+    query = request.uri.partition(b"?")[2]
+    return name in parse_qs(query, keep_blank_values=True)
+
+
+def _text(value):
+    """
+    Decode a query argument, which is UTF-8 bytes, to text, as object names
+    are.
+    """
+    if isinstance(value, binary_type):
+        return value.decode("utf-8")
+    return value
+
+
+def _manifest_etag(blobs):
+    """
+    The ``ETag`` of a large object with the given blobs as its segments: the
+    quoted MD5 digest of their concatenated ETags.
+    """
+    return '"{0}"'.format(
+        md5("".join(blob.etag for blob in blobs).encode("ascii")).hexdigest())
+
+
+def _find(containers, container_name, object_name):
+    """
+    Get the named object from a dict of containers, or ``None`` if there is
+    no such object.
+    """
+    container = containers.get(container_name)
+    if container is None:
+        return None
+    return container.objects.get(object_name)
+
+
+@attributes(["segments"])
+class StaticManifest(object):
+    """
+    The manifest of a static large object, whose segments are fixed when it
+    is uploaded.
+
+    :ivar list segments: the ``(container name, object name, etag)`` of
+        each segment, in order.
+    """
+
+    header = ("x-static-large-object", "True")
+
+    def resolve(self, containers):
+        """
+        Get the blobs of the segments.
+
+        :return: a list of blobs, or ``None`` if any segment has since been
+            deleted or replaced.
+        """
+        blobs = []
+        for (container_name, object_name, etag) in self.segments:
+            segment = _find(containers, container_name, object_name)
+            if segment is None or segment.blob.etag != etag:
+                return None
+            blobs.append(segment.blob)
+        return blobs
+
+
+@attributes(["container_name", "prefix"])
+class DynamicManifest(object):
+    """
+    The manifest of a dynamic large object, whose segments are whichever
+    objects in a container have names starting with a prefix when it is
+    read.
+    """
+
+    @property
+    def header(self):
+        """
+        The ``X-Object-Manifest`` header of the large object.
+        """
+        return ("x-object-manifest",
+                (self.container_name + "/" + self.prefix).encode("utf-8"))
 
+    def resolve(self, containers):
+        """
+        Get the blobs of the segments, in order of name, leaving out any
+        which are themselves manifests.
+        """
+        container = containers.get(self.container_name)
+        if container is None:
+            return []
+        return [segment.blob for segment in
+                container.listing(prefix=self.prefix,
+                                  limit=len(container.names))
+                if segment.manifest is None]
 
-@attributes(["name", "content_type", "data"])
+
+@attributes(["name", "content_type", "blob", "last_modified",
+             Attribute("manifest", default_value=None)])
 class Object(object):
     """
     A Python object (i.e. instance) representing a Swift object (i.e. bag of
-    octets).
+    octets), whose octets are kept in a blob from a
+    :obj:`mimic.util.storage.BlobStore`, and which was last modified at
+    ``last_modified`` seconds since the epoch.
+
+    If the object is a large object, ``manifest`` is its
+    :obj:`StaticManifest` or :obj:`DynamicManifest`, and its blob is just
+    the manifest as uploaded.
     """
 
     def as_json(self):
@@ -110,39 +467,359 @@ class Object(object):
         return {
             "name": self.name,
             "content_type": self.content_type,
-            "bytes": len(self.data),
+            "bytes": self.blob.size,
+            "hash": self.blob.etag,
+            "last_modified": datetime.utcfromtimestamp(
+                self.last_modified).strftime("%Y-%m-%dT%H:%M:%S.%f"),
         }
 
 
-@attributes(["name", Attribute("objects", default_factory=dict)])
+@attributes(["name", Attribute("objects", default_factory=dict),
+             Attribute("names", default_factory=list),
+             Attribute("bytes_used", default_value=0)])
 class Container(object):
     """
     A Swift container (collection of :obj:`Object`.)
+
+    :ivar dict objects: the objects in the container, by name.
+    :ivar list names: the names of the objects, in order.
+    :ivar int bytes_used: the total size of the objects.
     """
 
+    def put(self, obj):
+        """
+        Add an object to the container, replacing any with the same name.
+
+        :return: the object replaced, or ``None``.
+        """
+        previous = self.objects.get(obj.name)
+        if previous is None:
+            insort(self.names, obj.name)
+        else:
+            self.bytes_used -= previous.blob.size
+        self.objects[obj.name] = obj
+        self.bytes_used += obj.blob.size
+        return previous
+
+    def remove(self, name):
+        """
+        Remove the object with the given name from the container.
+
+        :return: the object removed.
+        """
+        obj = self.objects.pop(name)
+        del self.names[bisect_left(self.names, name)]
+        self.bytes_used -= obj.blob.size
+        return obj
+
+    def listing(self, prefix=None, delimiter=None, marker=None,
+                end_marker=None, limit=CONTAINER_LISTING_LIMIT):
+        """
+        List the objects in the container in order of name, as Swift does,
+        in time proportional to the logarithm of the number of objects plus
+        the number listed.
+
+        :param prefix: only list objects whose names start with this.
+        :param delimiter: list objects whose names contain this after the
+            prefix as a single "subdirectory" entry: the name up to and
+            including the delimiter.
+        :param marker: only list objects whose names are greater than this.
+        :param end_marker: only list objects whose names are less than this.
+        :param int limit: the most entries to list.
+
+        :return: a list of :obj:`Object` instances and subdirectory names.
+        """
+        names = self.names
+        start = 0
+        if marker:
+            start = bisect_right(names, marker)
+        if prefix:
+            start = max(start, bisect_left(names, prefix))
+        stop = len(names)
+        if end_marker:
+            stop = bisect_left(names, end_marker)
+        entries = []
+        index = start
+        while index < stop and len(entries) < limit:
+            name = names[index]
+            if prefix and not name.startswith(prefix):
+                break
+            if delimiter:
+                found = name.find(delimiter, len(prefix or ""))
+                if found != -1:
+                    subdir = name[:found + len(delimiter)]
+                    if subdir != marker:
+                        entries.append(subdir)
+                    # Skip every other name in the subdirectory.
+                    index = bisect_left(
+                        names, subdir[:-1] + unichr(ord(subdir[-1]) + 1),
+                        index)
+                    continue
+            entries.append(self.objects[name])
+            index += 1
+        return entries
+
 
 class SwiftTenantInRegion(object):
     """
     A :obj:`SwiftTenantInRegion` represents a single tenant and their
     associated storage resources within one region.
+
+    Every container and object created or deleted is passed to ``record``
+    as a change, which :obj:`apply` can make again: ``("container", name,
+    exists)`` or ``("object", container_name, name, entry)``, where
+    ``entry`` is ``None`` for a deleted object.
     """
 
     app = MimicApp()
 
-    def __init__(self):
+    def __init__(self, blobs, clock, record=lambda change, blobs=(): None):
         """
         Initialize a tenant with some containers.
+
+        :param blobs: the :obj:`mimic.util.storage.BlobStore` to keep the
+            bodies of objects in.
+        :param clock: the :obj:`IReactorTime` provider giving the times at
+            which objects are modified.
+        :param record: a callable which records a change and the blobs it
+            refers to; see :obj:`mimic.session.SessionStore.record`.
         """
         self.containers = {}
+        self.blobs = blobs
+        self.clock = clock
+        self.record = record
+
+    def dump(self, pin_blob):
+        """
+        Get a picklable representation of the containers, as
+        ``(name, objects)`` pairs, where each object is represented by its
+        name, content type, blob key, last modified time and manifest.
+
+        :param pin_blob: a callable which keeps a blob until the
+            representation has been saved, and returns its key.
+        """
+        return [(container.name,
+                 [(obj.name, obj.content_type, pin_blob(obj.blob),
+                   obj.last_modified, obj.manifest)
+                  for obj in (container.objects[name]
+                              for name in container.names)])
+                for container in self.containers.values()]
+
+    def load(self, state, blob_for_key):
+        """
+        Re-create the containers from the representation returned by
+        :obj:`dump`.
+
+        :param blob_for_key: a callable which takes a blob key and returns
+            the blob, with a reference taken.
+        """
+        for container_name, objects in state:
+            container = self.containers[container_name] = Container(
+                name=container_name)
+            for name, content_type, key, last_modified, manifest in objects:
+                container.put(Object(
+                    name=name, content_type=content_type,
+                    blob=blob_for_key(key), last_modified=last_modified,
+                    manifest=manifest))
+
+    def apply(self, change, blob_for_key):
+        """
+        Make a change passed to ``record`` again.  Objects are put into (and
+        replace any in) their container, which is created if need be.
+
+        :param blob_for_key: as for :obj:`load`.
+        """
+        if change[0] == "container":
+            _, container_name, exists = change
+            if exists:
+                self.containers.setdefault(container_name,
+                                           Container(name=container_name))
+            else:
+                container = self.containers.pop(container_name, None)
+                for obj in (container.objects.values() if container else ()):
+                    obj.blob.release()
+            return
+        _, container_name, name, entry = change
+        container = self.containers.setdefault(container_name,
+                                               Container(name=container_name))
+        if entry is None:
+            if name in container.objects:
+                container.remove(name).blob.release()
+            return
+        content_type, key, last_modified, manifest = entry
+        previous = container.put(Object(
+            name=name, content_type=content_type, blob=blob_for_key(key),
+            last_modified=last_modified, manifest=manifest))
+        if previous is not None:
+            previous.blob.release()
+
+    def _create_container(self, name):
+        """
+        Create an empty container, and record that it was created.
+        """
+        container = self.containers[name] = Container(name=name)
+        self.record(("container", name, True))
+        return container
+
+    def _delete_container(self, name):
+        """
+        Delete an empty container, and record that it was deleted.
+        """
+        del self.containers[name]
+        self.record(("container", name, False))
+
+    def _put(self, container, name, blob, content_type, manifest=None):
+        """
+        Put an object with the given blob as its contents in a container,
+        replacing (and releasing the contents of) any object with the same
+        name, and record that it was put.
+        """
+        last_modified = self.clock.seconds()
+        previous = container.put(Object(
+            name=name, blob=blob, content_type=content_type,
+            last_modified=last_modified, manifest=manifest
+        ))
+        if previous is not None:
+            previous.blob.release()
+        self.record(("object", container.name, name,
+                     (content_type, blob.key, last_modified, manifest)),
+                    [blob])
+
+    def _remove(self, container, name):
+        """
+        Remove an object from a container, releasing its contents, and
+        record that it was removed.
+        """
+        container.remove(name).blob.release()
+        self.record(("object", container.name, name, None))
+
+    @app.route("/", methods=["POST", "DELETE"])
+    def bulk_delete(self, request):
+        """
+        Delete the objects and (empty) containers at the paths listed,
+        URL-encoded, one per line, in the body of a ``?bulk-delete``
+        request, reading them as they come.  The response summarizes how many
+        were deleted and not found, and which could not be deleted.
+        """
+        if not _has_parameter(request, "bulk-delete"):
+            request.setResponseCode(BAD_REQUEST)
+            return b"Invalid request: no bulk-delete parameter"
+        deleted = not_found = seen = 0
+        errors = []
+        response_status, response_body = None, ""
+        for line in request.content:
+            path = _text(unquote(line.strip())).strip("/")
+            if not path:
+                continue
+            seen += 1
+            if seen > MAX_BULK_DELETES:
+                response_status = "413 Request Entity Too Large"
+                response_body = "Maximum Bulk Deletes: {0} per request".format(
+                    MAX_BULK_DELETES)
+                break
+            container_name, _, object_name = path.partition("/")
+            container = self.containers.get(container_name)
+            if container is None or (object_name and
+                                     object_name not in container.objects):
+                not_found += 1
+            elif object_name:
+                self._remove(container, object_name)
+                deleted += 1
+            elif container.names:
+                errors.append((path, "409 Conflict"))
+            else:
+                self._delete_container(container_name)
+                deleted += 1
+        request.setResponseCode(OK)
+        return _bulk_response(request, [
+            ("Number Deleted", deleted),
+            ("Number Not Found", not_found),
+            ("Response Body", response_body),
+            ("Response Status",
+             response_status or _bulk_status(errors, "200 OK")),
+        ], errors)
+
+    @app.route("/", methods=["PUT"])
+    def extract_archive_into_account(self, request):
+        """
+        Extract an archive uploaded with ``?extract-archive``, whose top-level
+        directories name the containers for the files within them.
+        """
+        return self._extract_archive(request, None, "")
+
+    def _extract_archive(self, request, container_name, prefix):
+        """
+        Store each file in the tar archive which is the body of the request
+        as an object, reading the archive and each file a chunk at a time.
+        The format of the archive is the value of the ``extract-archive``
+        query parameter: ``tar``, ``tar.gz`` or ``tar.bz2``.
+
+        :param container_name: the container to store the objects in, or
+            ``None`` to use the first directory of the path of each file,
+            creating containers as needed.
+        :param prefix: a prefix for the names of the objects.
+        """
+        mode = ARCHIVE_MODES.get(request.args["extract-archive"][0])
+        if mode is None:
+            request.setResponseCode(BAD_REQUEST)
+            return b"Unsupported archive format"
+        if (container_name is not None and
+                container_name not in self.containers):
+            request.setResponseCode(NOT_FOUND)
+            return b""
+        created = 0
+        errors = []
+        response_status, response_body = None, ""
+        try:
+            archive = tarfile.open(fileobj=request.content, mode=mode)
+            for member in archive:
+                if not member.isfile():
+                    continue
+                path = _text(member.name)
+                while path.startswith("./"):
+                    path = path[2:]
+                path = prefix + path.lstrip("/")
+                if container_name is None:
+                    name, _, object_name = path.partition("/")
+                    if not object_name:
+                        errors.append((path, "400 Bad Request"))
+                        continue
+                    container = self.containers.get(name)
+                    if container is None:
+                        container = self._create_container(name)
+                else:
+                    container = self.containers[container_name]
+                    object_name = path
+                content_type = (guess_type(object_name)[0] or
+                                "application/octet-stream")
+                self._put(container, object_name,
+                          self.blobs.store(archive.extractfile(member)),
+                          content_type)
+                created += 1
+        except (tarfile.TarError, EOFError, IOError):
+            response_status = "400 Bad Request"
+            response_body = "Invalid Tar File"
+        request.setResponseCode(OK)
+        return _bulk_response(request, [
+            ("Number Files Created", created),
+            ("Response Body", response_body),
+            ("Response Status",
+             response_status or _bulk_status(errors, "201 Created")),
+        ], errors)
 
     @app.route("/<string:container_name>", methods=["PUT"])
     def create_container(self, request, container_name):
         """
         Api call to create and save container.  HTTP status code of 201 if
         created, else returns 202.
+
+        With ``?extract-archive``, extract an archive into the container
+        instead; see :obj:`_extract_archive`.
         """
+        if "extract-archive" in request.args:
+            return self._extract_archive(request, container_name, "")
         if container_name not in self.containers:
-            self.containers[container_name] = Container(name=container_name)
+            self._create_container(container_name)
             request.setResponseCode(CREATED)
         else:
             request.setResponseCode(ACCEPTED)
@@ -152,42 +829,240 @@ class SwiftTenantInRegion(object):
     def get_container(self, request, container_name):
         """
         Api call to get a container, given the name of the container.  HTTP
-        status code of 200 when such a container exists, 404 if not.
-        """
-        if container_name in self.containers:
-            request.responseHeaders.setRawHeaders("content-type",
-                                                  ["application/json"])
-            request.responseHeaders.setRawHeaders("x-container-object-count",
-                                                  ["0"])
-            request.responseHeaders.setRawHeaders("x-container-bytes-used",
-                                                  ["0"])
-            request.setResponseCode(OK)
-            return dumps([
-                obj.as_json() for obj in
-                self.containers[container_name].objects.values()
-            ])
-        else:
+        status code of 200 when such a container exists, 404 if not.  A HEAD
+        request gets only the headers, with a status code of 204.
+
+        The listing is filtered by the ``prefix``, ``delimiter``, ``marker``,
+        ``end_marker`` and ``limit`` query parameters; see
+        :obj:`Container.listing`.  A ``limit`` which is not an integer is a
+        bad request, and one over :obj:`CONTAINER_LISTING_LIMIT` fails with
+        412.
+        """
+        if container_name not in self.containers:
             return NoResource()
+        container = self.containers[container_name]
+        request.setHeader("x-container-object-count",
+                          str(len(container.names)))
+        request.setHeader("x-container-bytes-used",
+                          str(container.bytes_used))
+        if request.method == b"HEAD":
+            request.setResponseCode(NO_CONTENT)
+            return b""
+
+        args = dict((key, _text(request.args[key][0]))
+                    for key in ["prefix", "delimiter", "marker", "end_marker",
+                                "limit"]
+                    if key in request.args)
+        limit = CONTAINER_LISTING_LIMIT
+        if "limit" in args:
+            try:
+                limit = int(args.pop("limit"))
+            except ValueError:
+                request.setResponseCode(BAD_REQUEST)
+                return b"Value of limit must be an integer"
+            if limit < 0:
+                request.setResponseCode(BAD_REQUEST)
+                return b"Value of limit must not be negative"
+            if limit > CONTAINER_LISTING_LIMIT:
+                request.setResponseCode(PRECONDITION_FAILED)
+                return "Maximum limit is {0}".format(
+                    CONTAINER_LISTING_LIMIT).encode("ascii")
 
-    @app.route("/<string:container_name>/<string:object_name>",
+        request.setHeader("content-type", "application/json")
+        request.setResponseCode(OK)
+        return dumps([
+            {"subdir": entry} if isinstance(entry, text_type)
+            else entry.as_json()
+            for entry in container.listing(limit=limit, **args)
+        ])
+
+    @app.route("/<string:container_name>/<path:object_name>",
                methods=["GET"])
     def get_object(self, request, container_name, object_name):
         """
-        Get an object from a container.
+        Get an object from a container, streaming its body; see
+        :obj:`serve_body`.  HTTP status code of 404 if there is no such
+        object.
+
+        The body of a large object is its segments, read one after another
+        as it is streamed, and only from the segment a range starts in;
+        with ``?multipart-manifest=get``, the manifest of a static large
+        object is returned instead.  HTTP status code of 409 if a segment of
+        a static large object has been deleted or replaced.
         """
-        return self.containers[container_name].objects[object_name].data
+        obj = _find(self.containers, container_name, object_name)
+        if obj is None:
+            request.setResponseCode(NOT_FOUND)
+            return b''
+        manifest = obj.manifest
+        if manifest is None or (
+                isinstance(manifest, StaticManifest) and
+                request.args.get("multipart-manifest") == ["get"]):
+            return serve_body(request, obj.blob, obj.content_type,
+                              obj.blob.etag, obj.last_modified)
+        blobs = manifest.resolve(self.containers)
+        if blobs is None:
+            request.setResponseCode(CONFLICT)
+            return b''
+        request.setHeader(*manifest.header)
+        return serve_body(request, Concatenation(blobs), obj.content_type,
+                          _manifest_etag(blobs), obj.last_modified)
 
-    @app.route("/<string:container_name>/<string:object_name>",
+    @app.route("/<string:container_name>/<path:object_name>",
                methods=["PUT"])
     def put_object(self, request, container_name, object_name):
         """
-        Create or update an object in a container.
+        Create or update an object in a container.  The body is copied into
+        storage a chunk at a time, rather than read into memory whole, and
+        shares that storage with any other object with the same contents.
+
+        If the request has an ``ETag``, and it is not the MD5 digest of the
+        body, the object is not stored, and the response code is 422.
+
+        With ``?extract-archive``, extract an archive into the container
+        instead, with the object name as a prefix for the names of the files
+        in it; see :obj:`_extract_archive`.
+
+        With ``?multipart-manifest=put``, create a static large object; see
+        :obj:`_put_static_manifest`.  With an ``X-Object-Manifest`` header of
+        ``<container>/<prefix>``, create a dynamic large object, whose
+        segments are the objects in that container with that prefix.
+
+        HTTP status code of 404 if there is no such container.  Without a
+        ``Content-Type`` header, the content type is guessed from the object
+        name, as it is for files extracted from an archive.
         """
-        request.setResponseCode(201)
-        container = self.containers[container_name]
-        content_type = request.requestHeaders.getRawHeaders('content-type')[0]
-        container.objects[object_name] = Object(
-            name=object_name, data=request.content.read(),
-            content_type=content_type
-        )
+        if "extract-archive" in request.args:
+            return self._extract_archive(request, container_name,
+                                         object_name.rstrip("/") + "/")
+        container = self.containers.get(container_name)
+        if container is None:
+            request.setResponseCode(NOT_FOUND)
+            return b''
+        content_type = (request.getHeader("content-type") or
+                        guess_type(object_name)[0] or
+                        "application/octet-stream")
+        if request.args.get("multipart-manifest") == ["put"]:
+            return self._put_static_manifest(request, container, object_name,
+                                             content_type)
+        manifest = None
+        manifest_header = request.getHeader("x-object-manifest")
+        if manifest_header is not None:
+            segments_container, _, prefix = _text(
+                unquote(manifest_header)).lstrip("/").partition("/")
+            manifest = DynamicManifest(container_name=segments_container,
+                                       prefix=prefix)
+        blob = self.blobs.store(request.content)
+        expected = request.getHeader("etag")
+        if expected is not None and expected.strip('"').lower() != blob.etag:
+            blob.release()
+            request.setResponseCode(422)
+            return b''
+        self._put(container, object_name, blob, content_type, manifest)
+        request.setResponseCode(CREATED)
+        request.setHeader("etag", blob.etag)
         return b''
+
+    def _put_static_manifest(self, request, container, object_name,
+                             content_type):
+        """
+        Create a static large object from the manifest in the body of the
+        request: a JSON list of its segments, each with the ``path``
+        (``/<container>/<object>``) of an existing object and, optionally,
+        the ``etag`` and ``size_bytes`` it must have.
+
+        A segment may not itself be a large object.  HTTP status code of 400,
+        listing the problem with each invalid segment, if any are; 413 if
+        there are more than :obj:`MAX_MANIFEST_SEGMENTS`.
+        """
+        try:
+            entries = loads(request.content.read().decode("utf-8"))
+        except ValueError:
+            entries = None
+        if (not isinstance(entries, list) or not entries or
+                not all(isinstance(entry, dict) and
+                        isinstance(entry.get("path"), string_types)
+                        for entry in entries)):
+            request.setResponseCode(BAD_REQUEST)
+            return b"Manifest must be a list of segments, each with a path"
+        if len(entries) > MAX_MANIFEST_SEGMENTS:
+            request.setResponseCode(REQUEST_ENTITY_TOO_LARGE)
+            return "Number of segments must be <= {0}".format(
+                MAX_MANIFEST_SEGMENTS).encode("ascii")
+        segments = []
+        blobs = []
+        stored = []
+        errors = []
+        for entry in entries:
+            path = entry["path"]
+            segment_container, _, segment_name = path.lstrip("/").partition(
+                "/")
+            segment = _find(self.containers, segment_container, segment_name)
+            if segment is None:
+                errors.append((path, "404 Not Found"))
+            elif segment.manifest is not None:
+                errors.append((path, "Segment is a large object"))
+            elif entry.get("etag") not in (None, segment.blob.etag):
+                errors.append((path, "Etag Mismatch"))
+            elif entry.get("size_bytes") not in (None, segment.blob.size):
+                errors.append((path, "Size Mismatch"))
+            else:
+                segments.append((segment_container, segment_name,
+                                 segment.blob.etag))
+                blobs.append(segment.blob)
+                stored.append({"name": "/" + segment_container + "/" +
+                               segment_name,
+                               "hash": segment.blob.etag,
+                               "bytes": segment.blob.size,
+                               "content_type": segment.content_type})
+        if errors:
+            request.setResponseCode(BAD_REQUEST)
+            lines = ["Errors:"] + ["{0}, {1}".format(path, reason)
+                                   for (path, reason) in errors]
+            return ("\n".join(lines) + "\n").encode("utf-8")
+        blob = self.blobs.store(BytesIO(dumps(stored).encode("utf-8")))
+        self._put(container, object_name, blob, content_type,
+                  StaticManifest(segments=segments))
+        request.setResponseCode(CREATED)
+        request.setHeader("etag", _manifest_etag(blobs))
+        return b''
+
+    @app.route("/<string:container_name>/<path:object_name>",
+               methods=["DELETE"])
+    def delete_object(self, request, container_name, object_name):
+        """
+        Delete an object from a container, releasing its storage.  HTTP status
+        code of 204 when such an object existed, 404 if not.
+
+        Deleting a large object only deletes its manifest, unless it is a
+        static large object and the request has ``?multipart-manifest=delete``,
+        in which case its segments are deleted too, and the response
+        summarizes them as a bulk delete does.
+        """
+        obj = _find(self.containers, container_name, object_name)
+        if obj is None:
+            request.setResponseCode(NOT_FOUND)
+            return b''
+        container = self.containers[container_name]
+        if not (isinstance(obj.manifest, StaticManifest) and
+                request.args.get("multipart-manifest") == ["delete"]):
+            self._remove(container, object_name)
+            request.setResponseCode(NO_CONTENT)
+            return b''
+        deleted = not_found = 0
+        for (segment_container, segment_name, etag) in obj.manifest.segments:
+            if _find(self.containers, segment_container,
+                     segment_name) is None:
+                not_found += 1
+            else:
+                self._remove(self.containers[segment_container],
+                             segment_name)
+                deleted += 1
+        self._remove(container, object_name)
+        request.setResponseCode(OK)
+        return _bulk_response(request, [
+            ("Number Deleted", deleted + 1),
+            ("Number Not Found", not_found),
+            ("Response Body", ""),
+            ("Response Status", "200 OK"),
+        ], [])
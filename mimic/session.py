@@ -1,14 +1,28 @@
 # -*- test-case-name: mimic.test.test_session -*-
 
 """
-Implementation of simple in-memory session storage and generation for Mimic.
+Implementation of simple session storage and generation for Mimic.
+
+Sessions are kept by an :obj:`mimic.imimic.ISessionBackend`: either
+:obj:`MemorySessionBackend`, private to one process, or
+:obj:`SQLiteSessionBackend`, which lets several Mimic processes share one set
+of tenants, tokens and usernames.
 """
 
+import json
+import sqlite3
+
 from six import text_type
 from uuid import uuid4
+from calendar import timegm
 from datetime import datetime, timedelta
+from heapq import heappush, heappop
+from itertools import count
 
 from characteristic import attributes, Attribute
+from zope.interface import implementer
+
+from mimic.imimic import ISessionBackend
 
 
 @attributes(['username', 'token', 'tenant_id', 'expires',
@@ -34,23 +48,33 @@ class Session(object):
             self._api_objects[api_mock] = data_factory()
         return self._api_objects[api_mock]
 
+    def stored_data_for_api(self, api_mock):
+        """
+        Get the application data for a given API, or ``None`` if it has none
+        yet.
+        """
+        return self._api_objects.get(api_mock)
 
-class SessionStore(object):
+
+def _expiration_seconds(session):
     """
-    A collection of sessions addressable by multiple different keys.
+    Get the expiration time of the given session in seconds since the epoch.
+    """
+    expires = session.expires
+    return timegm(expires.utctimetuple()) + expires.microsecond / 1e6
 
-    Unlike many traditional types of session storage, new authenticated users
-    are created on demand, since all authentication succeeds by default within
-    Mimic.
 
-    :ivar IReactorTime clock: The clock used to track session expiration.
+@implementer(ISessionBackend)
+class MemorySessionBackend(object):
+    """
+    An :obj:`ISessionBackend` which keeps sessions in dictionaries in this
+    process, with a heap of their expiration times.
     """
 
-    def __init__(self, clock):
+    def __init__(self):
         """
-        Create a session store with the given IReactorTime provider.
+        Create a backend with no sessions.
         """
-        self.clock = clock
         self._token_to_session = {
             # mapping of token (unicode) to session (Session)
         }
@@ -61,8 +85,313 @@ class SessionStore(object):
             # mapping of token (unicode) to username (unicode: key in
             # _token_to_session)
         }
+        self._expirations = [
+            # heap of (expiration time in seconds since the epoch, serial
+            # number, Session, username key) tuples
+        ]
+        self._data_tokens = {
+            # mapping of token (unicode) to the token of the session whose
+            # API data it shares
+        }
+        self._serial = count()
+
+    def add_session(self, session, username_key, data_token, now):
+        """
+        Index the given session by its token, tenant ID and username key.
+        """
+        self._username_to_token[username_key] = session.token
+        self._token_to_session[session.token] = session
+        self._tenant_to_token[session.tenant_id] = session.token
+        self._data_tokens[session.token] = data_token
+        heappush(self._expirations,
+                 (_expiration_seconds(session), next(self._serial), session,
+                  username_key))
+        return session
+
+    def session_for_token(self, token, now):
+        """
+        Get the session with the given token.
+        """
+        return self._token_to_session.get(token)
+
+    def token_for_tenant_id(self, tenant_id, now):
+        """
+        Get the token of the latest session for the given tenant ID.
+        """
+        return self._tenant_to_token.get(tenant_id)
+
+    def token_for_username(self, username_key, now):
+        """
+        Get the token of the session for the given username key.
+        """
+        return self._username_to_token.get(username_key)
 
-    def _new_session(self, username_key=None, **attributes):
+    def expire_sessions(self, now):
+        """
+        Evict every session that expires no later than ``now``.
+        """
+        evicted = 0
+        while self._expirations and self._expirations[0][0] <= now:
+            _, _, session, username_key = heappop(self._expirations)
+            evicted += self._evict(session, username_key)
+        return evicted
+
+    def live_sessions(self, now):
+        """
+        Count the sessions which have not been evicted.
+        """
+        return len(self._token_to_session)
+
+    def sessions(self, now):
+        """
+        List the sessions which have not been evicted, in the order they
+        were added.
+        """
+        entries = sorted((serial, session, username_key)
+                         for (_, serial, session, username_key)
+                         in self._expirations
+                         if self._token_to_session.get(session.token)
+                         is session)
+        return [(session, username_key, self._data_tokens[session.token])
+                for (_, session, username_key) in entries]
+
+    def _evict(self, session, username_key):
+        """
+        Remove all references this backend holds to the given session.
+
+        :return: 1 if the session was evicted, 0 if it was already gone.
+        """
+        if self._token_to_session.get(session.token) is not session:
+            return 0
+        del self._token_to_session[session.token]
+        del self._data_tokens[session.token]
+        if self._username_to_token.get(username_key) == session.token:
+            del self._username_to_token[username_key]
+        if self._tenant_to_token.get(session.tenant_id) == session.token:
+            # An impersonation session shadows its user's own session for
+            # the tenant; fall back to the latter if it is still alive.
+            user_token = self._username_to_token.get(session.username)
+            user_session = self._token_to_session.get(user_token)
+            if (user_session is not None and
+                    user_session.tenant_id == session.tenant_id):
+                self._tenant_to_token[session.tenant_id] = user_token
+            else:
+                del self._tenant_to_token[session.tenant_id]
+        return 1
+
+
+@implementer(ISessionBackend)
+class SQLiteSessionBackend(object):
+    """
+    An :obj:`ISessionBackend` which keeps sessions in an SQLite database in
+    write-ahead-log mode, so that every Mimic process using the same database
+    file sees the same tenants, tokens and usernames.
+
+    Data attached to a session with :obj:`Session.data_for_api` is arbitrary
+    Python state and so stays within the process which created it; requests
+    for a given tenant should therefore always be served by the same process.
+
+    :ivar float purge_interval: The minimum number of seconds between two
+        deletions of expired rows from the database.  Expired rows are never
+        returned by lookups, whether or not they have been purged yet.
+    """
+
+    purge_interval = 60
+
+    def __init__(self, path, timeout=30):
+        """
+        Open (creating if necessary) the session database at the given path.
+
+        :param str path: the path of the SQLite database file.
+        :param float timeout: how long to wait, in seconds, for another
+            process to release a lock on the database.
+        """
+        self._db = sqlite3.connect(path, timeout=timeout,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " token TEXT PRIMARY KEY,"
+            " username TEXT NOT NULL,"
+            " username_key TEXT NOT NULL UNIQUE,"
+            " tenant_id TEXT NOT NULL,"
+            " expires REAL NOT NULL,"
+            " data_token TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_by_tenant"
+                         " ON sessions (tenant_id)")
+        self._local_sessions = {
+            # mapping of token (unicode) to the Session object representing
+            # it within this process
+        }
+        self._next_purge = None
+
+    def add_session(self, session, username_key, data_token, now):
+        """
+        Store the given session, unless another process has concurrently
+        stored a session with the same token or username key.
+        """
+        key = json.dumps(username_key)
+        self._db.execute(
+            "DELETE FROM sessions"
+            " WHERE (token = ? OR username_key = ?) AND expires <= ?",
+            (session.token, key, now))
+        self._db.execute(
+            "INSERT OR IGNORE INTO sessions"
+            " (token, username, username_key, tenant_id, expires, data_token)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (session.token, session.username, key, session.tenant_id,
+             _expiration_seconds(session), data_token))
+        row = self._db.execute(
+            "SELECT token FROM sessions WHERE token = ? AND username_key = ?",
+            (session.token, key)).fetchone()
+        if row is not None:
+            self._local_sessions[session.token] = session
+            return session
+        token = self._db.execute(
+            "SELECT token FROM sessions WHERE token = ? OR username_key = ?",
+            (session.token, key)).fetchone()[0]
+        return self.session_for_token(token, now)
+
+    def session_for_token(self, token, now):
+        """
+        Get the session with the given token, creating a local
+        :obj:`Session` for it if it was stored by another process.
+        """
+        row = self._db.execute(
+            "SELECT username, tenant_id, expires, data_token FROM sessions"
+            " WHERE token = ? AND expires > ?",
+            (token, now)).fetchone()
+        if row is None:
+            self._local_sessions.pop(token, None)
+            return None
+        username, tenant_id, expires, data_token = row
+        session = self._local_sessions.get(token)
+        if session is None or _expiration_seconds(session) != expires:
+            if data_token == token:
+                api_objects = {}
+            else:
+                shared = self.session_for_token(data_token, now)
+                api_objects = {} if shared is None else shared._api_objects
+            session = Session(username=username, token=token,
+                              tenant_id=tenant_id,
+                              expires=datetime.utcfromtimestamp(expires),
+                              api_objects=api_objects)
+            self._local_sessions[token] = session
+        return session
+
+    def token_for_tenant_id(self, tenant_id, now):
+        """
+        Get the token of the most recently stored session for the given
+        tenant ID.
+        """
+        row = self._db.execute(
+            "SELECT token FROM sessions WHERE tenant_id = ? AND expires > ?"
+            " ORDER BY rowid DESC LIMIT 1",
+            (tenant_id, now)).fetchone()
+        return row and row[0]
+
+    def token_for_username(self, username_key, now):
+        """
+        Get the token of the session for the given username key.
+        """
+        row = self._db.execute(
+            "SELECT token FROM sessions WHERE username_key = ? AND expires > ?",
+            (json.dumps(username_key), now)).fetchone()
+        return row and row[0]
+
+    def expire_sessions(self, now):
+        """
+        Delete expired rows from the database and forget the local sessions
+        for them, at most once every :obj:`purge_interval` seconds.
+        """
+        if self._next_purge is not None and now < self._next_purge:
+            return 0
+        self._next_purge = now + self.purge_interval
+        evicted = self._db.execute("DELETE FROM sessions WHERE expires <= ?",
+                                   (now,)).rowcount
+        for token, session in list(self._local_sessions.items()):
+            if _expiration_seconds(session) <= now:
+                del self._local_sessions[token]
+        return evicted
+
+    def live_sessions(self, now):
+        """
+        Count the sessions which have not yet expired.
+        """
+        return self._db.execute("SELECT COUNT(*) FROM sessions"
+                                " WHERE expires > ?", (now,)).fetchone()[0]
+
+    def sessions(self, now):
+        """
+        List the sessions which have not yet expired, in the order they were
+        stored, whichever process stored them.
+        """
+        rows = self._db.execute(
+            "SELECT token, username_key, data_token FROM sessions"
+            " WHERE expires > ? ORDER BY rowid", (now,)).fetchall()
+        result = []
+        for token, key, data_token in rows:
+            username_key = json.loads(key)
+            if isinstance(username_key, list):
+                username_key = tuple(username_key)
+            session = self.session_for_token(token, now)
+            if session is not None:
+                result.append((session, username_key, data_token))
+        return result
+
+
+class SessionStore(object):
+    """
+    A collection of sessions addressable by multiple different keys.
+
+    Unlike many traditional types of session storage, new authenticated users
+    are created on demand, since all authentication succeeds by default within
+    Mimic.
+
+    Sessions are forgotten, along with any data attached to them by
+    :obj:`Session.data_for_api`, once the clock passes their expiration time.
+    Expired sessions are evicted lazily, whenever the store is consulted.
+
+    :ivar IReactorTime clock: The clock used to track session expiration.
+    :ivar int evicted_sessions: The number of sessions which have expired and
+        been evicted from this store.
+    :ivar journal: The :obj:`mimic.snapshot.WriteAheadLog` to which new
+        sessions, and the changes APIs make to their data, are appended, or
+        ``None``.
+    """
+
+    def __init__(self, clock, backend=None):
+        """
+        Create a session store with the given IReactorTime provider.
+
+        :param backend: the :obj:`ISessionBackend` to keep sessions in; by
+            default, a new :obj:`MemorySessionBackend`.
+        """
+        self.clock = clock
+        if backend is None:
+            backend = MemorySessionBackend()
+        self._backend = backend
+        self.evicted_sessions = 0
+        self.journal = None
+
+    @property
+    def live_sessions(self):
+        """
+        The number of sessions in this store which have not yet expired.
+        """
+        self.expire_sessions()
+        return self._backend.live_sessions(self.clock.seconds())
+
+    def expire_sessions(self):
+        """
+        Evict every session whose expiration time has passed according to
+        this store's clock.
+        """
+        self.evicted_sessions += self._backend.expire_sessions(
+            self.clock.seconds())
+
+    def _new_session(self, username_key=None, data_token=None, **attributes):
         """
         Create a new session and persist it according to its username and token
         values.
@@ -70,6 +399,8 @@ class SessionStore(object):
         :param attributes: Keyword parameters containing zero or more of
             ``username``, ``token``, and ``tenant_id``.  Any fields that are
             not specified will be filled out automatically.
+        :param unicode data_token: The token of the session whose API data the
+            new session shares, if not its own.
 
         :return: A new session with all fields filled out and an expiration
                  time 1 day in the future (according to the clock associated
@@ -87,10 +418,73 @@ class SessionStore(object):
         session = Session(**attributes)
         if username_key is None:
             username_key = session.username
-        self._username_to_token[username_key] = session.token
-        self._token_to_session[session.token] = session
-        self._tenant_to_token[session.tenant_id] = session.token
-        return session
+        stored = self._backend.add_session(session, username_key,
+                                           data_token or session.token,
+                                           self.clock.seconds())
+        if stored is session and self.journal is not None:
+            self.journal.session_created(session, username_key,
+                                         data_token or session.token)
+        return stored
+
+    def record(self, api_mock, tenant_id, change, blobs=()):
+        """
+        Append a change an API has made to the data of the given tenant to
+        the journal, if there is one; see
+        :obj:`mimic.imimic.IPersistentAPIMock.apply_change`.
+
+        :param blobs: the blobs from a :obj:`mimic.util.storage.BlobStore`
+            whose keys ``change`` refers to.
+        """
+        if self.journal is not None:
+            self.journal.record(api_mock, tenant_id, change, blobs)
+
+    def sessions(self):
+        """
+        List every session which has not yet expired, in the order they were
+        created.
+
+        :return: a list of 3-tuples of a :obj:`Session`, its username key
+            (see :obj:`mimic.imimic.ISessionBackend`) and the token of the
+            session whose API data it shares (its own, if it shares none).
+        """
+        self.expire_sessions()
+        return self._backend.sessions(self.clock.seconds())
+
+    def restore_session(self, username, token, tenant_id, expires,
+                        username_key, data_token):
+        """
+        Re-create a session listed by :obj:`sessions`, perhaps in another
+        process; the session whose API data it shares, if any, must already
+        have been restored.  If a session with the same token already
+        exists, it is left as it is.
+
+        :return: the restored :obj:`Session`.
+        """
+        existing = self._session_for_token(token)
+        if existing is not None:
+            return existing
+        attributes = {}
+        if data_token != token:
+            shared = self._session_for_token(data_token)
+            if shared is not None:
+                attributes['api_objects'] = shared._api_objects
+        return self._new_session(username=username, token=token,
+                                 tenant_id=tenant_id, expires=expires,
+                                 username_key=username_key,
+                                 data_token=data_token, **attributes)
+
+    def _session_for_token(self, token):
+        """
+        Get the session for the given token, or ``None`` if there is none.
+        """
+        return self._backend.session_for_token(token, self.clock.seconds())
+
+    def _token_for_username(self, username_key):
+        """
+        Get the token for the given username key, or ``None`` if there is none.
+        """
+        return self._backend.token_for_username(username_key,
+                                                self.clock.seconds())
 
     def session_for_token(self, token, tenant_id=None):
         """
@@ -103,8 +497,10 @@ class SessionStore(object):
 
         :raise: :obj:`KeyError` if no such thing exists.
         """
-        if token in self._token_to_session:
-            return self._token_to_session[token]
+        self.expire_sessions()
+        session = self._session_for_token(token)
+        if session is not None:
+            return session
         return self._new_session(token=token, tenant_id=tenant_id)
 
     def session_for_api_key(self, username, api_key, tenant_id=None):
@@ -125,8 +521,12 @@ class SessionStore(object):
         """
         Create or return a :obj:`Session` based on a user's credentials.
         """
-        if username in self._username_to_token:
-            return self._token_to_session[self._username_to_token[username]]
+        self.expire_sessions()
+        token = self._token_for_username(username)
+        if token is not None:
+            session = self._session_for_token(token)
+            if session is not None:
+                return session
         return self._new_session(username=username,
                                  tenant_id=tenant_id)
 
@@ -136,18 +536,23 @@ class SessionStore(object):
         session is distinct from the user's normal login session in that it
         will have an independent token.
         """
+        self.expire_sessions()
         session = self.session_for_username_password(
             username, "lucky we don't check passwords, isn't it",
         )
         key = ('impersonation', session.username)
-        if key in self._username_to_token:
-            return self._token_to_session[self._username_to_token[key]]
+        token = self._token_for_username(key)
+        if token is not None:
+            subsession = self._session_for_token(token)
+            if subsession is not None:
+                return subsession
         subsession = self._new_session(
             username=username,
             expires=datetime.utcfromtimestamp(self.clock.seconds() +
                                               expires_in),
             tenant_id=session.tenant_id,
             username_key=key,
+            data_token=session.token,
             api_objects=session._api_objects,
         )
         return subsession
@@ -157,6 +562,9 @@ class SessionStore(object):
         :param unicode tenant_id: The tenant_id of a previously-created
             session.
         """
-        if tenant_id not in self._tenant_to_token:
+        self.expire_sessions()
+        token = self._backend.token_for_tenant_id(tenant_id,
+                                                  self.clock.seconds())
+        if token is None:
             return self._new_session(tenant_id=tenant_id)
-        return self.session_for_token(self._tenant_to_token[tenant_id])
+        return self.session_for_token(token)
@@ -0,0 +1,652 @@
+# -*- test-case-name: mimic.test.test_snapshot -*-
+
+"""
+Snapshots of Mimic's state, saved to a file and restored from it, so that
+the state survives a restart.
+
+A snapshot holds every live session, the data attached to it by each
+:obj:`mimic.imimic.IPersistentAPIMock` (Nova servers, load balancers, Swift
+containers and so on), and the contents of every blob that data refers to.
+
+Saving a snapshot has two phases.  First, the state is captured at once, so
+that it is consistent: each session and its data is pickled and compressed
+into a record, and each blob it refers to is pinned by taking a reference
+to it.  Since blobs are never changed, only replaced, pinning a blob is as
+good as copying it, and the bulk of the data is not copied at all.  Then
+the blobs and records are written to the file a chunk at a time by a
+:obj:`twisted.internet.task.Cooperator`, so that the reactor goes on serving
+requests meanwhile; the file replaces any earlier snapshot only once it is
+complete.
+
+A snapshot file is :obj:`MAGIC` followed by records, each of which is a
+kind byte, an 8-byte big-endian length, and that many bytes: a blob record
+for each blob (its SHA-256 key, then its contents), a header record, a
+session record for each session (each a zlib-compressed pickle), and
+finally an empty end record.
+
+Between snapshots, a :obj:`WriteAheadLog` may record each change as it is
+made: each session created, and each change an API records with
+:obj:`mimic.session.SessionStore.record` (a server created or deleted, a load
+balancer or node added or removed, an object put, and so on), along with the
+contents of any blob the change refers to.  Each change records the new
+state of what it changed, so replaying the log over the snapshot it follows
+converges on the state at the time of the last change logged, even if some
+of the changes are already in the snapshot.  The log is compacted by saving
+a snapshot: the log is set aside when the state is captured, and discarded
+once the snapshot has been written.
+
+A log file is :obj:`LOG_MAGIC` followed by records in the same format as a
+snapshot: blob records, session records, and change records; there is no
+end record, and an incomplete record at the end, left by a crash, is
+ignored.
+"""
+
+import os
+import shutil
+import struct
+import zlib
+
+from six.moves import cPickle as pickle
+
+from twisted.application.service import Service
+from twisted.internet.task import cooperate
+
+from mimic.util.logger import Logger
+
+
+#: The first bytes of every snapshot file.
+MAGIC = b"MIMIC-SNAPSHOT-1\n"
+
+#: The first bytes of every write-ahead log file.
+LOG_MAGIC = b"MIMIC-WAL-1\n"
+
+#: The size in bytes beyond which a write-ahead log is compacted.
+MAX_LOG_SIZE = 64 * 1024 * 1024
+
+_RECORD = struct.Struct(">cQ")
+_BLOB, _HEADER, _SESSION, _END, _CHANGE = b"B", b"H", b"S", b"E", b"C"
+_KEY_SIZE = 32
+
+_log = Logger("mimic.snapshot")
+
+
+def _pack(value):
+    """
+    Pickle and compress a value for a record.
+    """
+    return zlib.compress(pickle.dumps(value, 2))
+
+
+def _unpack(data):
+    """
+    Decompress and unpickle the value of a record.
+    """
+    return pickle.loads(zlib.decompress(data))
+
+
+class Snapshot(object):
+    """
+    The state of a :obj:`mimic.core.MimicCore`, captured at one moment and
+    waiting to be written.
+
+    :ivar int sessions: the number of sessions captured.
+    :ivar int blobs: the number of distinct blobs pinned.
+    """
+
+    def __init__(self, core):
+        """
+        Capture the state of the given core.
+        """
+        self._blobs = {}
+        store = core.sessions
+        apis = core.persistent_apis()
+        sessions = store.sessions()
+        # Sessions which share another's data are restored after it.
+        sessions.sort(key=lambda entry: entry[2] != entry[0].token)
+        self._records = [(_HEADER, _pack({"now": store.clock.seconds()}))]
+        for session, username_key, data_token in sessions:
+            record = {"username": session.username, "token": session.token,
+                      "tenant_id": session.tenant_id,
+                      "expires": session.expires,
+                      "username_key": username_key,
+                      "data_token": data_token, "apis": {}}
+            if data_token == session.token:
+                for key, api in apis.items():
+                    data = session.stored_data_for_api(api)
+                    if data is not None:
+                        record["apis"][key] = api.dump_data(data, self._pin)
+            self._records.append((_SESSION, _pack(record)))
+        self.sessions = len(sessions)
+        self.blobs = len(self._blobs)
+
+    def _pin(self, blob):
+        """
+        Keep the given blob until the snapshot has been written.
+
+        :return: the key of the blob.
+        """
+        if blob.key not in self._blobs:
+            blob.retain()
+            self._blobs[blob.key] = blob
+        return blob.key
+
+    def release(self):
+        """
+        Release the blobs pinned by the snapshot.
+        """
+        blobs, self._blobs = self._blobs, {}
+        for blob in blobs.values():
+            blob.release()
+
+    def write(self, path):
+        """
+        Write the snapshot to the given path, a step at a time, releasing its
+        blobs once done.  The snapshot is written to a temporary file next
+        to ``path``, which replaces ``path`` once it is complete.
+
+        :return: an iterator, which writes a chunk of a blob or a record each
+            time it is advanced, suitable for
+            :obj:`twisted.internet.task.cooperate`.
+        """
+        partial = path + ".partial"
+        try:
+            with open(partial, "wb") as f:
+                f.write(MAGIC)
+                for key, blob in self._blobs.items():
+                    f.write(_RECORD.pack(_BLOB, len(key) + blob.size))
+                    f.write(key)
+                    for chunk in blob.chunks():
+                        f.write(chunk)
+                        yield
+                for kind, data in self._records:
+                    f.write(_RECORD.pack(kind, len(data)))
+                    f.write(data)
+                    yield
+                f.write(_RECORD.pack(_END, 0))
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        finally:
+            self.release()
+
+
+class _Slice(object):
+    """
+    A file-like object reading a number of bytes from the current position
+    of another.
+    """
+
+    def __init__(self, f, size):
+        """
+        :param f: the file to read from.
+        :param int size: the number of bytes to read.
+        """
+        self._file = f
+        self._remaining = size
+
+    def read(self, size):
+        """
+        Read up to ``size`` of the remaining bytes.
+        """
+        data = self._file.read(min(size, self._remaining))
+        self._remaining -= len(data)
+        return data
+
+
+class _BlobReader(object):
+    """
+    Finds the blobs in a snapshot file being loaded.
+    """
+
+    def __init__(self, f):
+        """
+        :param f: the snapshot file.
+        """
+        self._file = f
+        self._blobs = {}
+
+    def skip(self, size):
+        """
+        Note the blob whose record, of the given size, starts at the current
+        position of the file, and skip over it.
+        """
+        key = self._file.read(_KEY_SIZE)
+        self._blobs[key] = (self._file.tell(), size - _KEY_SIZE)
+        self._file.seek(size - _KEY_SIZE, 1)
+
+    def blob_for_key(self, store, key):
+        """
+        Get the blob with the given key from the given store, taking a
+        reference to it, and first copying it into the store from the file
+        if the store does not already hold it.
+        """
+        blob = store.find(key)
+        if blob is not None:
+            blob.retain()
+            return blob
+        offset, size = self._blobs[key]
+        position = self._file.tell()
+        self._file.seek(offset)
+        try:
+            return store.store(_Slice(self._file, size))
+        finally:
+            self._file.seek(position)
+
+
+def _catch_up(clock, now):
+    """
+    Advance the given clock to the given time, if it is a
+    :obj:`twisted.internet.task.Clock` which is behind it.
+    """
+    if hasattr(clock, "advance") and now > clock.seconds():
+        clock.advance(now - clock.seconds())
+
+
+def load(core, path):
+    """
+    Restore the state saved in a snapshot file into a core.
+
+    If the core's clock is a :obj:`twisted.internet.task.Clock` which is
+    behind the time the snapshot was taken, it is advanced to that time, so
+    that the times in the restored state are not in the future.  Data for
+    APIs which the core does not have is ignored.
+
+    :return: the number of sessions restored.
+    :raise ValueError: if the file is not a complete snapshot.
+    """
+    apis = core.persistent_apis()
+    store = core.sessions
+    clock = store.clock
+    restored = 0
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a Mimic snapshot: " + path)
+        blobs = _BlobReader(f)
+        while True:
+            header = f.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                raise ValueError("Incomplete Mimic snapshot: " + path)
+            kind, size = _RECORD.unpack(header)
+            if kind == _END:
+                break
+            if kind == _BLOB:
+                blobs.skip(size)
+                continue
+            record = _unpack(f.read(size))
+            if kind == _HEADER:
+                _catch_up(clock, record["now"])
+                continue
+            session = store.restore_session(
+                record["username"], record["token"], record["tenant_id"],
+                record["expires"], record["username_key"],
+                record["data_token"])
+            for key, state in record["apis"].items():
+                api = apis.get(key)
+                if api is not None:
+                    session.data_for_api(
+                        api, lambda: api.load_data(state, store,
+                                                   record["tenant_id"],
+                                                   blobs.blob_for_key))
+            restored += 1
+    _log.info("Restored %(sessions)d sessions from %(path)s",
+              sessions=restored, path=path)
+    return restored
+
+
+def _replay_file(core, apis, path):
+    """
+    Replay the records in one write-ahead log file into a core.
+
+    :return: a 2-tuple of the number of records replayed, and the offset at
+        which the complete records in the file end.
+    """
+    store = core.sessions
+    replayed = 0
+    with open(path, "rb") as f:
+        end = os.fstat(f.fileno()).st_size
+        if f.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ValueError("Not a Mimic write-ahead log: " + path)
+        blobs = _BlobReader(f)
+        while True:
+            complete = f.tell()
+            header = f.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                break
+            kind, size = _RECORD.unpack(header)
+            if f.tell() + size > end:
+                break
+            if kind == _BLOB:
+                blobs.skip(size)
+                continue
+            record = _unpack(f.read(size))
+            replayed += 1
+            if kind == _SESSION:
+                _catch_up(store.clock, record["now"])
+                store.restore_session(
+                    record["username"], record["token"], record["tenant_id"],
+                    record["expires"], record["username_key"],
+                    record["data_token"])
+                continue
+            now, key, tenant_id, change = record
+            _catch_up(store.clock, now)
+            api = apis.get(key)
+            if api is None:
+                continue
+            session = store.session_for_tenant_id(tenant_id)
+            data = session.stored_data_for_api(api)
+            updated = api.apply_change(data, change, store, tenant_id,
+                                       blobs.blob_for_key)
+            if data is None:
+                session.data_for_api(api, lambda: updated)
+    return replayed, complete
+
+
+def replay(core, path):
+    """
+    Replay the changes recorded in a write-ahead log, and in the log set
+    aside by :obj:`WriteAheadLog.rotate` if it has not yet been discarded,
+    into a core, following the snapshot (if any) loaded into it.  An
+    incomplete record at the end of the log is removed.
+
+    :return: the number of sessions and changes replayed.
+    :raise ValueError: if a file is not a write-ahead log.
+    """
+    apis = core.persistent_apis()
+    replayed = 0
+    for each in [path + ".old", path]:
+        if os.path.exists(each) and os.path.getsize(each) > 0:
+            count, complete = _replay_file(core, apis, each)
+            replayed += count
+            if complete < os.path.getsize(each):
+                _log.warning("Ignoring an incomplete record at the end of "
+                             "%(path)s", path=each)
+                with open(each, "r+b") as f:
+                    f.truncate(complete)
+    if replayed:
+        _log.info("Replayed %(records)d records from %(path)s",
+                  records=replayed, path=path)
+    return replayed
+
+
+class WriteAheadLog(object):
+    """
+    A log of the sessions created in a :obj:`mimic.core.MimicCore`, and of
+    the changes recorded by its APIs, appended to a file as they are made;
+    attached to a :obj:`mimic.session.SessionStore` as its ``journal``.
+
+    Each record is flushed to the operating system at once, but only
+    synced to disk once every ``sync_interval`` seconds, so that a burst of
+    changes costs one ``fsync`` rather than one each.
+
+    :ivar on_full: a callable to call, if any, each time a record is
+        appended once the log has grown beyond its maximum size.
+    """
+
+    def __init__(self, core, path, sync_interval=0, max_size=MAX_LOG_SIZE,
+                 reactor=None):
+        """
+        :param str path: the path of the log file.
+        :param float sync_interval: the most seconds to wait before syncing
+            a record to disk; if 0, every record is synced at once.
+        :param int max_size: the size in bytes beyond which the log is full.
+        :param reactor: the :obj:`twisted.internet.interfaces.IReactorTime`
+            on which to schedule syncs; by default, the global reactor.
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self.path = path
+        self.on_full = None
+        self._clock = core.sessions.clock
+        self._apis = dict((api, key)
+                          for (key, api) in core.persistent_apis().items())
+        self._sync_interval = sync_interval
+        self._max_size = max_size
+        self._reactor = reactor
+        self._file = None
+        self._logged = set()
+        self._pending_sync = None
+
+    def open(self):
+        """
+        Open the log file to append records to it, creating it if need be.
+        """
+        self._file = open(self.path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(LOG_MAGIC)
+            self._file.flush()
+
+    def session_created(self, session, username_key, data_token):
+        """
+        Append a record of a new session.
+        """
+        self._append(_SESSION, _pack({
+            "now": self._clock.seconds(), "username": session.username,
+            "token": session.token, "tenant_id": session.tenant_id,
+            "expires": session.expires, "username_key": username_key,
+            "data_token": data_token}))
+
+    def record(self, api_mock, tenant_id, change, blobs=()):
+        """
+        Append a record of a change an API has made to the data of a tenant,
+        preceded by the contents of each of the given blobs not already in
+        the log.
+        """
+        key = self._apis.get(api_mock)
+        if key is None:
+            return
+        for blob in blobs:
+            if blob.key not in self._logged:
+                self._file.write(_RECORD.pack(_BLOB, _KEY_SIZE + blob.size))
+                self._file.write(blob.key)
+                for chunk in blob.chunks():
+                    self._file.write(chunk)
+                self._logged.add(blob.key)
+        self._append(_CHANGE, _pack((self._clock.seconds(), key, tenant_id,
+                                     change)))
+
+    def _append(self, kind, data):
+        """
+        Append a record, and sync it to disk now or soon.
+        """
+        self._file.write(_RECORD.pack(kind, len(data)))
+        self._file.write(data)
+        self._file.flush()
+        if self._sync_interval <= 0:
+            os.fsync(self._file.fileno())
+        elif self._pending_sync is None:
+            self._pending_sync = self._reactor.callLater(
+                self._sync_interval, self.sync)
+        if self.on_full is not None and self._file.tell() > self._max_size:
+            self.on_full()
+
+    def sync(self):
+        """
+        Sync the records appended so far to disk.
+        """
+        if self._pending_sync is not None:
+            if self._pending_sync.active():
+                self._pending_sync.cancel()
+            self._pending_sync = None
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def rotate(self):
+        """
+        Set the records logged so far aside, to be discarded once the state
+        they describe has been saved in a snapshot, and start a new log.  If
+        earlier records set aside have not yet been discarded, these are
+        added to them.
+        """
+        self.close()
+        rotated = self.path + ".old"
+        if os.path.exists(rotated):
+            with open(rotated, "ab") as old:
+                with open(self.path, "rb") as current:
+                    current.seek(len(LOG_MAGIC))
+                    shutil.copyfileobj(current, old)
+                old.flush()
+                os.fsync(old.fileno())
+            os.remove(self.path)
+        else:
+            os.rename(self.path, rotated)
+        self._logged = set()
+        self.open()
+
+    def discard_rotated(self):
+        """
+        Discard the records set aside by :obj:`rotate`.
+        """
+        rotated = self.path + ".old"
+        if os.path.exists(rotated):
+            os.remove(rotated)
+
+    def close(self):
+        """
+        Sync the log to disk and close it.
+        """
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+
+class SnapshotService(Service):
+    """
+    A service which saves snapshots of the state of a
+    :obj:`mimic.core.MimicCore` to a file, on request and when it stops.
+
+    With a :obj:`WriteAheadLog`, the service also replays the log at
+    startup, and then compacts it, in the background, by saving a snapshot;
+    and again whenever it grows full.
+    """
+
+    def __init__(self, core, path, cooperate=cooperate, wal=None):
+        """
+        :param str path: the path of the snapshot file.
+        :param cooperate: the function with which to write snapshots a step
+            at a time; by default, :obj:`twisted.internet.task.cooperate`.
+        :param WriteAheadLog wal: the log of changes made since the last
+            snapshot, if any.
+        """
+        self.core = core
+        self.path = path
+        self.wal = wal
+        self._cooperate = cooperate
+        self._saving = None
+        self._compact_on_start = False
+        if wal is not None:
+            wal.on_full = self.compact
+
+    @property
+    def saving(self):
+        """
+        Whether a snapshot is being written.
+        """
+        return self._saving is not None
+
+    def load(self):
+        """
+        Restore the state saved in the snapshot file, if there is one, then
+        replay the write-ahead log, if there is one, and start logging to it.
+
+        :return: the number of sessions restored from the snapshot.
+        """
+        restored = 0
+        if os.path.exists(self.path):
+            restored = load(self.core, self.path)
+        if self.wal is not None:
+            self._compact_on_start = replay(self.core, self.wal.path) > 0
+            self.wal.open()
+            self.core.sessions.journal = self.wal
+        return restored
+
+    def startService(self):
+        """
+        Start compacting the write-ahead log, if anything was replayed from
+        it.
+        """
+        Service.startService(self)
+        if self._compact_on_start:
+            self._compact_on_start = False
+            self.compact()
+
+    def compact(self):
+        """
+        Start saving a snapshot, unless one is being written already, to
+        compact the write-ahead log; log any failure.
+        """
+        if self._saving is None:
+            self.save().addErrback(
+                lambda reason: _log.warning(
+                    "Failed to save a snapshot to %(path)s: %(error)s",
+                    path=self.path, error=reason.getErrorMessage()))
+
+    def save(self):
+        """
+        Capture a snapshot of the current state, and start writing it.
+
+        :return: a :obj:`twisted.internet.defer.Deferred` which fires with
+            the :obj:`Snapshot` once it has been written.
+        :raise RuntimeError: if a snapshot is already being written.
+        """
+        if self._saving is not None:
+            raise RuntimeError("A snapshot is already being written.")
+        snapshot = self._capture()
+        self._saving = self._cooperate(snapshot.write(self.path)).whenDone()
+
+        def written(result):
+            self._saving = None
+            self._written(snapshot)
+            return snapshot
+
+        def failed(reason):
+            self._saving = None
+            return reason
+        return self._saving.addCallbacks(written, failed)
+
+    def _capture(self):
+        """
+        Capture a snapshot of the current state, setting aside the records
+        of the write-ahead log which it makes redundant.
+        """
+        snapshot = Snapshot(self.core)
+        if self.wal is not None:
+            self.wal.rotate()
+        return snapshot
+
+    def _written(self, snapshot):
+        """
+        Log that a snapshot has been written, and discard the records of the
+        write-ahead log set aside when it was captured.
+        """
+        if self.wal is not None:
+            self.wal.discard_rotated()
+        _log.info("Saved %(sessions)d sessions and %(blobs)d blobs to "
+                  "%(path)s", sessions=snapshot.sessions,
+                  blobs=snapshot.blobs, path=self.path)
+
+    def _save_now(self):
+        """
+        Capture and write a snapshot all at once.
+        """
+        snapshot = self._capture()
+        for step in snapshot.write(self.path):
+            pass
+        self._written(snapshot)
+        if self.wal is not None:
+            self.wal.close()
+
+    def stopService(self):
+        """
+        Save a snapshot of the final state, all at once, since there are no
+        more requests to serve; but first, let any snapshot being written
+        finish.
+        """
+        Service.stopService(self)
+        if self._saving is not None:
+            return self._saving.addBoth(lambda ignored: self._save_now())
+        self._save_now()
@@ -1,37 +1,199 @@
 """
 Twisted Application plugin for Mimic
 """
+import binascii
+import os
+import tempfile
+
 from twisted.application.strports import service
 from twisted.application.service import MultiService
 from twisted.web.server import Site
 from twisted.python import usage
 from mimic.core import MimicCore
 from mimic.resource import MimicRoot
+from mimic.session import SQLiteSessionBackend
+from mimic.snapshot import SnapshotService, WriteAheadLog
+from mimic.util.logger import level_named, set_level, set_access_sample_rate
+from mimic.util.storage import set_memory_limit
+from mimic.workers import (
+    AdoptedPort, GatedResource, TenantRouter, TickGate, WorkerPool,
+    PUBLIC_FD, PRIVATE_FD, forwarded_request_factory)
 from twisted.internet.task import Clock
 
 
+def tcp_interface_and_port(description):
+    """
+    Get the interface and port from a TCP server endpoint description, such
+    as ``8900`` or ``tcp:8900:interface=127.0.0.1``.
+
+    :return: a 2-tuple of interface and port.
+    :raise: :obj:`usage.UsageError` if the description is not that of a TCP
+        server endpoint.
+    """
+    parts = description.split(":")
+    if parts[0] == "tcp":
+        parts = parts[1:]
+    interface = "0.0.0.0"
+    for part in parts[1:]:
+        if not part.startswith("interface="):
+            raise usage.UsageError(
+                "Unsupported listen option for workers: " + part)
+        interface = part[len("interface="):]
+    try:
+        return interface, int(parts[0])
+    except (IndexError, ValueError):
+        raise usage.UsageError(
+            "Workers can only listen on a TCP port, not " + description)
+
+
 class Options(usage.Options):
     """
     Options for Mimic
     """
-    optParameters = [['listen', 'l', '8900', 'The endpoint to listen on.']]
+    optParameters = [['listen', 'l', '8900', 'The endpoint to listen on.'],
+                     ['session-db', None, None,
+                      'Path of an SQLite database in which to keep sessions, '
+                      'shared with any other Mimic using the same path.'],
+                     ['log-level', None, 'info',
+                      'The least severe level of messages to log: debug, '
+                      'info, warning or error.'],
+                     ['access-log-sample', None, 0.0,
+                      'The fraction of requests, from 0 to 1, whose route '
+                      'and latency are logged.', float],
+                     ['state-file', None, None,
+                      'Path of a file to restore the state of Mimic from at '
+                      'startup, and to save it to when Mimic stops or a '
+                      'snapshot is requested.'],
+                     ['wal-file', None, None,
+                      'Path of a write-ahead log to record every change in '
+                      'as it is made, to be replayed after the state file '
+                      'at startup; requires --state-file.'],
+                     ['wal-sync-interval', None, 1.0,
+                      'The most seconds to wait before syncing changes '
+                      'written to the write-ahead log to disk; 0 syncs each '
+                      'change as it is written.', float],
+                     ['swift-memory-limit', None, 256,
+                      'The number of megabytes of Swift object data to keep '
+                      'in memory; any more is kept in temporary files.', int],
+                     ['workers', 'w', 1,
+                      'The number of worker processes to serve requests '
+                      'with; each tenant is served by one of them.', int],
+                     # The following are passed by the master process to each
+                     # of its workers.
+                     ['worker-index', None, None,
+                      'Internal: the index of this worker process.', int],
+                     ['worker-ports', None, None,
+                      'Internal: the private ports of all worker processes.'],
+                     ['service-id-seed', None, None,
+                      'Internal: the seed to derive service IDs from.']]
     optFlags = [['realtime', 'r',
                  'Make mimic advance time as real time advances; '
                  'disable the "tick" endpoint.']]
 
+    def postOptions(self):
+        """
+        Validate the logging, storage, persistence and worker options.
+        """
+        try:
+            level_named(self['log-level'])
+        except ValueError as e:
+            raise usage.UsageError(str(e))
+        if not 0 <= self['access-log-sample'] <= 1:
+            raise usage.UsageError(
+                "The access log sample must be between 0 and 1.")
+        if self['swift-memory-limit'] < 0:
+            raise usage.UsageError(
+                "The Swift memory limit must not be negative.")
+        if self['workers'] < 1:
+            raise usage.UsageError("There must be at least one worker.")
+        if self['wal-file'] is not None and self['state-file'] is None:
+            raise usage.UsageError(
+                "A write-ahead log requires a state file.")
+        if self['wal-sync-interval'] < 0:
+            raise usage.UsageError(
+                "The write-ahead log sync interval must not be negative.")
+        if self['workers'] > 1:
+            tcp_interface_and_port(self['listen'])
+            if self['state-file'] is not None:
+                raise usage.UsageError(
+                    "A state file cannot be used with more than one worker.")
+
+
+def makeWorkerPool(config):
+    """
+    Set up a service running ``config['workers']`` Mimic worker processes,
+    which share their sessions and service IDs.
+    """
+    from twisted.internet import reactor
+    interface, port = tcp_interface_and_port(config['listen'])
+    session_db = config['session-db']
+    temporary_directory = None
+    if session_db is None:
+        temporary_directory = tempfile.mkdtemp(prefix="mimic-sessions-")
+        session_db = os.path.join(temporary_directory, "sessions.sqlite")
+    worker_arguments = [
+        "--session-db", session_db,
+        "--service-id-seed", binascii.hexlify(os.urandom(16)).decode("ascii"),
+        "--log-level", config['log-level'],
+        "--access-log-sample", str(config['access-log-sample']),
+        "--swift-memory-limit", str(config['swift-memory-limit']),
+    ]
+    if config['realtime']:
+        worker_arguments.append("--realtime")
+    return WorkerPool(reactor, interface, port, config['workers'],
+                      worker_arguments, temporary_directory)
+
 
 def makeService(config):
     """
     Set up the otter-api service.
     """
+    set_level(level_named(config['log-level']))
+    set_access_sample_rate(config['access-log-sample'])
+    set_memory_limit(config['swift-memory-limit'] * 1024 * 1024)
+    if config['workers'] > 1 and config['worker-index'] is None:
+        return makeWorkerPool(config)
     s = MultiService()
     if config['realtime']:
         from twisted.internet import reactor as clock
     else:
         clock = Clock()
-    core = MimicCore.fromPlugins(clock)
-    root = MimicRoot(core, clock)
-    site = Site(root.app.resource())
-    site.displayTracebacks = False
-    service(config['listen'], site).setServiceParent(s)
+    session_backend = None
+    if config['session-db'] is not None:
+        session_backend = SQLiteSessionBackend(config['session-db'])
+    service_id_seed = config['service-id-seed']
+    if service_id_seed is None and config['state-file'] is not None:
+        # Keep the URIs of restored state the same from one run to the next.
+        service_id_seed = "state-file:" + os.path.abspath(config['state-file'])
+    core = MimicCore.fromPlugins(clock, session_backend=session_backend,
+                                 service_id_seed=service_id_seed)
+    snapshots = None
+    if config['state-file'] is not None:
+        wal = None
+        if config['wal-file'] is not None:
+            wal = WriteAheadLog(core, config['wal-file'],
+                                config['wal-sync-interval'])
+        snapshots = SnapshotService(core, config['state-file'], wal=wal)
+        snapshots.load()
+        snapshots.setServiceParent(s)
+    root = MimicRoot(core, clock, snapshots)
+    resource = root.app.resource()
+    if config['worker-index'] is None:
+        site = Site(resource)
+        site.displayTracebacks = False
+        service(config['listen'], site).setServiceParent(s)
+    else:
+        from twisted.internet import reactor
+        ports = [int(port) for port in config['worker-ports'].split(",")]
+        gate = TickGate(reactor)
+        public = Site(GatedResource(gate, TenantRouter(
+            reactor, resource, ports, config['worker-index'])))
+        public.displayTracebacks = False
+        public_port = AdoptedPort(reactor, PUBLIC_FD, public)
+        public_port.setServiceParent(s)
+        private = Site(GatedResource(gate, resource, control=True))
+        private.displayTracebacks = False
+        private.requestFactory = forwarded_request_factory(
+            public_port.port_number)
+        AdoptedPort(reactor, PRIVATE_FD, private).setServiceParent(s)
     return s
@@ -1,13 +1,17 @@
+import json
+
 from twisted.trial.unittest import SynchronousTestCase
 from twisted.internet.task import Clock
 
+from mimic import core as core_module
 from mimic.core import MimicCore
 from mimic.resource import MimicRoot
 from mimic.canned_responses.auth import (
-    get_token, HARD_CODED_TOKEN, HARD_CODED_USER_ID,
+    HARD_CODED_TOKEN, HARD_CODED_USER_ID,
     HARD_CODED_USER_NAME, HARD_CODED_ROLES,
-    get_endpoints
+    get_endpoints, get_token_json, service_catalog
 )
+from mimic.rest.nova_api import NovaApi
 from mimic.test.dummy import ExampleAPI
 from mimic.test.helpers import request, json_request
 from mimic.catalog import Entry, Endpoint
@@ -71,17 +75,19 @@ class CatalogGenerationTests(SynchronousTestCase):
 
     def test_tokens_response(self):
         """
-        :func:`get_token` returns JSON-serializable data in the format
-        presented by a ``POST /v2.0/tokens`` API request; i.e. the normal
-        user-facing service catalog generation.
+        :func:`get_token_json`, given the serialization of the result of
+        :func:`service_catalog`, returns JSON in the format presented by a
+        ``POST /v2.0/tokens`` API request; i.e. the normal user-facing
+        service catalog generation.
         """
         tenant_id = 'abcdefg'
+        catalog_json = json.dumps(service_catalog(
+            tenant_id, entry_generator=example_endpoints(lambda: 1),
+            prefix_for_endpoint=lambda e: 'prefix'))
         self.assertEqual(
-            get_token(
-                tenant_id=tenant_id, timestamp=lambda dt: "<<<timestamp>>>",
-                entry_generator=example_endpoints(lambda: 1),
-                prefix_for_endpoint=lambda e: 'prefix'
-            ),
+            json.loads(get_token_json(
+                tenant_id, catalog_json,
+                timestamp=lambda dt: "<<<timestamp>>>")),
             {
                 "access": {
                     "token": {
@@ -634,3 +640,83 @@ class GetEndpointsForTokenTests(SynchronousTestCase):
                                 "{ bad request: }"))
 
         self.assertEqual(400, response.code)
+
+
+class CatalogCachingTests(SynchronousTestCase):
+    """
+    Tests for reuse of the service catalog across authentication requests.
+    """
+
+    def authenticate(self, root, username):
+        """
+        Authenticate as the given user against the tenant ``turtlepower``.
+        """
+        return self.successResultOf(json_request(
+            self, root, "POST", "http://mybase/identity/v2.0/tokens",
+            {
+                "auth": {
+                    "passwordCredentials": {
+                        "username": username,
+                        "password": "theUsersPassword"
+                    },
+                    "tenantId": "turtlepower"
+                }
+            }
+        ))[1]
+
+    def test_catalog_generated_once_per_tenant(self):
+        """
+        Authenticating a second time with the same tenant yields the same
+        service catalog without generating it again, but with the token and
+        user of the new session.
+        """
+        core = MimicCore(Clock(), [ExampleAPI()])
+        root = MimicRoot(core).app.resource()
+        first = self.authenticate(root, "leonardo")
+
+        def fail(*args):
+            self.fail("catalog should not be regenerated")
+        self.patch(core, "entries_for_tenant", fail)
+        second = self.authenticate(root, "raphael")
+
+        self.assertEqual(first['access']['serviceCatalog'],
+                         second['access']['serviceCatalog'])
+        self.assertNotEqual(first['access']['token']['id'],
+                            second['access']['token']['id'])
+        self.assertEqual("raphael", second['access']['user']['name'])
+
+    def test_catalog_json_forgotten_with_catalog(self):
+        """
+        The serialized service catalog is forgotten along with the catalog
+        it was made from, so authentication does not keep serving it once
+        listing endpoints would generate a new catalog.
+        """
+        self.patch(core_module, "CATALOG_CACHE_SIZE", 1)
+        core = MimicCore(Clock(), [ExampleAPI()])
+        root = MimicRoot(core).app.resource()
+        self.authenticate(root, "leonardo")
+        self.successResultOf(json_request(
+            self, root, "GET",
+            "http://otherbase/identity/v2.0/tokens/1234567890/endpoints"))
+
+        generated = []
+        entries_for_tenant = core.entries_for_tenant
+
+        def record(*args):
+            generated.append(args[0])
+            return entries_for_tenant(*args)
+        self.patch(core, "entries_for_tenant", record)
+        self.authenticate(root, "leonardo")
+        self.assertEqual(["turtlepower"], generated)
+
+    def test_endpoint_ids_stable(self):
+        """
+        The endpoint IDs for a tenant are the same every time its endpoints are
+        listed.
+        """
+        core = MimicCore(Clock(), [NovaApi()])
+        root = MimicRoot(core).app.resource()
+        uri = "http://mybase/identity/v2.0/tokens/1234567890/endpoints"
+        first = self.successResultOf(json_request(self, root, "GET", uri))[1]
+        second = self.successResultOf(json_request(self, root, "GET", uri))[1]
+        self.assertEqual(first, second)
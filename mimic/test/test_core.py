@@ -5,7 +5,10 @@ from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
 
 from mimic.core import MimicCore
-from mimic.plugins import nova_plugin, loadbalancer_plugin, swift_plugin
+from mimic.plugins import (
+    dns_plugin, nova_plugin, loadbalancer_plugin, swift_plugin)
+from mimic.test.dummy import ExampleAPI
+from mimic.test.helpers import request
 
 
 class CoreBuildingTests(SynchronousTestCase):
@@ -25,11 +28,12 @@ class CoreBuildingTests(SynchronousTestCase):
     def test_from_plugin_includes_all_plugins(self):
         """
         Using the :func:`MimicRoot.fromPlugin` creator for a
-        :class:`MimicCore`, the nova and loadbalancer plugins are included.
+        :class:`MimicCore`, the nova, loadbalancer, swift and dns plugins are
+        included.
         """
         core = MimicCore.fromPlugins(Clock())
         plugin_apis = set((nova_plugin.nova, loadbalancer_plugin.loadbalancer,
-                           swift_plugin.swift))
+                           swift_plugin.swift, dns_plugin.dns))
         self.assertEqual(
             plugin_apis,
             set(core._uuid_to_api.values()))
@@ -37,3 +41,124 @@ class CoreBuildingTests(SynchronousTestCase):
             len(plugin_apis),
             len(list(core.entries_for_tenant('any_tenant', {},
                                              'http://mimic'))))
+
+    def test_service_id_seed(self):
+        """
+        :class:`MimicCore` objects created with the same service ID seed use
+        the same service IDs, which are still distinct for each API.
+        """
+        one = MimicCore(Clock(), [ExampleAPI(), ExampleAPI()],
+                        service_id_seed="seed")
+        two = MimicCore(Clock(), [ExampleAPI(), ExampleAPI()],
+                        service_id_seed="seed")
+        self.assertEqual(2, len(one._uuid_to_api))
+        self.assertEqual(set(one._uuid_to_api), set(two._uuid_to_api))
+        other = MimicCore(Clock(), [ExampleAPI()], service_id_seed="other")
+        self.assertFalse(set(one._uuid_to_api) & set(other._uuid_to_api))
+
+
+class ServiceWithRegionTests(SynchronousTestCase):
+    """
+    Tests for :func:`MimicCore.service_with_region`
+    """
+    def _one_service(self, core):
+        """
+        Get the service ID and region of the only API in the given core.
+        """
+        service_id, api = list(core._uuid_to_api.items())[0]
+        region = api.catalog_entries(None)[0].endpoints[0].region
+        return service_id, region
+
+    def test_resource_reused_for_same_key(self):
+        """
+        Asking for the resource for the same service ID, region and base URI
+        twice returns the same resource, without building a new one.
+        """
+        core = MimicCore(Clock(), [ExampleAPI()])
+        service_id, region = self._one_service(core)
+        first = core.service_with_region(region, service_id, "http://mimic/")
+        second = core.service_with_region(region, service_id, "http://mimic/")
+        self.assertIdentical(first, second)
+
+    def test_resource_distinct_per_base_uri(self):
+        """
+        Resources built for different base URIs are distinct, since the URI
+        prefix they were created with differs.
+        """
+        example = ExampleAPI()
+        core = MimicCore(Clock(), [example])
+        service_id, region = self._one_service(core)
+        first = core.service_with_region(region, service_id, "http://one/")
+        second = core.service_with_region(region, service_id, "http://two/")
+        self.assertNotIdentical(first, second)
+        self.assertEqual(
+            "http://two/mimicking/{0}/{1}/".format(service_id, region),
+            example.store['uri_prefix'])
+
+    def test_unknown_service_not_cached(self):
+        """
+        An unknown service ID yields ``None`` and nothing is cached for it.
+        """
+        core = MimicCore(Clock(), [ExampleAPI()])
+        self.assertIdentical(
+            None, core.service_with_region("ORD", "nope", "http://mimic/"))
+        self.assertEqual(0, len(core._region_resources))
+
+    def test_resource_cache_is_bounded(self):
+        """
+        No more than ``resource_cache_size`` resources are kept; the oldest
+        one is rebuilt if it is requested again after being evicted.
+        """
+        core = MimicCore(Clock(), [ExampleAPI()], resource_cache_size=2)
+        service_id, region = self._one_service(core)
+        first = core.service_with_region(region, service_id, "http://one/")
+        core.service_with_region(region, service_id, "http://two/")
+        core.service_with_region(region, service_id, "http://three/")
+        self.assertEqual(2, len(core._region_resources))
+        self.assertNotIdentical(
+            first,
+            core.service_with_region(region, service_id, "http://one/"))
+
+    def test_dns_resource(self):
+        """
+        The DNS API builds a resource for its region like every other API;
+        it has no routes yet, so requests to it are not found.
+        """
+        core = MimicCore(Clock(), [dns_plugin.dns])
+        service_id, region = self._one_service(core)
+        resource = core.service_with_region(region, service_id,
+                                            "http://mimic/")
+        response = self.successResultOf(
+            request(self, resource, b"GET", b"/v1/domains"))
+        self.assertEqual(404, response.code)
+
+
+class URIForServiceTests(SynchronousTestCase):
+    """
+    Tests for :func:`MimicCore.uri_for_service`
+    """
+    def test_uri_with_and_without_region(self):
+        """
+        The URI prefix includes the service ID, and the region if there is one.
+        """
+        core = MimicCore(Clock(), [])
+        self.assertEqual("http://mimic/mimicking/some_id/ORD/",
+                         core.uri_for_service("ORD", "some_id",
+                                              "http://mimic/"))
+        self.assertEqual("http://mimic/mimicking/some_id/",
+                         core.uri_for_service(None, "some_id",
+                                              "http://mimic/"))
+
+    def test_uri_computed_once(self):
+        """
+        Once a URI prefix has been computed for a base URI, service ID and
+        region, it is reused rather than computed again.
+        """
+        core = MimicCore(Clock(), [])
+        first = core.uri_for_service("ORD", "some_id", "http://mimic/")
+
+        def fail(*args):
+            self.fail("URI prefix should not be recomputed")
+        self.patch(core, "_build_uri_for_service", fail)
+        self.assertEqual(first, core.uri_for_service("ORD", "some_id",
+                                                     "http://mimic/"))
@@ -5,8 +5,13 @@ Unit tests for the
 import json
 import treq
 
+from twisted.internet.task import Clock
+
 from twisted.trial.unittest import SynchronousTestCase
-from mimic.canned_responses.loadbalancer import load_balancer_example
+from mimic.canned_responses.loadbalancer import (
+    Region_Tenant_CLBs, add_load_balancer, add_node, del_load_balancer,
+    delete_node, get_load_balancers, get_nodes, list_load_balancers,
+    load_balancer_example)
 from mimic.test.fixtures import APIMockHelper, TenantAuthentication
 from mimic.rest.loadbalancer_api import LoadBalancerApi
 from mimic.test.helpers import request_with_content, request
@@ -75,6 +80,249 @@ class ResponseGenerationTests(SynchronousTestCase):
         self.assertEqual(actual, lb_example)
 
 
+class NodeIndexTests(SynchronousTestCase):
+    """
+    Tests for the indexes of the nodes on load balancers kept by
+    :obj:`Region_Tenant_CLBs`.
+    """
+
+    def setUp(self):
+        """
+        Create a store with a load balancer created with one node, and add
+        three more.
+        """
+        self.store = Region_Tenant_CLBs(Clock())
+        add_load_balancer("tenant", self.store,
+                          {"name": "lb", "protocol": "HTTP",
+                           "nodes": [self.node(0)]}, 1, 0)
+        add_node(self.store, [self.node(1), self.node(2), self.node(3)], 1, 0)
+        self.ids = [node["id"] for node in self.store.node_list(1)]
+
+    def node(self, index):
+        """
+        Describe a node to add with the given index.
+        """
+        return {"address": "10.0.0.{0}".format(index), "port": 80,
+                "condition": "ENABLED"}
+
+    def test_lookup(self):
+        """
+        Nodes can be looked up by ID, and each has a distinct ID.
+        """
+        self.assertEqual(4, len(set(self.ids)))
+        for index, node_id in enumerate(self.ids):
+            self.assertEqual(
+                ({"node": self.store.node_list(1)[index]}, 200),
+                get_nodes(self.store, 1, node_id))
+        self.assertEqual(404, get_nodes(self.store, 1, -1)[1])
+
+    def test_delete_preserves_order(self):
+        """
+        Deleting nodes preserves the order of the others, and frees their
+        addresses for new nodes.
+        """
+        self.assertEqual((None, 202), delete_node(self.store, 1, self.ids[1], 0))
+        self.assertEqual(404, delete_node(self.store, 1, self.ids[1], 0)[1])
+        self.assertEqual([self.ids[0], self.ids[2], self.ids[3]],
+                         [node["id"] for node in self.store.node_list(1)])
+        self.assertFalse(self.store.has_node_at(1, "10.0.0.1", 80))
+        self.assertEqual(200, add_node(self.store, [self.node(1)], 1, 0)[1])
+        self.assertEqual(["10.0.0.0", "10.0.0.2", "10.0.0.3", "10.0.0.1"],
+                         [node["address"] for node in self.store.node_list(1)])
+
+    def test_delete_last_node(self):
+        """
+        Deleting every node removes the list of nodes from the load balancer.
+        """
+        for node_id in self.ids:
+            delete_node(self.store, 1, node_id, 0)
+        self.assertNotIn("nodes", self.store.with_nodes(1))
+        self.assertEqual({}, self.store.nodes[1])
+
+    def test_duplicates(self):
+        """
+        Adding a node with the address and port of an existing node, or two
+        nodes with the same address and port, fails with 413 and adds
+        nothing.
+        """
+        self.assertEqual(413, add_node(self.store, [self.node(3)], 1, 0)[1])
+        self.assertEqual(
+            413, add_node(self.store, [self.node(4), self.node(4)], 1, 0)[1])
+        self.assertEqual(4, len(self.store.node_list(1)))
+        self.assertFalse(self.store.has_node_at(1, "10.0.0.4", 80))
+
+    def test_id_collision(self):
+        """
+        Adding nodes whose IDs collide with each other or with those of
+        existing nodes raises :obj:`ValueError` and adds nothing, rather than
+        renaming any node.
+        """
+        node = dict(self.node(4), id=self.ids[0])
+        self.assertRaises(ValueError, self.store.add_nodes, 1, [node])
+        self.assertRaises(ValueError, self.store.add_nodes, 1,
+                          [dict(self.node(4), id=-1),
+                           dict(self.node(5), id=-1)])
+        self.assertEqual(self.ids,
+                         [each["id"] for each in self.store.node_list(1)])
+        self.assertEqual("10.0.0.0", self.store.nodes[1][self.ids[0]]["address"])
+        self.assertFalse(self.store.has_node_at(1, "10.0.0.4", 80))
+
+
+class StateMachineTests(SynchronousTestCase):
+    """
+    Tests for the transitions of load balancers between statuses made by
+    :obj:`Region_Tenant_CLBs`.
+    """
+
+    def setUp(self):
+        """
+        Create a store whose transitions are scheduled on a fake clock.
+        """
+        self.clock = Clock()
+        self.store = Region_Tenant_CLBs(self.clock)
+
+    def create(self, lb_id, **metadata):
+        """
+        Create a load balancer with the given metadata, at the current time.
+        """
+        add_load_balancer("tenant", self.store,
+                          {"name": "lb", "protocol": "HTTP",
+                           "metadata": [{"key": key, "value": value}
+                                        for key, value in metadata.items()]},
+                          lb_id, self.clock.seconds())
+
+    def test_build_times_out(self):
+        """
+        A load balancer being built becomes ``ACTIVE`` when the clock reaches
+        the end of its build time, whether or not it is looked at, and its
+        updated time is the time it became ``ACTIVE``.
+        """
+        self.create(1, lb_building=5)
+        self.clock.advance(4.9)
+        self.assertEqual("BUILD", self.store.lbs[1]["status"])
+        self.clock.advance(0.1)
+        self.assertEqual("ACTIVE", self.store.lbs[1]["status"])
+        self.assertEqual(5, self.store.lbs[1]["updated"]["time"])
+
+    def test_reads_have_no_side_effects(self):
+        """
+        Getting and listing load balancers changes neither their statuses nor
+        their versions.
+        """
+        self.create(1, lb_building=5)
+        self.clock.advance(10)
+        version = self.store.version
+        get_load_balancers(self.store, 1)
+        list_load_balancers("tenant", self.store)
+        self.assertEqual(version, self.store.version)
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_one_tick_makes_every_due_transition(self):
+        """
+        Advancing the clock past several transitions makes all of them, each
+        timed from when the previous one became due.
+        """
+        self.create(1, lb_pending_delete=10)
+        self.create(2, lb_building=5)
+        self.assertEqual((b'', 202), del_load_balancer(self.store, 1, 0))
+        self.assertEqual("PENDING-DELETE", self.store.lbs[1]["status"])
+        self.clock.advance(3610)
+        self.assertEqual([2], list(self.store.lbs))
+        self.assertEqual("ACTIVE", self.store.lbs[2]["status"])
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_removal_cancels_transition(self):
+        """
+        Removing a load balancer cancels its scheduled transition.
+        """
+        self.create(1, lb_building=5)
+        self.store.remove(1)
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+
+class ListTests(SynchronousTestCase):
+    """
+    Tests for listing load balancers, directly from a
+    :obj:`Region_Tenant_CLBs` and through the plugin API.
+    """
+
+    def setUp(self):
+        """
+        Create a store holding five load balancers, created out of the order
+        of their IDs.
+        """
+        self.store = Region_Tenant_CLBs(Clock())
+        for lb_id in [30, 10, 50, 20, 40]:
+            add_load_balancer("tenant", self.store,
+                              {"name": "lb", "protocol": "HTTP"}, lb_id, 0)
+
+    def list_ids(self, **kwargs):
+        """
+        List the load balancers in the store, returning their IDs.
+        """
+        body, code = list_load_balancers("tenant", self.store, **kwargs)
+        self.assertEqual(200, code)
+        return [lb["id"] for lb in body["loadBalancers"]]
+
+    def test_order_and_paging(self):
+        """
+        Load balancers are listed in order of their IDs, starting after the
+        ``marker`` and up to the ``limit``, if given.
+        """
+        self.assertEqual([10, 20, 30, 40, 50], self.list_ids())
+        self.assertEqual([10, 20], self.list_ids(limit="2"))
+        self.assertEqual([30, 40], self.list_ids(limit="2", marker="20"))
+        self.assertEqual([30, 40, 50], self.list_ids(marker="25"))
+        self.store.remove(30)
+        self.assertEqual([20, 40], self.list_ids(limit="2", marker="10"))
+
+    def test_invalid_paging(self):
+        """
+        A ``limit`` which is not a non-negative integer, or a ``marker`` which
+        is not an integer, is a bad request.
+        """
+        for kwargs in [{"limit": "x"}, {"limit": "-1"}, {"marker": "x"}]:
+            self.assertEqual(
+                400, list_load_balancers("tenant", self.store, **kwargs)[1])
+
+    def test_summaries_cached_per_version(self):
+        """
+        The entry for a load balancer is shared between lists until the load
+        balancer changes.
+        """
+        first = list_load_balancers("tenant", self.store)[0]["loadBalancers"]
+        second = list_load_balancers("tenant", self.store)[0]["loadBalancers"]
+        self.assertIs(first[0], second[0])
+        add_node(self.store, [{"address": "10.0.0.1", "port": 80,
+                               "condition": "ENABLED"}], 10, 0)
+        third = list_load_balancers("tenant", self.store)[0]["loadBalancers"]
+        self.assertEqual(1, third[0]["nodeCount"])
+        self.assertIs(first[1], third[1])
+
+    def test_next_link(self):
+        """
+        Listing with a ``limit`` through the API links each full page to the
+        next.
+        """
+        helper = APIMockHelper(self, [LoadBalancerApi()])
+        for index in range(3):
+            self.successResultOf(request_with_content(
+                self, helper.root, "POST", helper.uri + '/loadbalancers',
+                json.dumps({"loadBalancer": {"name": "lb", "protocol": "HTTP"}})))
+        url = helper.uri + '/loadbalancers?limit=2'
+        pages = []
+        while url is not None:
+            response, content = self.successResultOf(request_with_content(
+                self, helper.root, "GET", url))
+            self.assertEqual(200, response.code)
+            body = json.loads(content)
+            pages.append([lb["id"] for lb in body["loadBalancers"]])
+            url = body["links"][0]["href"] if "links" in body else None
+        self.assertEqual(2, len(pages[0]))
+        self.assertEqual(sorted(pages[0] + pages[1]), pages[0] + pages[1])
+        self.assertEqual(3, len(pages[0] + pages[1]))
+
+
 class LoadbalancerAPITests(SynchronousTestCase):
     """
     Tests for the Loadbalancer plugin API
@@ -233,6 +481,72 @@ class LoadbalancerAPITests(SynchronousTestCase):
         self.assertEqual(get_lb_response.code, 200)
         self.assertEqual(get_lb_response_body['loadBalancer']['id'], lb_id)
 
+    def test_loadbalancer_etag(self):
+        """
+        A load balancer and its nodes carry ETags, which change when nodes
+        are added, and conditional requests matching the current ETag are
+        answered with 304.
+        """
+        lb_id = self._create_loadbalancer()
+        etags = {}
+        for path in ['/loadbalancers/{0}', '/loadbalancers/{0}/nodes',
+                     '/loadbalancers']:
+            path = self.uri + path.format(lb_id)
+            response = self.successResultOf(request(self, self.root, "GET", path))
+            [etags[path]] = response.headers.getRawHeaders("etag")
+            response = self.successResultOf(request(
+                self, self.root, "GET", path,
+                headers={"If-None-Match": [etags[path]]}))
+            self.assertEqual(304, response.code)
+        self.successResultOf(request(
+            self, self.root, "POST",
+            self.uri + '/loadbalancers/' + str(lb_id) + '/nodes',
+            json.dumps({"nodes": [{"address": "127.0.0.1", "port": 80,
+                                   "condition": "ENABLED"}]})))
+        for path, etag in etags.items():
+            response = self.successResultOf(request(
+                self, self.root, "GET", path,
+                headers={"If-None-Match": [etag]}))
+            self.assertEqual(200, response.code)
+            self.assertNotEqual([etag], response.headers.getRawHeaders("etag"))
+
+    def test_list_loadbalancers_node_count(self):
+        """
+        The load balancer list reports the number of nodes on each load
+        balancer, however many times nodes are added.
+        """
+        lb_id = self._create_loadbalancer()
+        for address in ["127.0.0.1", "127.0.0.2"]:
+            self.successResultOf(request(
+                self, self.root, "POST",
+                self.uri + '/loadbalancers/' + str(lb_id) + '/nodes',
+                json.dumps({"nodes": [{"address": address, "port": 80,
+                                       "condition": "ENABLED"}]})))
+        list_lb = request(self, self.root, "GET", self.uri + '/loadbalancers')
+        [lb] = self.successResultOf(treq.json_content(
+            self.successResultOf(list_lb)))['loadBalancers']
+        self.assertEqual(2, lb['nodeCount'])
+        self.assertNotIn('tenant_id', lb)
+
+    def test_loadbalancer_times_formatted(self):
+        """
+        The created and updated times of load balancers are reported as
+        timestamps, whether one is fetched or listed.
+        """
+        self.helper.clock.advance(1.5)
+        lb_id = self._create_loadbalancer()
+        get_lb = request(self, self.root, "GET", self.uri + '/loadbalancers/' + str(lb_id))
+        lb = self.successResultOf(treq.json_content(
+            self.successResultOf(get_lb)))['loadBalancer']
+        list_lb = request(self, self.root, "GET", self.uri + '/loadbalancers')
+        listed = self.successResultOf(treq.json_content(
+            self.successResultOf(list_lb)))['loadBalancers'][0]
+        for each in (lb, listed):
+            self.assertEqual({"time": "1970-01-01T00:00:01.500000Z"},
+                             each['created'])
+            self.assertEqual({"time": "1970-01-01T00:00:01.500000Z"},
+                             each['updated'])
+
     def test_get_non_existant_loadbalancer(self):
         """
         Test to verify :func:`get_load_balancers` for a non existant load balancer id.
@@ -0,0 +1,144 @@
+"""
+Tests for :mod:`mimic.util.logger`
+"""
+
+from klein import Klein
+
+from twisted.python import log
+from twisted.trial.unittest import SynchronousTestCase
+
+from mimic.rest.mimicapp import MimicApp
+from mimic.test.helpers import request
+from mimic.util import logger
+
+
+class LoggerTests(SynchronousTestCase):
+    """
+    Tests for :obj:`logger.Logger`
+    """
+
+    def setUp(self):
+        """
+        Observe log events, and restore the log level afterwards.
+        """
+        self.events = []
+        log.addObserver(self.events.append)
+        self.addCleanup(log.removeObserver, self.events.append)
+        self.patch(logger, "_level", logger.INFO)
+        self.log = logger.Logger("mimic.test")
+
+    def test_level(self):
+        """
+        Messages less severe than the current level are discarded; others
+        are logged with their level and system.
+        """
+        self.log.debug("hidden %(value)s", value=1)
+        self.log.info("shown %(value)s", value=2)
+        self.log.warning("shown %(value)s", value=3)
+        self.log.error("shown %(value)s", value=4)
+        self.assertEqual(
+            [("shown 2", logger.INFO, "mimic.test"),
+             ("shown 3", logger.WARNING, "mimic.test"),
+             ("shown 4", logger.ERROR, "mimic.test")],
+            [(log.textFromEventDict(event), event["logLevel"],
+              event["system"]) for event in self.events])
+        self.assertFalse(self.log.enabled(logger.DEBUG))
+        logger.set_level(logger.DEBUG)
+        self.assertTrue(self.log.enabled(logger.DEBUG))
+        self.log.debug("now shown")
+        self.assertEqual("now shown", log.textFromEventDict(self.events[-1]))
+
+    def test_level_named(self):
+        """
+        :obj:`logger.level_named` finds levels by name, regardless of case.
+        """
+        self.assertEqual(logger.DEBUG, logger.level_named("DEBUG"))
+        self.assertEqual(logger.ERROR, logger.level_named("error"))
+        self.assertRaises(ValueError, logger.level_named, "loud")
+
+
+class Routes(object):
+    """
+    An app with a single route.
+    """
+    app = MimicApp()
+
+    @app.route('/things/<string:thing>', methods=['GET'])
+    def get_thing(self, request, thing):
+        """
+        Respond with the name of the thing.
+        """
+        request.setResponseCode(201)
+        return thing
+
+
+class AccessLogTests(SynchronousTestCase):
+    """
+    Tests for the access log of routes of a :obj:`MimicApp`.
+    """
+
+    def setUp(self):
+        """
+        Observe access log events.
+        """
+        self.events = []
+
+        def observe(event):
+            if event.get("system") == "mimic.access":
+                self.events.append(event)
+        log.addObserver(observe)
+        self.addCleanup(log.removeObserver, observe)
+        self.root = Routes().app.resource()
+
+    def get(self):
+        """
+        Request a thing.
+        """
+        self.successResultOf(request(self, self.root, "GET", "/things/a"))
+
+    def test_sampled(self):
+        """
+        When every request is sampled, each is logged with its method,
+        route, response code and latency.
+        """
+        self.patch(logger, "_access_sample_rate", 1)
+        self.get()
+        [event] = self.events
+        self.assertEqual(("GET", "/things/<string:thing>", 201),
+                         (event["method"], event["route"], event["code"]))
+        self.assertTrue(event["latency"] >= 0)
+        self.assertEqual(logger.INFO, event["logLevel"])
+
+    def test_route_returns_registered(self):
+        """
+        :obj:`MimicApp.route` returns whatever Klein's route decorator
+        returns for the timed handler.
+        """
+        registered = []
+
+        def route(app, url, *args, **kwargs):
+            """
+            Return a decorator which records its handler, and returns a
+            marker.
+            """
+            def deco(f):
+                registered.append(f)
+                return "registered"
+            return deco
+
+        self.patch(Klein, "route", route)
+
+        def handler(request):
+            """
+            A handler.
+            """
+        self.assertEqual("registered", MimicApp().route("/")(handler))
+        self.assertEqual("handler", registered[0].__name__)
+
+    def test_not_sampled(self):
+        """
+        No requests are logged when the sample rate is 0.
+        """
+        self.patch(logger, "_access_sample_rate", 0)
+        self.get()
+        self.assertEqual([], self.events)
@@ -3,11 +3,12 @@ import itertools
 import json
 import treq
 
+from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
 
-from mimic.canned_responses.nova import server_template
+from mimic.canned_responses.nova import server_template, Server
 from mimic.test.helpers import json_request, request
-from mimic.rest.nova_api import NovaApi
+from mimic.rest.nova_api import NovaApi, S_Cache
 from mimic.test.fixtures import APIMockHelper, TenantAuthentication
 
 
@@ -187,6 +188,222 @@ class ResponseGenerationTests(SynchronousTestCase):
         })
 
 
+class ServerTests(SynchronousTestCase):
+    """
+    Tests for :obj:`Server`.
+    """
+
+    def test_json(self):
+        """
+        :obj:`Server.json` renders the same JSON as :obj:`server_template`,
+        except for the current status and update time.
+        """
+        server_info = {"flavorRef": "some_flavor", "imageRef": "some_image",
+                       "name": "some_server_name",
+                       "metadata": {"some_key": "some_value"}}
+        prefix = "http://mimic.example.com/services/region/compute/"
+        counter = itertools.count(1)
+        server = Server("some_tenant", server_info, "some_server_id",
+                        "BUILD", 1.5, prefix,
+                        ipsegment=lambda: next(counter))
+        counter = itertools.count(1)
+        expected = server_template("some_tenant", server_info,
+                                   "some_server_id", "BUILD",
+                                   "1970-01-01T00:00:01.500000Z",
+                                   lambda: next(counter), prefix)
+        self.assertEqual(json.dumps(expected), json.dumps(server.json()))
+        server.status = "ACTIVE"
+        server.updated = 3
+        expected["status"] = "ACTIVE"
+        expected["updated"] = "1970-01-01T00:00:03.000000Z"
+        self.assertEqual(json.dumps(expected), json.dumps(server.json()))
+        self.assertEqual({"name": "some_server_name",
+                          "links": expected["links"],
+                          "id": "some_server_id"},
+                         server.brief_json())
+
+    def test_slots(self):
+        """
+        :obj:`Server` has no per-instance ``__dict__``.
+        """
+        server = Server("some_tenant", {"name": "a", "flavorRef": "b"}, "id",
+                        "ACTIVE", 0, "http://mimic.example.com/")
+        self.assertFalse(hasattr(server, "__dict__"))
+        self.assertEqual({}, server.metadata)
+
+
+class ServerCacheTests(SynchronousTestCase):
+    """
+    Tests for :obj:`S_Cache`.
+    """
+
+    def setUp(self):
+        """
+        Create a server cache holding a few servers.
+        """
+        self.clock = Clock()
+        self.s_cache = S_Cache(self.clock)
+        for seconds, (server_id, name, status) in enumerate(
+                [("c", "web-1", "ACTIVE"),
+                 ("a", "web-2", "BUILD"),
+                 ("b", "db-1", "ACTIVE")]):
+            self.add(server_id, name, status, seconds)
+
+    def add(self, server_id, name, status="ACTIVE", seconds=10):
+        """
+        Add a server to the cache, updated at the given time.
+        """
+        self.s_cache[server_id] = Server(
+            "tenant", {"name": name, "flavorRef": "flavor"}, server_id,
+            status, seconds, "http://mimic.example.com/")
+
+    def test_ordered(self):
+        """
+        Servers are iterated over, and listed, in the order they were added,
+        even after some are removed or replaced.
+        """
+        self.assertEqual(["c", "a", "b"], list(self.s_cache))
+        del self.s_cache["c"]
+        self.add("d", "web-3")
+        self.add("a", "web-2")
+        self.assertEqual(["b", "d", "a"], list(self.s_cache))
+        self.assertEqual(["b", "d", "a"],
+                         [server.id for server in self.s_cache.servers()])
+        self.assertEqual(["d", "a"],
+                         [server.id for server in
+                          self.s_cache.servers(self.s_cache.ids_named("web"))])
+
+    def test_pages(self):
+        """
+        :obj:`S_Cache.servers` can list the servers after a marker, updated
+        after a given time, or up to a limit, with or without a set of IDs
+        to choose from.
+        """
+        def ids(**kwargs):
+            return [server.id for server in self.s_cache.servers(**kwargs)]
+        self.assertEqual(["a", "b"], ids(marker="c"))
+        self.assertEqual(["c", "a"], ids(limit=2))
+        self.assertEqual(["a"], ids(marker="c", limit=1))
+        self.assertEqual(["b"], ids(updated_since=1.5))
+        self.assertEqual(["a", "b"], ids(updated_since=1))
+        self.assertEqual(["b"], ids(server_ids=["b", "c"], marker="c"))
+        self.assertEqual(["c"], ids(server_ids=["b", "c"], limit=1))
+        del self.s_cache["c"]
+        del self.s_cache["a"]
+        self.assertEqual(["b"], ids(updated_since=1))
+
+    def test_dict_methods(self):
+        """
+        The methods :obj:`S_Cache` inherits from :obj:`dict` keep its
+        indexes up to date, and list servers in order.
+        """
+        self.assertEqual(["c", "a", "b"], self.s_cache.keys())
+        self.assertEqual(["c", "a", "b"],
+                         [server.id for server in self.s_cache.values()])
+        self.assertEqual(["c", "a", "b"],
+                         [server_id for (server_id, server)
+                          in self.s_cache.items()])
+        self.assertEqual("a", self.s_cache.pop("a").id)
+        self.assertEqual(None, self.s_cache.pop("a", None))
+        self.assertRaises(KeyError, self.s_cache.pop, "a")
+        self.assertEqual("b", self.s_cache.popitem()[0])
+        other = S_Cache(self.clock)
+        other["d"] = Server("tenant", {"name": "db-2", "flavorRef": "f"}, "d",
+                            "ERROR", 20, "http://mimic.example.com/")
+        self.s_cache.update(other)
+        self.assertIs(other["d"], self.s_cache.setdefault("d", None))
+        self.assertEqual(["c", "d"], list(self.s_cache))
+        self.assertEqual(set(["d"]), self.s_cache.ids_with_name_prefix("db"))
+        self.assertEqual(set(["d"]), self.s_cache.ids_with_status("ERROR"))
+        self.assertEqual(["d"], [server.id for server in
+                                 self.s_cache.servers(updated_since=20)])
+        self.s_cache.set_status_later("d", "ACTIVE", 5)
+        self.s_cache.clear()
+        self.assertEqual(([], set(), []),
+                         (list(self.s_cache), self.s_cache.ids_named("web"),
+                          self.clock.getDelayedCalls()))
+        self.assertRaises(KeyError, self.s_cache.popitem)
+
+    def test_name_index(self):
+        """
+        Servers can be looked up by a substring or prefix of their name.
+        """
+        self.assertEqual(set(["c", "a"]), self.s_cache.ids_named("web"))
+        self.assertEqual(set(["c", "b"]), self.s_cache.ids_named("-1"))
+        self.assertEqual(set(["b"]), self.s_cache.ids_with_name_prefix("d"))
+        del self.s_cache["b"]
+        self.assertEqual(set(), self.s_cache.ids_with_name_prefix("d"))
+
+    def test_status_index(self):
+        """
+        Servers can be looked up by status, which is kept up to date by
+        :obj:`S_Cache.set_status`.
+        """
+        self.assertEqual(set(["c", "b"]), self.s_cache.ids_with_status("ACTIVE"))
+        self.assertEqual(set(["a"]), self.s_cache.ids_without_status("ACTIVE"))
+        self.s_cache.set_status("a", "ACTIVE")
+        self.assertEqual("ACTIVE", self.s_cache["a"].status)
+        self.assertEqual(set(), self.s_cache.ids_without_status("ACTIVE"))
+        self.assertEqual(set(), self.s_cache.ids_with_status("ERROR"))
+
+    def test_status_change_updates(self):
+        """
+        Changing the status of a server updates it at the current time, so
+        that it is listed among the servers changed since then.
+        """
+        self.clock.advance(50)
+        self.s_cache.set_status_later("a", "ACTIVE", 5)
+        self.clock.advance(5)
+        self.assertEqual(55, self.s_cache["a"].updated)
+        self.assertEqual(["c", "b", "a"], list(self.s_cache))
+        self.assertEqual(["a"], [server.id for server in
+                                 self.s_cache.servers(updated_since=50)])
+        self.assertEqual(["a"], [server.id for server in
+                                 self.s_cache.servers(marker="b")])
+
+    def test_replay_older_change(self):
+        """
+        Replaying a change the cache already holds, older than the last
+        server in it, puts the server back in its place among the others,
+        so that it is not listed as changed since a later time.
+        """
+        self.add("d", "web-3", seconds=20)
+        self.add("e", "web-4", seconds=20)
+        s_cache = S_Cache.load(self.s_cache.dump(), self.clock)
+        s_cache.apply("a", self.s_cache.entry("a"))
+        self.assertEqual(["c", "a", "b", "d", "e"], list(s_cache))
+        self.assertEqual(["d", "e"], [server.id for server in
+                                      s_cache.servers(updated_since=15)])
+        self.assertEqual(["b", "d", "e"], [server.id for server in
+                                           s_cache.servers(marker="a")])
+
+    def test_set_status_later(self):
+        """
+        :obj:`S_Cache.set_status_later` changes the status of a server once
+        the clock has advanced far enough, or immediately without a delay.
+        """
+        self.s_cache.set_status_later("a", "ACTIVE", 5)
+        self.clock.advance(4)
+        self.assertEqual("BUILD", self.s_cache["a"].status)
+        self.clock.advance(1)
+        self.assertEqual("ACTIVE", self.s_cache["a"].status)
+        self.assertEqual(set(), self.s_cache.ids_without_status("ACTIVE"))
+        self.s_cache.set_status_later("b", "ERROR", 0)
+        self.assertEqual("ERROR", self.s_cache["b"].status)
+
+    def test_removal_cancels_status_change(self):
+        """
+        Removing or replacing a server cancels its pending change of status.
+        """
+        self.s_cache.set_status_later("a", "ACTIVE", 5)
+        self.s_cache.set_status_later("c", "ERROR", 5)
+        del self.s_cache["a"]
+        self.add("c", "web-1", "BUILD")
+        self.assertEqual([], self.clock.getDelayedCalls())
+        self.clock.advance(5)
+        self.assertEqual("BUILD", self.s_cache["c"].status)
+
+
 class NovaAPITests(SynchronousTestCase):
 
     """
@@ -443,6 +660,104 @@ class NovaAPITests(SynchronousTestCase):
         self.assertEqual(response_body, {'servers': []})
 
 
+class NovaPaginationTests(SynchronousTestCase):
+    """
+    Tests for paging through, and filtering by update time, the servers
+    listed by the Nova plugin api.
+    """
+
+    def setUp(self):
+        """
+        Create five servers, one second apart.
+        """
+        self.helper = APIMockHelper(self, [NovaApi(["ORD"])])
+        self.root = self.helper.root
+        self.uri = self.helper.uri
+        self.server_ids = []
+        for index in range(5):
+            response, body = self.successResultOf(json_request(
+                self, self.root, "POST", self.uri + '/servers',
+                {"server": {"name": "server-{0}".format(index),
+                            "imageRef": "test-image",
+                            "flavorRef": "test-flavor"}}))
+            self.server_ids.append(body['server']['id'])
+            self.helper.clock.advance(1)
+
+    def list_servers(self, url):
+        """
+        List servers at the given URL, returning the response and its body.
+        """
+        return self.successResultOf(json_request(self, self.root, "GET", url))
+
+    def test_pages(self):
+        """
+        With a ``limit``, servers are listed a page at a time, each full
+        page linking to the next, which starts after the marker.
+        """
+        url = self.uri + '/servers/detail?limit=2'
+        pages = []
+        while url is not None:
+            response, body = self.list_servers(url)
+            self.assertEqual(200, response.code)
+            pages.append([server['id'] for server in body['servers']])
+            links = body.get('servers_links', [])
+            url = links[0]['href'] if links else None
+            if url is not None:
+                self.assertEqual("next", links[0]['rel'])
+                self.assertIn("/servers/detail?", url)
+        ids = self.server_ids
+        self.assertEqual([ids[0:2], ids[2:4], ids[4:]], pages)
+
+    def test_marker_and_name(self):
+        """
+        ``marker`` and ``limit`` combine with the ``name`` filter, and the
+        next link preserves the filter.
+        """
+        response, body = self.list_servers(
+            self.uri + '/servers?name=server&limit=1&marker=' +
+            self.server_ids[2])
+        self.assertEqual([self.server_ids[3]],
+                         [server['id'] for server in body['servers']])
+        self.assertEqual(set(['name', 'links', 'id']),
+                         set(body['servers'][0]))
+        self.assertIn("name=server", body['servers_links'][0]['href'])
+
+    def test_no_link_without_full_page(self):
+        """
+        There is no next link without a ``limit``, or when the page is not
+        full.
+        """
+        response, body = self.list_servers(self.uri + '/servers')
+        self.assertEqual(5, len(body['servers']))
+        self.assertNotIn('servers_links', body)
+        response, body = self.list_servers(self.uri + '/servers?limit=10')
+        self.assertNotIn('servers_links', body)
+
+    def test_changes_since(self):
+        """
+        ``changes-since`` lists only the servers updated at or after the
+        given time, with or without fractional seconds.
+        """
+        for timestamp in ["1970-01-01T00:00:03Z",
+                          "1970-01-01T00:00:03.000000Z"]:
+            response, body = self.list_servers(
+                self.uri + '/servers?changes-since=' + timestamp)
+            self.assertEqual(self.server_ids[3:],
+                             [server['id'] for server in body['servers']])
+
+    def test_bad_parameters(self):
+        """
+        An unknown marker, a malformed limit or a malformed changes-since
+        time result in a 400.
+        """
+        for query in ["marker=nope", "limit=x", "limit=-1",
+                      "changes-since=yesterday"]:
+            response, body = self.list_servers(
+                self.uri + '/servers?' + query)
+            self.assertEqual(400, response.code)
+            self.assertEqual(400, body['code'])
+
+
 class NovaAPINegativeTests(SynchronousTestCase):
 
     """
@@ -582,6 +897,44 @@ class NovaAPINegativeTests(SynchronousTestCase):
             treq.json_content(get_server_response))
         self.assertEquals(get_server_response_body['server']['status'], "ACTIVE")
 
+    def get_with_etag(self, path, etag=None):
+        """
+        GET the given path, conditionally if an ETag is given, returning the
+        response and its body.
+        """
+        headers = None
+        if etag is not None:
+            headers = {"If-None-Match": [etag]}
+        response = self.successResultOf(request(
+            self, self.root, "GET", self.uri + path, headers=headers))
+        return response, self.successResultOf(treq.content(response))
+
+    def test_get_server_etag(self):
+        """
+        A server and the server list carry ETags, which change when the
+        server changes status, and conditional requests matching the current
+        ETag are answered with 304.
+        """
+        response = self.create_server(metadata={"server_building": 1})
+        server_id = self.successResultOf(
+            treq.json_content(response))["server"]["id"]
+        path = '/servers/' + server_id
+        response, body = self.get_with_etag(path)
+        [etag] = response.headers.getRawHeaders("etag")
+        response, body = self.get_with_etag(path, etag)
+        self.assertEqual(304, response.code)
+        self.assertEqual(b'', body)
+        response, body = self.get_with_etag('/servers/detail')
+        [list_etag] = response.headers.getRawHeaders("etag")
+        self.helper.clock.advance(1)
+        for each_path, each_etag in [(path, etag),
+                                     ('/servers/detail', list_etag)]:
+            response, body = self.get_with_etag(each_path, each_etag)
+            self.assertEqual(200, response.code)
+            self.assertIn('"status": "ACTIVE"', body)
+            self.assertNotEqual([each_etag],
+                                response.headers.getRawHeaders("etag"))
+
     def test_server_in_error_state(self):
         """
         Test to verify :func:`create_server` creates a server in ERROR state.
@@ -174,3 +174,18 @@ class RootAndPresetTests(SynchronousTestCase):
         }
         self.assertEqual(json_content, expected)
         self.assertEqual(do.done, True)
+
+    def test_tick_expires_sessions(self):
+        """
+        ``/mimic/v1.1/tick`` evicts the sessions which expire as a result of
+        advancing the clock.
+        """
+        clock = Clock()
+        core = MimicCore(clock, [])
+        root = MimicRoot(core, clock).app.resource()
+        core.sessions.session_for_tenant_id("sometenant")
+        self.successResultOf(json_request(
+            self, root, "POST", "/mimic/v1.1/tick", body={"amount": 86400}
+        ))
+        self.assertEqual(1, core.sessions.evicted_sessions)
+        self.assertEqual(0, core.sessions.live_sessions)
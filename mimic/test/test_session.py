@@ -6,7 +6,7 @@ from twisted.trial.unittest import SynchronousTestCase
 
 from twisted.internet.task import Clock
 
-from mimic.session import SessionStore
+from mimic.session import SessionStore, SQLiteSessionBackend
 
 
 class SessionCreationTests(SynchronousTestCase):
@@ -138,3 +138,197 @@ class SessionCreationTests(SynchronousTestCase):
         )
         session2 = sessions.session_for_tenant_id("sometenant")
         self.assertIdentical(session, session2)
+
+
+class SessionExpirationTests(SynchronousTestCase):
+    """
+    Tests for the expiration of sessions from a :class:`SessionStore`.
+    """
+
+    def test_session_evicted_after_expiry(self):
+        """
+        Once the clock passes a session's expiration time, the session and
+        the data attached to it are forgotten; the same credentials then
+        yield a new session.
+        """
+        clock = Clock()
+        sessions = SessionStore(clock)
+        a = sessions.session_for_username_password("someuser", "testpass")
+        a.data_for_api("api", list).append("data")
+        clock.advance(86399)
+        self.assertIdentical(
+            a, sessions.session_for_username_password("someuser", "testpass"))
+        self.assertEqual(1, sessions.live_sessions)
+        clock.advance(1)
+        b = sessions.session_for_username_password("someuser", "testpass")
+        self.assertNotIdentical(a, b)
+        self.assertNotEqual(a.token, b.token)
+        self.assertEqual([], b.data_for_api("api", list))
+        self.assertEqual(1, sessions.evicted_sessions)
+        self.assertEqual(1, sessions.live_sessions)
+
+    def test_expired_tenant_and_token_forgotten(self):
+        """
+        An expired session can no longer be found by its tenant ID or token.
+        """
+        clock = Clock()
+        sessions = SessionStore(clock)
+        a = sessions.session_for_tenant_id("sometenant")
+        clock.advance(86400)
+        sessions.expire_sessions()
+        self.assertEqual(0, sessions.live_sessions)
+        self.assertEqual(1, sessions.evicted_sessions)
+        self.assertNotIdentical(a, sessions.session_for_tenant_id("sometenant"))
+        self.assertNotIdentical(a, sessions.session_for_token(a.token))
+
+    def test_impersonation_expiry_keeps_user_session(self):
+        """
+        When an impersonation session expires, the user's own session remains
+        reachable by username and tenant ID, and keeps its data.
+        """
+        clock = Clock()
+        sessions = SessionStore(clock)
+        user = sessions.session_for_username_password("pretender", "pass")
+        user.data_for_api("api", list).append("data")
+        imp = sessions.session_for_impersonation("pretender", 10)
+        clock.advance(10)
+        self.assertEqual(1, sessions.live_sessions)
+        self.assertEqual(1, sessions.evicted_sessions)
+        self.assertIdentical(
+            user, sessions.session_for_tenant_id(user.tenant_id))
+        self.assertIdentical(
+            user, sessions.session_for_username_password("pretender", "pass"))
+        self.assertEqual(["data"], user.data_for_api("api", list))
+        self.assertNotIdentical(
+            imp, sessions.session_for_impersonation("pretender", 10))
+
+
+class SessionListingTests(SynchronousTestCase):
+    """
+    Tests for :obj:`SessionStore.sessions` and
+    :obj:`SessionStore.restore_session`.
+    """
+
+    def check_sessions(self, sessions):
+        """
+        The live sessions in the given store are listed in the order they
+        were created, with their username keys and the tokens of the
+        sessions whose data they share, and can be restored into another
+        store.
+        """
+        user = sessions.session_for_username_password("pretender", "pass")
+        impersonation = sessions.session_for_impersonation("pretender", 100)
+        sessions.session_for_username_password("shortlived", "pass")
+        listed = sessions.sessions()
+        self.assertEqual(
+            [(user.token, "pretender", user.token),
+             (impersonation.token, ("impersonation", "pretender"), user.token),
+             ],
+            [(session.token, username_key, data_token)
+             for (session, username_key, data_token) in listed][:2])
+
+        restored = SessionStore(Clock())
+        for session, username_key, data_token in listed:
+            restored.restore_session(session.username, session.token,
+                                     session.tenant_id, session.expires,
+                                     username_key, data_token)
+        restored.session_for_token(user.token).data_for_api(
+            "api", list).append("data")
+        self.assertEqual(["data"], restored.session_for_impersonation(
+            "pretender", 100).data_for_api("api", list))
+
+    def test_memory(self):
+        """
+        Sessions kept in memory are listed.
+        """
+        self.check_sessions(SessionStore(Clock()))
+
+    def test_sqlite(self):
+        """
+        Sessions kept in SQLite are listed.
+        """
+        self.check_sessions(
+            SessionStore(Clock(), SQLiteSessionBackend(self.mktemp())))
+
+    def test_expired_not_listed(self):
+        """
+        Expired sessions are not listed.
+        """
+        clock = Clock()
+        sessions = SessionStore(clock)
+        sessions.session_for_impersonation("pretender", 100)
+        clock.advance(100)
+        self.assertEqual(1, len(sessions.sessions()))
+
+
+class SQLiteSessionBackendTests(SynchronousTestCase):
+    """
+    Tests for :class:`SessionStore` with a :class:`SQLiteSessionBackend`
+    shared by several stores, as it would be by several processes.
+    """
+
+    def setUp(self):
+        """
+        Create two session stores sharing one database and one clock.
+        """
+        self.clock = Clock()
+        path = self.mktemp()
+        self.one = SessionStore(self.clock, SQLiteSessionBackend(path))
+        self.two = SessionStore(self.clock, SQLiteSessionBackend(path))
+
+    def test_sessions_shared(self):
+        """
+        A session created by one store can be found in the other by username,
+        token and tenant ID.
+        """
+        a = self.one.session_for_username_password("someuser", "testpass",
+                                                   "sometenant")
+        b = self.two.session_for_username_password("someuser", "testpass")
+        self.assertEqual((a.username, a.token, a.tenant_id, a.expires),
+                         (b.username, b.token, b.tenant_id, b.expires))
+        self.assertIdentical(b, self.two.session_for_token(a.token))
+        self.assertIdentical(b, self.two.session_for_tenant_id("sometenant"))
+        self.assertEqual(1, self.two.live_sessions)
+
+    def test_data_is_local(self):
+        """
+        Data attached to a session stays with the local :class:`Session`
+        object, which is reused for subsequent lookups in the same store.
+        """
+        a = self.one.session_for_tenant_id("sometenant")
+        a.data_for_api("api", list).append("data")
+        self.assertEqual(
+            ["data"],
+            self.one.session_for_tenant_id("sometenant")
+            .data_for_api("api", list))
+        self.assertEqual(
+            [],
+            self.two.session_for_tenant_id("sometenant")
+            .data_for_api("api", list))
+
+    def test_impersonation_shared(self):
+        """
+        An impersonation session created by one store is found by the other,
+        and shares data with the impersonated user's session in that store.
+        """
+        a = self.one.session_for_impersonation("pretender", 100)
+        user = self.two.session_for_username_password("pretender", "pass")
+        user.data_for_api("api", list).append("data")
+        b = self.two.session_for_impersonation("pretender", 100)
+        self.assertEqual(a.token, b.token)
+        self.assertNotEqual(user.token, b.token)
+        self.assertEqual(["data"], b.data_for_api("api", list))
+
+    def test_expired_sessions_not_shared(self):
+        """
+        Once a session expires, neither store returns it, and a new session is
+        created in its place.
+        """
+        a = self.one.session_for_username_password("someuser", "testpass")
+        self.clock.advance(86400)
+        b = self.two.session_for_username_password("someuser", "testpass")
+        self.assertNotEqual(a.token, b.token)
+        c = self.one.session_for_username_password("someuser", "testpass")
+        self.assertEqual(b.token, c.token)
+        self.assertEqual(1, self.one.evicted_sessions + self.two.evicted_sessions)
+        self.assertEqual(1, self.one.live_sessions)
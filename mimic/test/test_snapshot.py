@@ -0,0 +1,493 @@
+"""
+Tests for :mod:`mimic.snapshot`.
+"""
+
+import os
+from json import dumps
+
+from twisted.internet.defer import succeed
+from twisted.internet.task import Clock, Cooperator
+from twisted.trial.unittest import SynchronousTestCase
+
+import treq
+
+from mimic.core import MimicCore
+from mimic.resource import MimicRoot
+from mimic.rest.loadbalancer_api import LoadBalancerApi
+from mimic.rest.nova_api import NovaApi
+from mimic.rest.swift_api import SwiftMock
+from mimic.snapshot import (
+    LOG_MAGIC, MAGIC, SnapshotService, WriteAheadLog, load, replay)
+from mimic.test.helpers import json_request, request
+from mimic.util.storage import BlobStore
+
+
+class ImmediateTask(object):
+    """
+    A stand-in for a cooperative task which runs every step of its iterator
+    as soon as it is created.
+    """
+
+    def __init__(self, iterator):
+        """
+        Run every step of the iterator.
+        """
+        for step in iterator:
+            pass
+
+    def whenDone(self):
+        """
+        Get a Deferred which has already fired.
+        """
+        return succeed(self)
+
+
+def authenticate(testCase, root):
+    """
+    Authenticate as a user, returning the token and the public URL of each
+    type of service.
+    """
+    response, body = testCase.successResultOf(json_request(
+        testCase, root, "POST", "/identity/v2.0/tokens",
+        {"auth": {"passwordCredentials": {"username": "test1",
+                                          "password": "test1password"}}}))
+    return (body["access"]["token"]["id"],
+            dict((entry["type"], entry["endpoints"][0]["publicURL"])
+                 for entry in body["access"]["serviceCatalog"]))
+
+
+def get(testCase, root, uri):
+    """
+    Get the response code and body of a resource.
+    """
+    response = testCase.successResultOf(request(testCase, root, "GET", uri))
+    return response.code, testCase.successResultOf(treq.content(response))
+
+
+class SnapshotTests(SynchronousTestCase):
+    """
+    Tests for saving the state of Mimic to a snapshot file and restoring it.
+    """
+
+    def setUp(self):
+        """
+        Create a Mimic whose snapshots are written a step at a time as its
+        clock advances.
+        """
+        self.path = self.mktemp()
+        self.clock, self.core, self.root = self.mimic()
+        cooperator = Cooperator(
+            scheduler=lambda step: self.clock.callLater(0, step))
+        self.snapshots = SnapshotService(self.core, self.path,
+                                         cooperator.cooperate)
+
+    def mimic(self):
+        """
+        Create a clock, a core with the Nova, load balancer and Swift APIs,
+        and a root resource for it.
+        """
+        clock = Clock()
+        core = MimicCore(clock, [NovaApi(), LoadBalancerApi(),
+                                 SwiftMock(blobs=BlobStore(spill_threshold=4))],
+                         service_id_seed="snapshot-tests")
+        return clock, core, MimicRoot(core, clock).app.resource()
+
+    def populate(self):
+        """
+        Create a building server, a building load balancer and a Swift
+        container with a small object and a large one.
+
+        :return: the public URLs of the services.
+        """
+        token, urls = authenticate(self, self.root)
+        self.clock.advance(100)
+        response, body = self.successResultOf(json_request(
+            self, self.root, "POST", urls["compute"] + "/servers",
+            {"server": {"name": "web", "flavorRef": "2",
+                        "metadata": {"server_building": "30"}}}))
+        self.server_id = body["server"]["id"]
+        response, body = self.successResultOf(json_request(
+            self, self.root, "POST", urls["rax:load-balancer"] +
+            "/loadbalancers",
+            {"loadBalancer": {"name": "lb", "protocol": "HTTP",
+                              "metadata": [{"key": "lb_building",
+                                            "value": 20}]}}))
+        self.lb_id = body["loadBalancer"]["id"]
+        self.successResultOf(request(self, self.root, "PUT",
+                                     urls["object-store"] + "/files"))
+        for name, data in [("small", b"abc"), ("large", b"0123456789")]:
+            self.successResultOf(request(
+                self, self.root, "PUT", urls["object-store"] + "/files/" + name,
+                body=data, headers={"content-type": ["text/plain"]}))
+        return token, urls
+
+    def test_save_and_load(self):
+        """
+        A snapshot restores sessions, servers, load balancers and Swift
+        objects into a new Mimic, with the clock at the time of the
+        snapshot and timed changes of status still to come.
+        """
+        token, urls = self.populate()
+        d = self.snapshots.save()
+        self.clock.advance(0)
+        snapshot = self.successResultOf(d)
+        self.assertEqual(2, snapshot.blobs)
+        with open(self.path, "rb") as f:
+            self.assertEqual(MAGIC, f.read(len(MAGIC)))
+
+        clock, core, root = self.mimic()
+        self.assertEqual(snapshot.sessions, load(core, self.path))
+        self.assertEqual(100, clock.seconds())
+        self.assertEqual((token, urls), authenticate(self, root))
+        response, body = self.successResultOf(json_request(
+            self, root, "GET", urls["compute"] + "/servers/" +
+            self.server_id))
+        self.assertEqual(("web", "BUILD"),
+                         (body["server"]["name"], body["server"]["status"]))
+        self.assertEqual((200, b"0123456789"),
+                         get(self, root, urls["object-store"] + "/files/large"))
+        self.assertEqual((200, b"abc"),
+                         get(self, root, urls["object-store"] + "/files/small"))
+
+        clock.advance(30)
+        response, body = self.successResultOf(json_request(
+            self, root, "GET", urls["compute"] + "/servers/" +
+            self.server_id))
+        self.assertEqual("ACTIVE", body["server"]["status"])
+        response, body = self.successResultOf(json_request(
+            self, root, "GET", urls["rax:load-balancer"] +
+            "/loadbalancers/" + str(self.lb_id)))
+        self.assertEqual("ACTIVE", body["loadBalancer"]["status"])
+
+    def test_captured_at_once(self):
+        """
+        A snapshot is written after :obj:`SnapshotService.save` returns,
+        and holds the state as it was when it was saved, even if blobs it
+        refers to are deleted meanwhile; only then does it replace the
+        previous snapshot.
+        """
+        token, urls = self.populate()
+        d = self.snapshots.save()
+        self.assertTrue(self.snapshots.saving)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertRaises(RuntimeError, self.snapshots.save)
+        self.successResultOf(request(
+            self, self.root, "DELETE", urls["object-store"] + "/files/large"))
+        self.clock.advance(0)
+        self.successResultOf(d)
+        self.assertFalse(self.snapshots.saving)
+        self.assertFalse(os.path.exists(self.path + ".partial"))
+
+        clock, core, root = self.mimic()
+        load(core, self.path)
+        self.assertEqual((200, b"0123456789"),
+                         get(self, root, urls["object-store"] + "/files/large"))
+
+    def test_impersonation_shares_data(self):
+        """
+        A restored impersonation session shares the data of the session of
+        the user it impersonates.
+        """
+        token, urls = self.populate()
+        response, body = self.successResultOf(json_request(
+            self, self.root, "POST",
+            "/identity/v2.0/RAX-AUTH/impersonation-tokens",
+            {"RAX-AUTH:impersonation": {"expire-in-seconds": 1000,
+                                        "user": {"username": "test1"}}}))
+        impersonation = body["access"]["token"]["id"]
+        d = self.snapshots.save()
+        self.clock.advance(0)
+        self.successResultOf(d)
+
+        clock, core, root = self.mimic()
+        load(core, self.path)
+        user = core.sessions.session_for_token(token)
+        impersonator = core.sessions.session_for_token(impersonation)
+        self.assertIsNot(user, impersonator)
+        self.assertIs(user._api_objects, impersonator._api_objects)
+
+    def test_not_a_snapshot(self):
+        """
+        Loading a file which is not a complete snapshot fails.
+        """
+        with open(self.path, "wb") as f:
+            f.write(b"something else")
+        self.assertRaises(ValueError, self.snapshots.load)
+        with open(self.path, "wb") as f:
+            f.write(MAGIC)
+        self.assertRaises(ValueError, self.snapshots.load)
+
+    def test_no_snapshot(self):
+        """
+        Without a snapshot file, nothing is loaded.
+        """
+        self.assertEqual(0, self.snapshots.load())
+
+    def test_saved_when_stopped(self):
+        """
+        A snapshot is saved at once when the service stops, after any which
+        is being written.
+        """
+        self.populate()
+        self.snapshots.startService()
+        self.snapshots.stopService()
+        self.assertTrue(os.path.exists(self.path))
+        os.remove(self.path)
+
+        self.snapshots.startService()
+        self.snapshots.save()
+        d = self.snapshots.stopService()
+        self.assertNoResult(d)
+        self.clock.advance(0)
+        self.successResultOf(d)
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_endpoint(self):
+        """
+        ``POST /mimic/v1.1/snapshot`` saves a snapshot, and responds with
+        what it holds once it has been written; while another is being
+        written, it is a conflict, and without a state file, it is a bad
+        request.
+        """
+        self.populate()
+        snapshots = SnapshotService(self.core, self.path, ImmediateTask)
+        root = MimicRoot(self.core, self.clock, snapshots).app.resource()
+        response = self.successResultOf(request(
+            self, root, "POST", "/mimic/v1.1/snapshot"))
+        self.assertEqual(201, response.code)
+        body = self.successResultOf(treq.json_content(response))
+        self.assertEqual((self.path, 2), (body["path"], body["blobs"]))
+        self.snapshots.save()
+        root = MimicRoot(self.core, self.clock, self.snapshots).app.resource()
+        response = self.successResultOf(request(
+            self, root, "POST", "/mimic/v1.1/snapshot"))
+        self.assertEqual(409, response.code)
+        self.clock.advance(0)
+        response = self.successResultOf(request(
+            self, self.root, "POST", "/mimic/v1.1/snapshot", dumps({})))
+        self.assertEqual(400, response.code)
+
+
+class WriteAheadLogTests(SynchronousTestCase):
+    """
+    Tests for logging the changes made to the state of Mimic between
+    snapshots, replaying them, and compacting the log.
+    """
+
+    def setUp(self):
+        """
+        Create a Mimic which logs its changes.
+        """
+        self.path = self.mktemp()
+        self.log_path = self.mktemp()
+        self.clock, self.core, self.root, self.snapshots = self.mimic()
+        self.snapshots.load()
+
+    def mimic(self, **kwargs):
+        """
+        Create a clock, a core with the Nova, load balancer and Swift APIs,
+        a root resource for it, and a snapshot service for it with a log
+        which is synced as the clock advances.
+        """
+        clock = Clock()
+        core = MimicCore(clock, [NovaApi(), LoadBalancerApi(),
+                                 SwiftMock(blobs=BlobStore(spill_threshold=4))],
+                         service_id_seed="snapshot-tests")
+        cooperator = Cooperator(scheduler=lambda step: clock.callLater(0, step))
+        wal = WriteAheadLog(core, self.log_path, 1, reactor=clock, **kwargs)
+        snapshots = SnapshotService(core, self.path, cooperator.cooperate, wal)
+        return clock, core, MimicRoot(core, clock).app.resource(), snapshots
+
+    def populate(self):
+        """
+        Authenticate, create and delete servers, load balancers, nodes,
+        containers and objects, and return the token and service URLs.
+        """
+        token, urls = authenticate(self, self.root)
+        self.clock.advance(100)
+        server_ids = []
+        for building in ["30", "0"]:
+            response, body = self.successResultOf(json_request(
+                self, self.root, "POST", urls["compute"] + "/servers",
+                {"server": {"name": "web", "flavorRef": "2",
+                            "metadata": {"server_building": building}}}))
+            server_ids.append(body["server"]["id"])
+        self.server_id, deleted = server_ids
+        self.successResultOf(request(
+            self, self.root, "DELETE", urls["compute"] + "/servers/" + deleted))
+        response, body = self.successResultOf(json_request(
+            self, self.root, "POST", urls["rax:load-balancer"] +
+            "/loadbalancers",
+            {"loadBalancer": {"name": "lb", "protocol": "HTTP"}}))
+        self.lb_id = body["loadBalancer"]["id"]
+        self.clock.advance(10)
+        self.successResultOf(json_request(
+            self, self.root, "POST", urls["rax:load-balancer"] +
+            "/loadbalancers/{0}/nodes".format(self.lb_id),
+            {"nodes": [{"address": "10.0.0.1", "port": 80,
+                        "condition": "ENABLED"}]}))
+        self.successResultOf(request(self, self.root, "PUT",
+                                     urls["object-store"] + "/files"))
+        for name, data in [("small", b"abc"), ("large", b"0123456789"),
+                           ("gone", b"abc")]:
+            self.successResultOf(request(
+                self, self.root, "PUT", urls["object-store"] + "/files/" + name,
+                body=data, headers={"content-type": ["text/plain"]}))
+        self.successResultOf(request(
+            self, self.root, "DELETE", urls["object-store"] + "/files/gone"))
+        return token, urls
+
+    def assertRestored(self, root, token, urls):
+        """
+        Assert that the state created by :obj:`populate` is served by the
+        given root resource.
+        """
+        self.assertEqual((token, urls),
+                         authenticate(self, root))
+        response, body = self.successResultOf(json_request(
+            self, root, "GET", urls["compute"] + "/servers"))
+        self.assertEqual([self.server_id],
+                         [server["id"] for server in body["servers"]])
+        response, body = self.successResultOf(json_request(
+            self, root, "GET", urls["rax:load-balancer"] +
+            "/loadbalancers/{0}/nodes".format(self.lb_id)))
+        self.assertEqual(["10.0.0.1"],
+                         [node["address"] for node in body["nodes"]])
+        self.assertEqual((200, b"0123456789"),
+                         get(self, root, urls["object-store"] + "/files/large"))
+        self.assertEqual((200, b"abc"),
+                         get(self, root, urls["object-store"] + "/files/small"))
+        self.assertEqual(404, get(self, root, urls["object-store"] +
+                                  "/files/gone")[0])
+
+    def test_replay(self):
+        """
+        Sessions, servers, load balancers, nodes and objects created or
+        deleted are logged as they change, and replayed into a new Mimic,
+        with the clock at the time of the last change and timed changes
+        still to come.
+        """
+        token, urls = self.populate()
+        with open(self.log_path, "rb") as f:
+            self.assertEqual(LOG_MAGIC, f.read(len(LOG_MAGIC)))
+
+        clock, core, root, snapshots = self.mimic()
+        self.assertEqual(0, snapshots.load())
+        self.assertEqual(110, clock.seconds())
+        self.assertRestored(root, token, urls)
+        response, body = self.successResultOf(json_request(
+            self, root, "GET", urls["compute"] + "/servers/" +
+            self.server_id))
+        self.assertEqual("BUILD", body["server"]["status"])
+        clock.advance(20)
+        response, body = self.successResultOf(json_request(
+            self, root, "GET", urls["compute"] + "/servers/" +
+            self.server_id))
+        self.assertEqual("ACTIVE", body["server"]["status"])
+
+    def test_replay_idempotent(self):
+        """
+        Replaying changes which are already in the state loaded has no
+        effect beyond them.
+        """
+        token, urls = self.populate()
+        clock, core, root, snapshots = self.mimic()
+        replay(core, self.log_path)
+        self.assertNotEqual(0, replay(core, self.log_path))
+        self.assertRestored(root, token, urls)
+
+    def test_compacted_at_startup(self):
+        """
+        Once a log has been replayed, it is compacted in the background when
+        the service starts, by saving a snapshot, after which only the
+        changes made since then are logged.
+        """
+        token, urls = self.populate()
+        clock, core, root, snapshots = self.mimic()
+        snapshots.load()
+        snapshots.startService()
+        self.assertTrue(snapshots.saving)
+        self.assertTrue(os.path.exists(self.log_path + ".old"))
+        clock.advance(0)
+        self.assertFalse(snapshots.saving)
+        self.assertFalse(os.path.exists(self.log_path + ".old"))
+        with open(self.log_path, "rb") as f:
+            self.assertEqual(LOG_MAGIC, f.read())
+
+        clock, core, root, snapshots = self.mimic()
+        snapshots.load()
+        self.assertRestored(root, token, urls)
+
+    def test_interrupted_compaction(self):
+        """
+        If a snapshot is not written, the changes set aside when it was
+        captured are replayed along with those logged since, and kept until
+        a snapshot is written.
+        """
+        token, urls = self.populate()
+        self.snapshots.save()
+        self.successResultOf(request(
+            self, self.root, "DELETE", urls["object-store"] + "/files/small"))
+        self.snapshots.wal.rotate()
+
+        clock, core, root, snapshots = self.mimic()
+        snapshots.load()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertTrue(os.path.exists(self.log_path + ".old"))
+        self.assertEqual(404, get(self, root, urls["object-store"] +
+                                  "/files/small")[0])
+
+    def test_incomplete_record(self):
+        """
+        An incomplete record at the end of the log is ignored, and removed
+        so that new records follow the complete ones.
+        """
+        token, urls = self.populate()
+        size = os.path.getsize(self.log_path)
+        with open(self.log_path, "ab") as f:
+            f.write(b"C\x00\x00\x00\x00\x00\x00\x01\x00partial")
+        clock, core, root, snapshots = self.mimic()
+        snapshots.load()
+        self.assertEqual(size, os.path.getsize(self.log_path))
+        self.assertRestored(root, token, urls)
+
+    def test_not_a_log(self):
+        """
+        Replaying a file which is not a write-ahead log fails.
+        """
+        with open(self.log_path + ".other", "wb") as f:
+            f.write(b"something else")
+        self.assertRaises(ValueError, replay, self.core,
+                          self.log_path + ".other")
+
+    def test_sync_batched(self):
+        """
+        Records are synced to disk at most once per sync interval.
+        """
+        self.assertEqual([], self.clock.getDelayedCalls())
+        authenticate(self, self.root)
+        [sync] = self.clock.getDelayedCalls()
+        self.core.sessions.session_for_tenant_id("another")
+        self.assertEqual([sync], self.clock.getDelayedCalls())
+        self.clock.advance(1)
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_compacted_when_full(self):
+        """
+        The log is compacted whenever a change makes it larger than its
+        maximum size.
+        """
+        clock, core, root, snapshots = self.mimic(max_size=1024)
+        snapshots.load()
+        core.sessions.session_for_tenant_id("first")
+        self.assertFalse(snapshots.saving)
+        for index in range(100):
+            core.sessions.session_for_tenant_id("tenant{0}".format(index))
+            if snapshots.saving:
+                break
+        self.assertTrue(snapshots.saving)
+        with open(self.log_path, "rb") as f:
+            self.assertEqual(LOG_MAGIC, f.read())
+        clock.advance(0)
+        self.assertTrue(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.log_path + ".old"))
@@ -0,0 +1,276 @@
+"""
+Tests for :mod:`mimic.util.storage`.
+"""
+
+import os
+from io import BytesIO
+
+from twisted.trial.unittest import SynchronousTestCase
+from twisted.web.test.requesthelper import DummyRequest
+
+from mimic.util.storage import (
+    CHUNK_SIZE, BlobStore, ChunkProducer, Concatenation, FileBlob,
+    MemoryBlob, StreamingBody)
+
+
+class BlobStoreTests(SynchronousTestCase):
+    """
+    Tests for :obj:`BlobStore`.
+    """
+
+    def test_small_blobs_in_memory(self):
+        """
+        Blobs no larger than the spill threshold are kept in memory, and
+        accounted for until they are released.
+        """
+        store = BlobStore(memory_limit=100, spill_threshold=10)
+        blob = store.store(BytesIO(b"0123456789"))
+        self.assertIsInstance(blob, MemoryBlob)
+        self.assertEqual((10, 10), (blob.size, store.memory_used))
+        self.assertEqual(b"0123456789", b"".join(blob.chunks()))
+        blob.release()
+        self.assertEqual(0, store.memory_used)
+
+    def test_large_blobs_spilled(self):
+        """
+        Blobs larger than the spill threshold are kept in a file, which is
+        removed when they are released.
+        """
+        store = BlobStore(memory_limit=100, spill_threshold=10)
+        blob = store.store(BytesIO(b"0123456789a"))
+        self.assertIsInstance(blob, FileBlob)
+        self.assertEqual((11, 0), (blob.size, store.memory_used))
+        self.assertEqual(b"0123456789a", b"".join(blob.chunks()))
+        self.assertTrue(os.path.exists(blob.path))
+        blob.release()
+        self.assertFalse(os.path.exists(blob.path))
+
+    def test_memory_limit(self):
+        """
+        Once the memory limit is reached, even small blobs are spilled.
+        """
+        store = BlobStore(memory_limit=15, spill_threshold=10)
+        self.assertIsInstance(store.store(BytesIO(b"0123456789")), MemoryBlob)
+        spilled = store.store(BytesIO(b"9876543210"))
+        self.assertIsInstance(spilled, FileBlob)
+        self.assertEqual(10, store.memory_used)
+        spilled.release()
+
+    def test_chunks(self):
+        """
+        Blobs are read a chunk at a time, optionally from and to given
+        offsets, whether they are in memory or in a file.
+        """
+        data = b"x" * CHUNK_SIZE + b"0123456789"
+        for spill_threshold in [len(data), 0]:
+            blob = BlobStore(spill_threshold=spill_threshold).store(
+                BytesIO(data))
+            self.assertEqual([CHUNK_SIZE, 10],
+                             [len(chunk) for chunk in blob.chunks()])
+            self.assertEqual(b"x0123",
+                             b"".join(blob.chunks(CHUNK_SIZE - 1,
+                                                  CHUNK_SIZE + 4)))
+            blob.release()
+
+    def test_identical_contents_shared(self):
+        """
+        Storing the same contents again returns the same blob, with one more
+        reference, and drops the new copy; the blob is only discarded once
+        every reference is released.
+        """
+        for spill_threshold in [100, 0]:
+            store = BlobStore(spill_threshold=spill_threshold)
+            blob = store.store(BytesIO(b"same"))
+            self.assertIs(blob, store.store(BytesIO(b"same")))
+            other = store.store(BytesIO(b"different"))
+            self.assertEqual((2, 2), (len(store), blob.references))
+            if spill_threshold == 0:
+                self.assertEqual(
+                    sorted([os.path.basename(blob.path),
+                            os.path.basename(other.path)]),
+                    sorted(os.listdir(store._directory)))
+            blob.release()
+            self.assertEqual(2, len(store))
+            blob.release()
+            other.release()
+            self.assertEqual((0, 0), (len(store), store.memory_used))
+
+    def test_etag(self):
+        """
+        Each blob has the MD5 digest of its contents as its ETag.
+        """
+        blob = BlobStore().store(BytesIO(b"some bytes"))
+        self.assertEqual("9d0568469d206c1aedf1b71f12f474bc", blob.etag)
+
+
+class ConcatenationTests(SynchronousTestCase):
+    """
+    Tests for :obj:`Concatenation`.
+    """
+
+    def test_chunks(self):
+        """
+        A concatenation has the total size of its parts, and reads any range
+        of them in order, including empty parts.
+        """
+        store = BlobStore(spill_threshold=4)
+        parts = [store.store(BytesIO(data))
+                 for data in [b"012", b"", b"3456789", b"abc"]]
+        body = Concatenation(parts)
+        self.assertEqual(13, body.size)
+        self.assertEqual(b"0123456789abc", b"".join(body.chunks()))
+        self.assertEqual(b"23456", b"".join(body.chunks(2, 7)))
+        self.assertEqual(b"9a", b"".join(body.chunks(9, 11)))
+        self.assertEqual(b"", b"".join(body.chunks(13)))
+
+    def test_retain_and_release(self):
+        """
+        Retaining a concatenation retains each of its parts, so they are not
+        discarded when released elsewhere until the concatenation is
+        released too.
+        """
+        store = BlobStore()
+        first = store.store(BytesIO(b"first"))
+        second = store.store(BytesIO(b"second"))
+        body = Concatenation([first, second, first])
+        body.retain()
+        first.release()
+        second.release()
+        self.assertEqual(2, len(store))
+        self.assertEqual(b"firstsecondfirst", b"".join(body.chunks()))
+        body.release()
+        self.assertEqual(0, len(store))
+
+    def test_skips_earlier_parts(self):
+        """
+        Reading from an offset does not read the parts before it.
+        """
+        read = []
+
+        class Part(object):
+            """
+            A part which records being read.
+            """
+            size = 5
+
+            def __init__(self, name):
+                """
+                Name the part.
+                """
+                self.name = name
+
+            def chunks(self, start, end):
+                """
+                Record the read, and return dummy data.
+                """
+                read.append(self.name)
+                yield b"x" * (end - start)
+
+        body = Concatenation([Part(index) for index in range(100)])
+        self.assertEqual(b"xxxxxxx", b"".join(body.chunks(401, 408)))
+        self.assertEqual([80, 81], read)
+
+
+class PausingRequest(DummyRequest):
+    """
+    A request which pauses its producer after every write.
+    """
+
+    def registerProducer(self, producer, streaming):
+        """
+        Record the producer.
+        """
+        self.producer = producer
+
+    def unregisterProducer(self):
+        """
+        Forget the producer.
+        """
+        self.producer = None
+
+    def write(self, data):
+        """
+        Record the data, and pause the producer.
+        """
+        DummyRequest.write(self, data)
+        self.producer.pauseProducing()
+
+
+class ChunkProducerTests(SynchronousTestCase):
+    """
+    Tests for :obj:`ChunkProducer` and :obj:`StreamingBody`.
+    """
+
+    def test_pause_and_resume(self):
+        """
+        The producer writes no more until it is resumed after being paused,
+        and finishes the request after writing the last chunk.
+        """
+        request = PausingRequest([])
+        ChunkProducer(request, [b"a", b"b"]).start()
+        self.assertEqual(([b"a"], 0), (request.written, request.finished))
+        request.producer.resumeProducing()
+        self.assertEqual([b"a", b"b"], request.written)
+        request.producer.resumeProducing()
+        self.assertEqual((1, None), (request.finished, request.producer))
+
+    def test_stop(self):
+        """
+        Stopping the producer closes the chunks, and leaves the request
+        unfinished.
+        """
+        closed = []
+
+        def chunks():
+            try:
+                yield b"a"
+                yield b"b"
+            finally:
+                closed.append(True)
+
+        request = PausingRequest([])
+        ChunkProducer(request, chunks()).start()
+        request.producer.stopProducing()
+        self.assertEqual(([True], [b"a"], 0),
+                         (closed, request.written, request.finished))
+
+    def test_retains_blob(self):
+        """
+        The producer holds a reference to its blob while writing, so the
+        whole blob is written even if it is released elsewhere while the
+        producer is paused, and discarded once the producer finishes.
+        """
+        for threshold in [CHUNK_SIZE * 4, 0]:
+            store = BlobStore(spill_threshold=threshold)
+            data = b"x" * (CHUNK_SIZE * 2 + 1)
+            blob = store.store(BytesIO(data))
+            request = PausingRequest([])
+            ChunkProducer(request, blob.chunks(), blob).start()
+            blob.release()
+            self.assertEqual(1, len(store))
+            while request.producer is not None:
+                request.producer.resumeProducing()
+            self.assertEqual(data, b"".join(request.written))
+            self.assertEqual(0, len(store))
+
+    def test_stop_releases_blob(self):
+        """
+        Stopping the producer releases its blob.
+        """
+        store = BlobStore()
+        blob = store.store(BytesIO(b"ab"))
+        request = PausingRequest([])
+        ChunkProducer(request, [b"a", b"b"], blob).start()
+        blob.release()
+        request.producer.stopProducing()
+        self.assertEqual(0, len(store))
+
+    def test_streaming_body(self):
+        """
+        :obj:`StreamingBody` renders all of its chunks.
+        """
+        request = DummyRequest([])
+        request.registerProducer = lambda producer, streaming: None
+        request.unregisterProducer = lambda: None
+        StreamingBody([b"a", b"b"]).render(request)
+        self.assertEqual(([b"a", b"b"], 1), (request.written, request.finished))
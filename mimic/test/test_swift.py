@@ -1,16 +1,24 @@
 
-from json import dumps
+import os
+import tarfile
+from hashlib import md5
+from io import BytesIO
+from json import dumps, loads
+
+from six.moves.urllib.parse import quote
 
 from twisted.trial.unittest import SynchronousTestCase
 from twisted.internet.task import Clock
 
 import treq
 
-from mimic.rest.swift_api import SwiftMock
+from mimic.rest import swift_api
+from mimic.rest.swift_api import SwiftMock, parse_ranges
 from mimic.resource import MimicRoot
 from mimic.core import MimicCore
 from mimic.rest.swift_api import normal_tenant_id_to_crazy_mosso_id
 from mimic.test.helpers import request
+from mimic.util.storage import BlobStore, CHUNK_SIZE
 
 
 class SwiftTests(SynchronousTestCase):
@@ -176,6 +184,39 @@ class SwiftTests(SynchronousTestCase):
         object_body = self.successResultOf(treq.content(object_response))
         self.assertEquals(object_body, BODY)
 
+    def test_put_object_no_container(self):
+        """
+        PUTting an object into a container that does not exist fails with
+        404, whether or not it is a static large object manifest.
+        """
+        self.createSwiftService()
+        uri = (self.json_body['access']['serviceCatalog'][0]['endpoints'][0]
+               ['publicURL'] + '/nocontainer/testobject')
+        for suffix in ["", "?multipart-manifest=put"]:
+            response = self.successResultOf(request(
+                self, self.root, "PUT", uri + suffix, body=b"[]",
+                headers={"content-type": ["text/plain"]}))
+            self.assertEqual(404, response.code)
+
+    def test_put_object_no_content_type(self):
+        """
+        An object PUT without a ``Content-Type`` header gets a content type
+        guessed from its name, or ``application/octet-stream``.
+        """
+        self.createSwiftService()
+        uri = (self.json_body['access']['serviceCatalog'][0]['endpoints'][0]
+               ['publicURL'] + '/testcontainer')
+        self.successResultOf(request(self, self.root, "PUT", uri))
+        for name, content_type in [("a.txt", "text/plain"),
+                                   ("a", "application/octet-stream")]:
+            response = self.successResultOf(request(
+                self, self.root, "PUT", uri + "/" + name, body=b"x"))
+            self.assertEqual(201, response.code)
+            response = self.successResultOf(
+                request(self, self.root, "GET", uri + "/" + name))
+            self.assertEqual([content_type],
+                             response.headers.getRawHeaders("content-type"))
+
     def test_openstack_ids(self):
         """
         Non-Rackspace implementations of Swift just use the same tenant ID as
@@ -189,3 +230,732 @@ class SwiftTests(SynchronousTestCase):
                ['endpoints'][0]['publicURL'])
         self.assertIn("/fun_tenant", url)
         self.assertNotIn("/MossoCloudFS_", url)
+
+    def test_large_object(self):
+        """
+        Objects too large to keep in memory are spilled to disk, served a
+        chunk at a time with their content type and length, and their storage
+        is freed when they are replaced.
+        """
+        blobs = BlobStore(spill_threshold=CHUNK_SIZE)
+        self.core = MimicCore(Clock(), [SwiftMock(blobs=blobs)])
+        self.root = MimicRoot(self.core).app.resource()
+        self.auth_response = self.successResultOf(request(
+            self, self.root, "POST", "/identity/v2.0/tokens",
+            dumps({"auth": {"passwordCredentials": {
+                "username": "test1", "password": "test1password"}}})))
+        self.json_body = self.successResultOf(
+            treq.json_content(self.auth_response))
+        uri = (self.json_body['access']['serviceCatalog'][0]['endpoints'][0]
+               ['publicURL'] + '/testcontainer')
+        self.successResultOf(request(self, self.root, "PUT", uri))
+        body = b"0123456789" * CHUNK_SIZE
+        object_uri = uri + "/testobject"
+        self.successResultOf(request(
+            self, self.root, "PUT", object_uri, body=body,
+            headers={"content-type": ["application/octet-stream"]}))
+        object_response = self.successResultOf(
+            request(self, self.root, "GET", object_uri))
+        self.assertEqual(
+            (["application/octet-stream"], len(body)),
+            (object_response.headers.getRawHeaders("content-type"),
+             object_response.length))
+        self.assertEqual(body,
+                         self.successResultOf(treq.content(object_response)))
+        self.successResultOf(request(
+            self, self.root, "PUT", object_uri, body=b"small",
+            headers={"content-type": ["text/plain"]}))
+        self.assertEqual(b"small", self.successResultOf(treq.content(
+            self.successResultOf(request(self, self.root, "GET",
+                                         object_uri)))))
+        self.assertEqual([], os.listdir(blobs._directory))
+        self.assertEqual(len(b"small"), blobs.memory_used)
+
+    def test_shared_storage_and_etags(self):
+        """
+        Objects with the same contents, in any container, share storage,
+        which is freed once every such object has been deleted or replaced.
+        Objects have the MD5 digest of their contents as their ``ETag``.
+        """
+        blobs = BlobStore()
+        self.core = MimicCore(Clock(), [SwiftMock(blobs=blobs)])
+        self.root = MimicRoot(self.core).app.resource()
+        self.auth_response = self.successResultOf(request(
+            self, self.root, "POST", "/identity/v2.0/tokens",
+            dumps({"auth": {"passwordCredentials": {
+                "username": "test1", "password": "test1password"}}})))
+        self.json_body = self.successResultOf(
+            treq.json_content(self.auth_response))
+        base = (self.json_body['access']['serviceCatalog'][0]['endpoints'][0]
+                ['publicURL'])
+        etag = "9d0568469d206c1aedf1b71f12f474bc"
+        for container in ["a", "b"]:
+            self.successResultOf(request(self, self.root, "PUT",
+                                         base + "/" + container))
+            response = self.successResultOf(request(
+                self, self.root, "PUT", base + "/" + container + "/o",
+                body=b"some bytes",
+                headers={"content-type": ["text/plain"]}))
+            self.assertEqual(201, response.code)
+            self.assertEqual([etag], response.headers.getRawHeaders("etag"))
+        self.assertEqual((1, 10), (len(blobs), blobs.memory_used))
+        response = self.successResultOf(
+            request(self, self.root, "GET", base + "/a/o"))
+        self.assertEqual([etag], response.headers.getRawHeaders("etag"))
+        listing = self.successResultOf(treq.json_content(
+            self.successResultOf(request(self, self.root, "GET",
+                                         base + "/a"))))
+        self.assertEqual(etag, listing[0]["hash"])
+
+        response = self.successResultOf(request(
+            self, self.root, "DELETE", base + "/a/o"))
+        self.assertEqual(204, response.code)
+        self.assertEqual(404, self.successResultOf(request(
+            self, self.root, "DELETE", base + "/a/o")).code)
+        self.assertEqual(1, len(blobs))
+        self.successResultOf(request(
+            self, self.root, "PUT", base + "/b/o", body=b"other bytes",
+            headers={"content-type": ["text/plain"]}))
+        self.assertEqual((1, 11), (len(blobs), blobs.memory_used))
+
+    def test_etag_mismatch(self):
+        """
+        An object PUT with an ``ETag`` which does not match its contents is
+        rejected with a 422, and not stored.
+        """
+        self.createSwiftService()
+        uri = (self.json_body['access']['serviceCatalog'][0]['endpoints'][0]
+               ['publicURL'] + '/testcontainer')
+        self.successResultOf(request(self, self.root, "PUT", uri))
+        response = self.successResultOf(request(
+            self, self.root, "PUT", uri + "/o", body=b"some bytes",
+            headers={"content-type": ["text/plain"], "etag": ["0" * 32]}))
+        self.assertEqual(422, response.code)
+        listing = self.successResultOf(treq.json_content(
+            self.successResultOf(request(self, self.root, "GET", uri))))
+        self.assertEqual([], listing)
+        response = self.successResultOf(request(
+            self, self.root, "PUT", uri + "/o", body=b"some bytes",
+            headers={"content-type": ["text/plain"],
+                     "etag": ['"9D0568469D206C1AEDF1B71F12F474BC"']}))
+        self.assertEqual(201, response.code)
+
+
+class RangeParsingTests(SynchronousTestCase):
+    """
+    Tests for :obj:`parse_ranges`.
+    """
+
+    def test_ranges(self):
+        """
+        Byte ranges are parsed into pairs of offsets, with the end exclusive,
+        clamped to the size of the body.
+        """
+        self.assertEqual([(0, 5)], parse_ranges("bytes=0-4", 10))
+        self.assertEqual([(5, 10)], parse_ranges("bytes=5-", 10))
+        self.assertEqual([(7, 10)], parse_ranges("bytes=-3", 10))
+        self.assertEqual([(0, 10)], parse_ranges("bytes=-30", 10))
+        self.assertEqual([(8, 10)], parse_ranges("bytes=8-20", 10))
+        self.assertEqual([(0, 1), (9, 10)],
+                         parse_ranges("bytes=0-0, -1", 10))
+
+    def test_unsatisfiable(self):
+        """
+        Ranges starting beyond the end of the body, and empty suffixes, are
+        dropped.
+        """
+        self.assertEqual([], parse_ranges("bytes=10-", 10))
+        self.assertEqual([], parse_ranges("bytes=-0", 10))
+        self.assertEqual([(0, 1)], parse_ranges("bytes=20-30,0-0", 10))
+
+    def test_invalid(self):
+        """
+        Headers which are not valid byte ranges are to be ignored.
+        """
+        for header in ["items=0-1", "bytes=1", "bytes=a-b", "bytes=5-4",
+                       "bytes=0-1,x"]:
+            self.assertIs(None, parse_ranges(header, 10), header)
+
+
+class SwiftObjectReadTests(SynchronousTestCase):
+    """
+    Tests for reading Swift objects in part, or conditionally, or only their
+    headers.
+    """
+
+    def setUp(self):
+        """
+        Create a container holding one object, modified at 100 seconds after
+        the epoch.
+        """
+        self.clock = Clock()
+        self.core = MimicCore(self.clock, [SwiftMock()])
+        self.root = MimicRoot(self.core).app.resource()
+        auth_response = self.successResultOf(request(
+            self, self.root, "POST", "/identity/v2.0/tokens",
+            dumps({"auth": {"passwordCredentials": {
+                "username": "test1", "password": "test1password"}}})))
+        json_body = self.successResultOf(treq.json_content(auth_response))
+        self.container_uri = (json_body['access']['serviceCatalog'][0]
+                              ['endpoints'][0]['publicURL'] + '/container')
+        self.uri = self.container_uri + "/object"
+        self.successResultOf(request(self, self.root, "PUT",
+                                     self.container_uri))
+        self.clock.advance(100)
+        self.successResultOf(request(
+            self, self.root, "PUT", self.uri, body=b"0123456789",
+            headers={"content-type": ["text/plain"]}))
+
+    def get(self, method="GET", uri=None, **headers):
+        """
+        Request the object with the given headers, returning the response
+        and its body.
+        """
+        response = self.successResultOf(request(
+            self, self.root, method, uri or self.uri,
+            headers=dict((name.replace("_", "-"), [value])
+                         for (name, value) in headers.items())))
+        return response, self.successResultOf(treq.content(response))
+
+    def test_single_range(self):
+        """
+        A single range is served as partial content, with its content range.
+        """
+        response, body = self.get(range="bytes=2-4")
+        self.assertEqual((206, b"234"), (response.code, body))
+        self.assertEqual(["bytes 2-4/10"],
+                         response.headers.getRawHeaders("content-range"))
+        self.assertEqual(["text/plain"],
+                         response.headers.getRawHeaders("content-type"))
+
+    def test_multiple_ranges(self):
+        """
+        Several ranges are served as a ``multipart/byteranges`` body, with a
+        part for each range.
+        """
+        response, body = self.get(range="bytes=0-1,-2")
+        self.assertEqual(206, response.code)
+        content_type = response.headers.getRawHeaders("content-type")[0]
+        prefix = "multipart/byteranges; boundary="
+        self.assertTrue(content_type.startswith(prefix))
+        boundary = content_type[len(prefix):].encode("ascii")
+        self.assertEqual(
+            b"\r\n--" + boundary + b"\r\nContent-Type: text/plain\r\n"
+            b"Content-Range: bytes 0-1/10\r\n\r\n01"
+            b"\r\n--" + boundary + b"\r\nContent-Type: text/plain\r\n"
+            b"Content-Range: bytes 8-9/10\r\n\r\n89"
+            b"\r\n--" + boundary + b"--\r\n",
+            body)
+
+    def test_unsatisfiable_range(self):
+        """
+        A range beyond the end of the object is not satisfiable, while an
+        invalid range header is ignored.
+        """
+        response, body = self.get(range="bytes=10-")
+        self.assertEqual(416, response.code)
+        self.assertEqual(["bytes */10"],
+                         response.headers.getRawHeaders("content-range"))
+        response, body = self.get(range="bytes=oops")
+        self.assertEqual((200, b"0123456789"), (response.code, body))
+
+    def test_head(self):
+        """
+        A HEAD request for an object gets its headers but no body; for a
+        container, it gets a 204.
+        """
+        response, body = self.get("HEAD")
+        self.assertEqual((200, b""), (response.code, body))
+        self.assertEqual(
+            (["text/plain"], ["781e5e245d69b566979b86e28d23f2c7"],
+             ["Thu, 01 Jan 1970 00:01:40 GMT"]),
+            (response.headers.getRawHeaders("content-type"),
+             response.headers.getRawHeaders("etag"),
+             response.headers.getRawHeaders("last-modified")))
+        response, body = self.get("HEAD", self.container_uri)
+        self.assertEqual(204, response.code)
+        self.assertEqual(
+            (["1"], ["10"]),
+            (response.headers.getRawHeaders("x-container-object-count"),
+             response.headers.getRawHeaders("x-container-bytes-used")))
+
+    def test_if_none_match(self):
+        """
+        A GET with an ``If-None-Match`` header matching the object's ETag gets
+        a 304 and no body, regardless of ``If-Modified-Since``.
+        """
+        etag = "781e5e245d69b566979b86e28d23f2c7"
+        for header in [etag, '"other", "{0}"'.format(etag), "*"]:
+            response, body = self.get(if_none_match=header)
+            self.assertEqual((304, b""), (response.code, body), header)
+        response, body = self.get(
+            if_none_match="other",
+            if_modified_since="Thu, 01 Jan 1970 00:01:40 GMT")
+        self.assertEqual(200, response.code)
+
+    def test_if_modified_since(self):
+        """
+        A GET with an ``If-Modified-Since`` header no earlier than the time
+        the object was modified gets a 304; an earlier or invalid one gets the
+        object.
+        """
+        response, body = self.get(
+            if_modified_since="Thu, 01 Jan 1970 00:01:40 GMT")
+        self.assertEqual((304, b""), (response.code, body))
+        for header in ["Thu, 01 Jan 1970 00:01:39 GMT", "yesterday"]:
+            response, body = self.get(if_modified_since=header)
+            self.assertEqual((200, b"0123456789"), (response.code, body))
+
+    def test_missing_object(self):
+        """
+        Getting an object which does not exist, or is in a container which
+        does not exist, results in a 404.
+        """
+        self.assertEqual(404, self.get(uri=self.uri + "2")[0].code)
+        self.assertEqual(404, self.get(uri=self.container_uri + "2/o")[0].code)
+
+
+class ContainerListingTests(SynchronousTestCase):
+    """
+    Tests for listing the objects in a container.
+    """
+
+    def setUp(self):
+        """
+        Create a container holding objects with names like paths.
+        """
+        core = MimicCore(Clock(), [SwiftMock()])
+        self.root = MimicRoot(core).app.resource()
+        auth_response = self.successResultOf(request(
+            self, self.root, "POST", "/identity/v2.0/tokens",
+            dumps({"auth": {"passwordCredentials": {
+                "username": "test1", "password": "test1password"}}})))
+        json_body = self.successResultOf(treq.json_content(auth_response))
+        self.uri = (json_body['access']['serviceCatalog'][0]['endpoints'][0]
+                    ['publicURL'] + '/container')
+        self.successResultOf(request(self, self.root, "PUT", self.uri))
+        self.names = ["a", "b/1", "b/2", "b/3/x", "c", "d/1"]
+        for name in reversed(self.names):
+            self.successResultOf(request(
+                self, self.root, "PUT", self.uri + "/" + name,
+                body=name.encode("ascii"),
+                headers={"content-type": ["text/plain"]}))
+
+    def list(self, query=""):
+        """
+        List the container with the given query string, returning the
+        response and the names (or subdirectories) listed.
+        """
+        response = self.successResultOf(request(
+            self, self.root, "GET", self.uri + query))
+        if response.code != 200:
+            return response, None
+        listing = self.successResultOf(treq.json_content(response))
+        return response, [entry.get("name", entry.get("subdir"))
+                          for entry in listing]
+
+    def test_sorted_with_totals(self):
+        """
+        Objects are listed in order of name, and the container's headers
+        count them and their bytes, as they are replaced and deleted.
+        """
+        response, names = self.list()
+        self.assertEqual(self.names, names)
+        self.assertEqual(
+            (["6"], ["16"]),
+            (response.headers.getRawHeaders("x-container-object-count"),
+             response.headers.getRawHeaders("x-container-bytes-used")))
+        self.successResultOf(request(
+            self, self.root, "PUT", self.uri + "/a", body=b"four",
+            headers={"content-type": ["text/plain"]}))
+        self.successResultOf(request(self, self.root, "DELETE",
+                                     self.uri + "/b/3/x"))
+        response, names = self.list()
+        self.assertEqual(["a", "b/1", "b/2", "c", "d/1"], names)
+        self.assertEqual(
+            (["5"], ["14"]),
+            (response.headers.getRawHeaders("x-container-object-count"),
+             response.headers.getRawHeaders("x-container-bytes-used")))
+
+    def test_last_modified(self):
+        """
+        Each object in a listing has the time it was last modified.
+        """
+        response = self.successResultOf(request(
+            self, self.root, "GET", self.uri))
+        listing = self.successResultOf(treq.json_content(response))
+        self.assertEqual("1970-01-01T00:00:00.000000",
+                         listing[0]["last_modified"])
+
+    def test_prefix_and_delimiter(self):
+        """
+        A prefix limits the listing to names starting with it, and a
+        delimiter rolls up the names containing it after the prefix into
+        subdirectories.
+        """
+        self.assertEqual(["b/1", "b/2", "b/3/x"], self.list("?prefix=b/")[1])
+        self.assertEqual(["a", "b/", "c", "d/"],
+                         self.list("?delimiter=/")[1])
+        self.assertEqual(["b/1", "b/2", "b/3/"],
+                         self.list("?prefix=b/&delimiter=/")[1])
+
+    def test_markers_and_limit(self):
+        """
+        Listings start after the marker, end before the end marker, and
+        have at most ``limit`` entries; a subdirectory which is the marker is
+        not listed again.
+        """
+        self.assertEqual(["b/2", "b/3/x", "c"],
+                         self.list("?marker=b/1&end_marker=d")[1])
+        self.assertEqual(["a", "b/1"], self.list("?limit=2")[1])
+        self.assertEqual(["c", "d/"],
+                         self.list("?marker=b/&delimiter=/")[1])
+        self.assertEqual(["b/2"],
+                         self.list("?prefix=b/&marker=b/1&limit=1")[1])
+
+    def test_invalid_limit(self):
+        """
+        A limit which is not a non-negative integer is a bad request, and one
+        over the maximum fails.
+        """
+        self.assertEqual(400, self.list("?limit=x")[0].code)
+        self.assertEqual(400, self.list("?limit=-1")[0].code)
+        self.assertEqual(412, self.list("?limit=10001")[0].code)
+
+
+def tar_archive(files, mode="w"):
+    """
+    Create a tar archive holding files with the given names and contents.
+    """
+    data = BytesIO()
+    archive = tarfile.open(fileobj=data, mode=mode)
+    for name, contents in files:
+        info = tarfile.TarInfo(name)
+        info.size = len(contents)
+        archive.addfile(info, BytesIO(contents))
+    archive.close()
+    return data.getvalue()
+
+
+class BulkOperationTests(SynchronousTestCase):
+    """
+    Tests for bulk deletes and archive extraction.
+    """
+
+    def setUp(self):
+        """
+        Create a container holding two objects, and an empty one.
+        """
+        self.blobs = BlobStore()
+        core = MimicCore(Clock(), [SwiftMock(blobs=self.blobs)])
+        self.root = MimicRoot(core).app.resource()
+        auth_response = self.successResultOf(request(
+            self, self.root, "POST", "/identity/v2.0/tokens",
+            dumps({"auth": {"passwordCredentials": {
+                "username": "test1", "password": "test1password"}}})))
+        json_body = self.successResultOf(treq.json_content(auth_response))
+        self.uri = (json_body['access']['serviceCatalog'][0]['endpoints'][0]
+                    ['publicURL'])
+        for container in ["full", "empty"]:
+            self.successResultOf(request(self, self.root, "PUT",
+                                         self.uri + "/" + container))
+        for name in ["a b", "c"]:
+            self.successResultOf(request(
+                self, self.root, "PUT", self.uri + "/full/" + quote(name),
+                body=name.encode("ascii"),
+                headers={"content-type": ["text/plain"]}))
+
+    def bulk(self, method, query, body, path="", json=True):
+        """
+        Make a bulk request, returning the response and its body, decoded
+        from JSON if ``json`` is true.
+        """
+        response = self.successResultOf(request(
+            self, self.root, method, self.uri + path + query, body=body,
+            headers={"accept": ["application/json" if json else "text/plain"]}))
+        content = self.successResultOf(treq.content(response))
+        return response, loads(content) if json else content
+
+    def names(self, container):
+        """
+        List the names of the objects in a container, or return the response
+        code if it cannot be listed.
+        """
+        response = self.successResultOf(request(
+            self, self.root, "GET", self.uri + "/" + container))
+        if response.code != 200:
+            return response.code
+        return [entry["name"] for entry in
+                self.successResultOf(treq.json_content(response))]
+
+    def test_bulk_delete(self):
+        """
+        A bulk delete deletes each object and empty container listed, counts
+        those which are not found, and reports the containers which are not
+        empty as conflicts.
+        """
+        response, body = self.bulk(
+            "POST", "?bulk-delete",
+            b"/full/a%20b\nfull/missing\n\n/empty\n/full\n/nowhere/c\n")
+        self.assertEqual(200, response.code)
+        self.assertEqual({"Number Deleted": 2, "Number Not Found": 2,
+                          "Response Body": "",
+                          "Response Status": "400 Bad Request",
+                          "Errors": [["full", "409 Conflict"]]}, body)
+        self.assertEqual(["c"], self.names("full"))
+        self.assertEqual(404, self.names("empty"))
+        response, body = self.bulk("DELETE", "?bulk-delete",
+                                   b"/full/c\n/full\n")
+        self.assertEqual((2, "200 OK", []),
+                         (body["Number Deleted"], body["Response Status"],
+                          body["Errors"]))
+        self.assertEqual((0, 0), (len(self.blobs), self.blobs.memory_used))
+
+    def test_bulk_delete_text(self):
+        """
+        Without asking for JSON, the summary is plain text.
+        """
+        response, body = self.bulk("POST", "?bulk-delete", b"/full\n",
+                                   json=False)
+        self.assertEqual(
+            b"Number Deleted: 0\nNumber Not Found: 0\nResponse Body: \n"
+            b"Response Status: 400 Bad Request\nErrors:\nfull, 409 Conflict\n",
+            body)
+
+    def test_bulk_delete_limit(self):
+        """
+        No more than :obj:`MAX_BULK_DELETES` paths are deleted by a request.
+        """
+        self.patch(swift_api, "MAX_BULK_DELETES", 1)
+        response, body = self.bulk("POST", "?bulk-delete",
+                                   b"/full/a%20b\n/full/c\n")
+        self.assertEqual((1, "413 Request Entity Too Large"),
+                         (body["Number Deleted"], body["Response Status"]))
+        self.assertEqual(["c"], self.names("full"))
+
+    def test_bulk_delete_needs_parameter(self):
+        """
+        A POST to the account without ``?bulk-delete`` is a bad request.
+        """
+        response = self.successResultOf(request(
+            self, self.root, "POST", self.uri, body=b"/full\n"))
+        self.assertEqual(400, response.code)
+
+    def test_extract_into_container(self):
+        """
+        Extracting an archive into a container stores each file in it as an
+        object, under the prefix given by the path, with a content type
+        guessed from its name.
+        """
+        archive = tar_archive([("./x.txt", b"x"), ("dir/y", b"y")])
+        response, body = self.bulk("PUT", "?extract-archive=tar", archive,
+                                   path="/empty/pre")
+        self.assertEqual({"Number Files Created": 2, "Response Body": "",
+                          "Response Status": "201 Created", "Errors": []},
+                         body)
+        self.assertEqual(["pre/dir/y", "pre/x.txt"], self.names("empty"))
+        response = self.successResultOf(request(
+            self, self.root, "GET", self.uri + "/empty/pre/x.txt"))
+        self.assertEqual(["text/plain"],
+                         response.headers.getRawHeaders("content-type"))
+        self.assertEqual(b"x", self.successResultOf(treq.content(response)))
+
+    def test_extract_into_account(self):
+        """
+        Extracting a compressed archive into the account stores each file in
+        the container named by its first directory, creating it if need be;
+        files with no directory are errors.
+        """
+        archive = tar_archive([("new/a", b"a"), ("full/c", b"new c"),
+                               ("top", b"top")], mode="w:gz")
+        response, body = self.bulk("PUT", "?extract-archive=tar.gz", archive)
+        self.assertEqual((2, "400 Bad Request", [["top", "400 Bad Request"]]),
+                         (body["Number Files Created"],
+                          body["Response Status"], body["Errors"]))
+        self.assertEqual(["a"], self.names("new"))
+        response = self.successResultOf(request(
+            self, self.root, "GET", self.uri + "/full/c"))
+        self.assertEqual(b"new c",
+                         self.successResultOf(treq.content(response)))
+
+    def test_extract_invalid(self):
+        """
+        An unknown archive format is a bad request; a corrupt archive, or one
+        for a container which does not exist, is reported as such.
+        """
+        response, body = self.bulk("PUT", "?extract-archive=zip", b"",
+                                   path="/empty", json=False)
+        self.assertEqual(400, response.code)
+        response, body = self.bulk("PUT", "?extract-archive=tar.gz",
+                                   b"not a tar file", path="/empty")
+        self.assertEqual(("400 Bad Request", "Invalid Tar File"),
+                         (body["Response Status"], body["Response Body"]))
+        response, body = self.bulk("PUT", "?extract-archive=tar",
+                                   tar_archive([]), path="/nowhere", json=False)
+        self.assertEqual(404, response.code)
+
+
+class LargeObjectTests(SynchronousTestCase):
+    """
+    Tests for static and dynamic large objects.
+    """
+
+    def setUp(self):
+        """
+        Create a container holding three segments.
+        """
+        core = MimicCore(Clock(), [SwiftMock()])
+        self.root = MimicRoot(core).app.resource()
+        auth_response = self.successResultOf(request(
+            self, self.root, "POST", "/identity/v2.0/tokens",
+            dumps({"auth": {"passwordCredentials": {
+                "username": "test1", "password": "test1password"}}})))
+        json_body = self.successResultOf(treq.json_content(auth_response))
+        self.uri = (json_body['access']['serviceCatalog'][0]['endpoints'][0]
+                    ['publicURL'])
+        self.successResultOf(request(self, self.root, "PUT",
+                                     self.uri + "/segments"))
+        for name, data in [("part/1", b"0123"), ("part/2", b"456"),
+                           ("part/3", b"789")]:
+            self.put("/segments/" + name, data)
+
+    def put(self, path, body, query="", **headers):
+        """
+        Put an object, returning the response and its body.
+        """
+        headers = dict((name.replace("_", "-"), [value])
+                       for (name, value) in headers.items())
+        headers.setdefault("content-type", ["text/plain"])
+        response = self.successResultOf(request(
+            self, self.root, "PUT", self.uri + path + query, body=body,
+            headers=headers))
+        return response, self.successResultOf(treq.content(response))
+
+    def get(self, path, query="", **headers):
+        """
+        Get an object, returning the response and its body.
+        """
+        response = self.successResultOf(request(
+            self, self.root, "GET", self.uri + path + query,
+            headers=dict((name, [value]) for (name, value) in headers.items())))
+        return response, self.successResultOf(treq.content(response))
+
+    def manifest(self, *paths):
+        """
+        The body of a static large object manifest with the given segments.
+        """
+        return dumps([{"path": "/segments/" + path, "etag": None,
+                       "size_bytes": None} for path in paths]).encode("utf-8")
+
+    def test_static(self):
+        """
+        A static large object reads as its segments, in the order listed,
+        and has the digest of their ETags as its ETag.
+        """
+        response, body = self.put("/segments/big",
+                                  self.manifest("part/3", "part/1"),
+                                  "?multipart-manifest=put")
+        self.assertEqual(201, response.code)
+        etag = '"{0}"'.format(md5(
+            (md5(b"789").hexdigest() +
+             md5(b"0123").hexdigest()).encode("ascii")).hexdigest())
+        self.assertEqual([etag], response.headers.getRawHeaders("etag"))
+        response, body = self.get("/segments/big")
+        self.assertEqual((200, b"7890123", 7),
+                         (response.code, body, response.length))
+        self.assertEqual([etag], response.headers.getRawHeaders("etag"))
+        self.assertEqual(["True"], response.headers.getRawHeaders(
+            "x-static-large-object"))
+
+    def test_ranges(self):
+        """
+        Ranges of a large object may span several of its segments.
+        """
+        self.put("/segments/big", self.manifest("part/1", "part/2", "part/3"),
+                 "?multipart-manifest=put")
+        response, body = self.get("/segments/big", range="bytes=3-7")
+        self.assertEqual((206, b"34567"), (response.code, body))
+        self.assertEqual(["bytes 3-7/10"],
+                         response.headers.getRawHeaders("content-range"))
+
+    def test_static_manifest(self):
+        """
+        ``?multipart-manifest=get`` reads the manifest of a static large
+        object, and ``?multipart-manifest=delete`` deletes its segments along
+        with it.
+        """
+        self.put("/segments/big", self.manifest("part/1", "part/2"),
+                 "?multipart-manifest=put")
+        response, body = self.get("/segments/big", "?multipart-manifest=get")
+        self.assertEqual(
+            [("/segments/part/1", md5(b"0123").hexdigest(), 4, "text/plain"),
+             ("/segments/part/2", md5(b"456").hexdigest(), 3, "text/plain")],
+            [(entry["name"], entry["hash"], entry["bytes"],
+              entry["content_type"]) for entry in loads(body)])
+        response = self.successResultOf(request(
+            self, self.root, "DELETE",
+            self.uri + "/segments/big?multipart-manifest=delete",
+            headers={"accept": ["application/json"]}))
+        self.assertEqual(3, self.successResultOf(
+            treq.json_content(response))["Number Deleted"])
+        response = self.successResultOf(request(
+            self, self.root, "GET", self.uri + "/segments"))
+        self.assertEqual(["part/3"], [
+            entry["name"] for entry in
+            self.successResultOf(treq.json_content(response))])
+
+    def test_invalid_static_manifest(self):
+        """
+        A static large object is not created if its manifest is not a list
+        of segments, or a segment is missing or does not match its ETag or
+        size.
+        """
+        response, body = self.put("/segments/big", b"{}",
+                                  "?multipart-manifest=put")
+        self.assertEqual(400, response.code)
+        response, body = self.put("/segments/big", dumps([
+            {"path": "/segments/missing"},
+            {"path": "/segments/part/1", "etag": "nope"},
+            {"path": "/segments/part/2", "size_bytes": 1},
+            {"path": "/segments/part/3", "size_bytes": 3}]).encode("utf-8"),
+            "?multipart-manifest=put")
+        self.assertEqual((400, b"Errors:\n/segments/missing, 404 Not Found\n"
+                          b"/segments/part/1, Etag Mismatch\n"
+                          b"/segments/part/2, Size Mismatch\n"),
+                         (response.code, body))
+        response, body = self.get("/segments/big")
+        self.assertEqual(404, response.code)
+
+    def test_static_segment_replaced(self):
+        """
+        Reading a static large object one of whose segments has been replaced
+        is a conflict.
+        """
+        self.put("/segments/big", self.manifest("part/1"),
+                 "?multipart-manifest=put")
+        self.put("/segments/part/1", b"changed")
+        response, body = self.get("/segments/big")
+        self.assertEqual(409, response.code)
+
+    def test_dynamic(self):
+        """
+        A dynamic large object reads as whichever objects have its prefix
+        when it is read, in order of name, and deleting it leaves them be.
+        """
+        response, body = self.put("/segments/big", b"",
+                                  x_object_manifest="segments/part/")
+        self.assertEqual(201, response.code)
+        response, body = self.get("/segments/big")
+        self.assertEqual(b"0123456789", body)
+        self.assertEqual(["segments/part/"],
+                         response.headers.getRawHeaders("x-object-manifest"))
+        self.put("/segments/part/0", b"-")
+        response, body = self.get("/segments/big", range="bytes=-5")
+        self.assertEqual(b"56789", body)
+        response, body = self.get("/segments/big")
+        self.assertEqual(b"-0123456789", body)
+        response = self.successResultOf(request(
+            self, self.root, "DELETE", self.uri + "/segments/big"))
+        self.assertEqual(204, response.code)
+        response, body = self.get("/segments/part/0")
+        self.assertEqual(200, response.code)
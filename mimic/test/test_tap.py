@@ -16,11 +16,16 @@ from twisted.internet.defer import succeed
 
 from twisted.plugin import IPlugin
 from twisted.python.filepath import FilePath
+from twisted.python.usage import UsageError
 
 from twisted.trial.unittest import SynchronousTestCase
 
 from mimic.core import MimicCore
+from mimic.session import SQLiteSessionBackend
+from mimic.snapshot import SnapshotService
 from mimic.tap import Options, makeService
+from mimic.util import logger, storage
+from mimic.workers import WorkerPool
 
 
 @implementer(IStreamServerEndpoint)
@@ -123,8 +128,8 @@ class TapTests(SynchronousTestCase):
 
         class CheckClock(MimicCore):
             @classmethod
-            def fromPlugins(cls, clock):
-                result = super(CheckClock, cls).fromPlugins(clock)
+            def fromPlugins(cls, clock, **kwargs):
+                result = super(CheckClock, cls).fromPlugins(clock, **kwargs)
                 CheckClock.clock = clock
                 return result
         from mimic import tap
@@ -133,3 +138,178 @@ class TapTests(SynchronousTestCase):
         # Grab the global reactor just for comparison.
         from twisted.internet import reactor as real_reactor
         self.assertIdentical(CheckClock.clock, real_reactor)
+
+    def test_session_db(self):
+        """
+        The C{--session-db} option specifies the path of an SQLite database in
+        which the sessions of the service's L{MimicCore} are kept.
+        """
+        path = self.mktemp()
+        o = Options()
+        o.parseOptions(["--session-db", path])
+
+        class CheckBackend(MimicCore):
+            @classmethod
+            def fromPlugins(cls, clock, **kwargs):
+                result = super(CheckBackend, cls).fromPlugins(clock, **kwargs)
+                CheckBackend.core = result
+                return result
+        from mimic import tap
+        self.patch(tap, "MimicCore", CheckBackend)
+        makeService(o)
+        backend = CheckBackend.core.sessions._backend
+        self.assertIsInstance(backend, SQLiteSessionBackend)
+        self.assertTrue(FilePath(path).exists())
+
+    def test_workers(self):
+        """
+        With C{--workers} greater than 1, L{makeService} creates a
+        L{WorkerPool} listening on the given TCP port, whose workers share a
+        session database and service IDs.
+        """
+        o = Options()
+        o.parseOptions(["--workers", "3", "--listen",
+                        "tcp:4321:interface=127.0.0.1"])
+        pool = makeService(o)
+        self.addCleanup(pool.stopService)
+        self.assertIsInstance(pool, WorkerPool)
+        self.assertEqual(("127.0.0.1", 4321, 3),
+                         (pool._interface, pool._port, pool._count))
+        self.assertIn("--session-db", pool._worker_arguments)
+        self.assertIn("--service-id-seed", pool._worker_arguments)
+
+    def test_workers_session_db_removed(self):
+        """
+        Without C{--session-db}, the session database the workers share is
+        created in a temporary directory, which is removed when the
+        L{WorkerPool} stops; a given session database is left alone.
+        """
+        o = Options()
+        o.parseOptions(["--workers", "2"])
+        pool = makeService(o)
+        arguments = pool._worker_arguments
+        directory = FilePath(
+            arguments[arguments.index("--session-db") + 1]).parent()
+        self.assertTrue(directory.isdir())
+        pool.stopService()
+        self.assertFalse(FilePath(directory.path).exists())
+
+        path = self.mktemp()
+        o = Options()
+        o.parseOptions(["--workers", "2", "--session-db", path])
+        SQLiteSessionBackend(path)
+        makeService(o).stopService()
+        self.assertTrue(FilePath(path).exists())
+
+    def test_workers_need_tcp(self):
+        """
+        Workers can only listen on a TCP port.
+        """
+        o = Options()
+        self.assertRaises(UsageError, o.parseOptions,
+                          ["--workers", "2", "--listen", "unix:/tmp/mimic"])
+        self.assertRaises(UsageError, o.parseOptions, ["--workers", "0"])
+
+    def test_logging(self):
+        """
+        The C{--log-level} and C{--access-log-sample} options set the level
+        of messages logged and the fraction of requests in the access log.
+        """
+        self.patch(logger, "_level", logger.INFO)
+        self.patch(logger, "_access_sample_rate", 0)
+        self.patch(storage, "_memory_limit", storage._memory_limit)
+        o = Options()
+        o.parseOptions(["--log-level", "debug", "--access-log-sample", "0.5"])
+        makeService(o)
+        self.assertEqual((logger.DEBUG, 0.5),
+                         (logger._level, logger._access_sample_rate))
+
+    def test_swift_memory_limit(self):
+        """
+        The C{--swift-memory-limit} option sets the number of megabytes of
+        Swift object data kept in memory, and may not be negative.
+        """
+        self.patch(storage, "_memory_limit", 0)
+        o = Options()
+        o.parseOptions(["--swift-memory-limit", "3"])
+        makeService(o)
+        self.assertEqual(3 * 1024 * 1024, storage._memory_limit)
+        self.assertRaises(UsageError, Options().parseOptions,
+                          ["--swift-memory-limit", "-1"])
+
+    def test_state_file(self):
+        """
+        The C{--state-file} option restores the state saved in a snapshot
+        file, if there is one, and saves it again when Mimic stops; service
+        IDs are the same from one run to the next.  It may not be used with
+        several workers.
+        """
+        path = self.mktemp()
+        cores = []
+
+        class CheckCore(MimicCore):
+            @classmethod
+            def fromPlugins(cls, clock, **kwargs):
+                result = super(CheckCore, cls).fromPlugins(clock, **kwargs)
+                cores.append(result)
+                return result
+        from mimic import tap
+        self.patch(tap, "MimicCore", CheckCore)
+        o = Options()
+        o.parseOptions(["--state-file", path])
+        [snapshots] = [child for child in makeService(o)
+                       if isinstance(child, SnapshotService)]
+        session = cores[0].sessions.session_for_username_password("user",
+                                                                  "pass")
+        snapshots.startService()
+        snapshots.stopService()
+        self.assertTrue(FilePath(path).exists())
+        makeService(o)
+        self.assertEqual(session.token, cores[1].sessions.
+                         session_for_username_password("user", "pass").token)
+        self.assertEqual(sorted(cores[0]._uuid_to_api),
+                         sorted(cores[1]._uuid_to_api))
+        self.assertRaises(UsageError, Options().parseOptions,
+                          ["--state-file", path, "--workers", "2"])
+
+    def test_wal_file(self):
+        """
+        The C{--wal-file} option logs every session created, and replays
+        them at startup; it may only be used with a state file, and its sync
+        interval may not be negative.
+        """
+        state, wal = self.mktemp(), self.mktemp()
+        cores = []
+
+        class CheckCore(MimicCore):
+            @classmethod
+            def fromPlugins(cls, clock, **kwargs):
+                result = super(CheckCore, cls).fromPlugins(clock, **kwargs)
+                cores.append(result)
+                return result
+        from mimic import tap
+        self.patch(tap, "MimicCore", CheckCore)
+        o = Options()
+        o.parseOptions(["--state-file", state, "--wal-file", wal,
+                        "--wal-sync-interval", "0"])
+        makeService(o)
+        session = cores[0].sessions.session_for_username_password("user",
+                                                                  "pass")
+        makeService(o)
+        self.assertFalse(FilePath(state).exists())
+        self.assertEqual(session.token, cores[1].sessions.
+                         session_for_username_password("user", "pass").token)
+        self.assertRaises(UsageError, Options().parseOptions,
+                          ["--wal-file", wal])
+        self.assertRaises(UsageError, Options().parseOptions,
+                          ["--state-file", state, "--wal-file", wal,
+                           "--wal-sync-interval", "-1"])
+
+    def test_logging_invalid(self):
+        """
+        Unknown log levels and sample rates outside of 0 to 1 are rejected.
+        """
+        o = Options()
+        self.assertRaises(UsageError, o.parseOptions, ["--log-level", "loud"])
+        self.assertRaises(UsageError, o.parseOptions,
+                          ["--access-log-sample", "2"])
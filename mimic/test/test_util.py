@@ -3,6 +3,8 @@ Unit tests for :mod:`mimic.util`
 """
 from characteristic import Attribute
 from twisted.trial.unittest import SynchronousTestCase
+from twisted.web.server import Request
+from twisted.web.test.requesthelper import DummyChannel
 
 from mimic.util import helper
 
@@ -68,3 +70,195 @@ class HelperTests(SynchronousTestCase):
         for match in matches:
             self.assertEqual(match[1],
                              helper.seconds_to_timestamp(0, match[0]))
+
+    def test_seconds_to_timestamp_remembered(self):
+        """
+        :func:`helper.seconds_to_timestamp` remembers the timestamps it has
+        formatted, separately for each format.
+        """
+        first = helper.seconds_to_timestamp(86400.25)
+        self.assertIdentical(first, helper.seconds_to_timestamp(86400.25))
+        self.assertEqual("1970-01-02",
+                         helper.seconds_to_timestamp(86400.25, "%Y-%m-%d"))
+
+
+class TimestampTests(SynchronousTestCase):
+    """
+    Tests for :func:`helper.timestamp_to_seconds`
+    """
+    def test_round_trip(self):
+        """
+        :func:`helper.timestamp_to_seconds` inverts
+        :func:`helper.seconds_to_timestamp`, and also accepts timestamps
+        without fractional seconds.
+        """
+        self.assertEqual(
+            1234.5,
+            helper.timestamp_to_seconds(helper.seconds_to_timestamp(1234.5)))
+        self.assertEqual(
+            86400, helper.timestamp_to_seconds("1970-01-02T00:00:00Z"))
+        self.assertRaises(ValueError, helper.timestamp_to_seconds, "today")
+
+
+class BoundedCacheTests(SynchronousTestCase):
+    """
+    Tests for :class:`helper.BoundedCache`
+    """
+    def test_get_and_set(self):
+        """
+        Values that are set can be retrieved; missing keys yield the default.
+        """
+        cache = helper.BoundedCache(2)
+        cache.set("a", 1)
+        self.assertEqual(1, cache.get("a"))
+        self.assertIn("a", cache)
+        self.assertIdentical(None, cache.get("b"))
+        self.assertEqual("default", cache.get("b", "default"))
+
+    def test_oldest_evicted_when_full(self):
+        """
+        Adding a new key to a full cache evicts the earliest-added key, while
+        replacing the value of an existing key evicts nothing.
+        """
+        cache = helper.BoundedCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.set("b", 3)
+        self.assertEqual(2, len(cache))
+        cache.set("c", 4)
+        self.assertEqual(2, len(cache))
+        self.assertNotIn("a", cache)
+        self.assertEqual(3, cache.get("b"))
+        self.assertEqual(4, cache.get("c"))
+
+    def test_clear(self):
+        """
+        Clearing the cache removes every entry.
+        """
+        cache = helper.BoundedCache(2)
+        cache.set("a", 1)
+        cache.clear()
+        self.assertEqual(0, len(cache))
+        cache.set("b", 2)
+        cache.set("c", 3)
+        self.assertEqual(2, len(cache))
+
+
+class SubstringIndexTests(SynchronousTestCase):
+    """
+    Tests for :class:`helper.SubstringIndex`
+    """
+    def setUp(self):
+        """
+        Create an index with a few keys, one of which has two items.
+        """
+        self.index = helper.SubstringIndex()
+        self.index.add("web-server-1", 1)
+        self.index.add("web-server-2", 2)
+        self.index.add("db-server", 3)
+        self.index.add("db-server", 4)
+        self.index.add("db", 5)
+
+    def test_containing(self):
+        """
+        :obj:`SubstringIndex.containing` finds the items whose key contains
+        the given fragment, whether or not it is shorter than a trigram.
+        """
+        self.assertEqual(set([1, 2, 3, 4]), self.index.containing("server"))
+        self.assertEqual(set([2]), self.index.containing("r-2"))
+        self.assertEqual(set([3, 4, 5]), self.index.containing("db"))
+        self.assertEqual(set([1, 2, 3, 4, 5]), self.index.containing(""))
+        self.assertEqual(set(), self.index.containing("rev"))
+        self.assertEqual(set(), self.index.containing("server-3"))
+
+    def test_with_prefix(self):
+        """
+        :obj:`SubstringIndex.with_prefix` finds the items whose key starts
+        with the given prefix.
+        """
+        self.assertEqual(set([1, 2]), self.index.with_prefix("web-"))
+        self.assertEqual(set([3, 4, 5]), self.index.with_prefix("db"))
+        self.assertEqual(set(), self.index.with_prefix("server"))
+
+    def test_remove(self):
+        """
+        Removing an item stops it being found, and removing the last item
+        for a key forgets the key entirely.
+        """
+        self.index.remove("db-server", 3)
+        self.assertEqual(set([4]), self.index.containing("db-"))
+        self.index.remove("db-server", 4)
+        self.assertEqual(set([5]), self.index.with_prefix("db"))
+        self.assertEqual(set([1, 2]), self.index.containing("server"))
+        self.assertEqual(["db", "web-server-1", "web-server-2"],
+                         self.index._sorted_keys)
+        self.assertNotIn("db-", self.index._trigrams)
+
+
+class ResponseCacheTests(SynchronousTestCase):
+    """
+    Tests for :class:`helper.ResponseCache`
+    """
+    def setUp(self):
+        """
+        Create a cache, and a render function which counts its calls.
+        """
+        self.cache = helper.ResponseCache()
+        self.renders = []
+
+    def render(self, code=200):
+        """
+        Render a response body, with the given response code.
+        """
+        self.renders.append(code)
+        return {"renders": len(self.renders)}, code
+
+    def respond(self, key, code=200, if_none_match=None):
+        """
+        Respond to a new request, returning it and the body.
+        """
+        request = Request(DummyChannel(), False)
+        request.method = b"GET"
+        if if_none_match is not None:
+            request.requestHeaders.setRawHeaders(b"if-none-match",
+                                                 [if_none_match])
+        return request, self.cache.respond(request, key,
+                                           lambda: self.render(code))
+
+    def test_cached_by_key(self):
+        """
+        A body is rendered once for each key, and carries an ETag which
+        differs for each key.
+        """
+        first, body = self.respond(("a", 1))
+        self.assertEqual('{"renders": 1}', body)
+        second, body = self.respond(("a", 1))
+        self.assertEqual('{"renders": 1}', body)
+        third, body = self.respond(("a", 2))
+        self.assertEqual('{"renders": 2}', body)
+        self.assertEqual(first.etag, second.etag)
+        self.assertNotEqual(first.etag, third.etag)
+
+    def test_not_cached(self):
+        """
+        Responses without a key, or with a response code other than 200, are
+        rendered every time and have no ETag.
+        """
+        for key, code in [(None, 200), (None, 404), ("a", 404), ("a", 404)]:
+            request, body = self.respond(key, code)
+            self.assertEqual(code, request.code)
+            self.assertIdentical(None, request.etag)
+        self.assertEqual(4, len(self.renders))
+
+    def test_not_modified(self):
+        """
+        A request whose ``If-None-Match`` matches the ETag is answered with
+        304 and no body.
+        """
+        request, body = self.respond("a")
+        request, body = self.respond("a", if_none_match=request.etag)
+        self.assertEqual(304, request.code)
+        self.assertEqual(b'', body)
+        request, body = self.respond("a", if_none_match=b'"other"')
+        self.assertEqual(200, request.code)
+        self.assertEqual('{"renders": 1}', body)
@@ -0,0 +1,364 @@
+"""
+Tests for :mod:`mimic.workers`
+"""
+
+import socket
+from io import BytesIO
+
+from twisted.internet.address import IPv4Address
+from twisted.internet.defer import Deferred, fail
+from twisted.internet.task import Clock
+from twisted.test.proto_helpers import MemoryReactor
+from twisted.trial.unittest import SynchronousTestCase
+from twisted.web.client import ResponseDone
+from twisted.web.resource import Resource
+from twisted.web.test.requesthelper import DummyChannel, DummyRequest
+from twisted.python.failure import Failure
+
+from mimic.core import MimicCore
+from mimic.resource import MimicRoot
+from mimic.workers import (
+    AdoptedPort, GatedResource, TenantRouter, TickBroadcast, TickGate,
+    WorkerProxy, WorkerPool, forwarded_request_factory, tenant_for_path,
+    worker_for_tenant)
+
+
+class RoutingTests(SynchronousTestCase):
+    """
+    Tests for assigning requests to workers.
+    """
+
+    def test_tenant_for_path(self):
+        """
+        :func:`tenant_for_path` finds the tenant ID in the path of a service
+        endpoint, and nowhere else.
+        """
+        self.assertEqual(
+            "1234",
+            tenant_for_path(["mimicking", "NovaApi-abc", "ORD", "v2", "1234",
+                             "servers"]))
+        self.assertEqual(
+            None, tenant_for_path(["mimicking", "NovaApi-abc", "ORD", "v2"]))
+        self.assertEqual(
+            None, tenant_for_path(["identity", "v2.0", "tokens", "a", "b"]))
+
+    def test_worker_for_tenant(self):
+        """
+        :func:`worker_for_tenant` assigns each tenant to a stable worker,
+        spreading tenants across all workers.
+        """
+        tenants = ["tenant_{0}".format(i) for i in range(100)]
+        owners = [worker_for_tenant(tenant, 4) for tenant in tenants]
+        self.assertEqual(set([0, 1, 2, 3]), set(owners))
+        self.assertEqual(owners,
+                         [worker_for_tenant(tenant, 4) for tenant in tenants])
+        self.assertEqual(worker_for_tenant(u"tenant_0", 4), owners[0])
+
+    def setUp(self):
+        """
+        Create a local root resource for the router to serve requests from.
+        """
+        self.root = MimicRoot(MimicCore(Clock(), [])).app.resource()
+
+    def router_resource(self, segments, index):
+        """
+        Get the resource that worker ``index`` of two uses to render a
+        request for the given path segments.
+        """
+        router = TenantRouter(MemoryReactor(), self.root, [1001, 1002], index)
+        return router.resource_for_request(DummyRequest(segments))
+
+    def test_local_tenant_served_locally(self):
+        """
+        A request for a tenant owned by the worker is served by its own root.
+        """
+        segments = ["mimicking", "NovaApi-abc", "ORD", "v2", "tenant_0"]
+        owner = worker_for_tenant("tenant_0", 2)
+        self.assertIdentical(self.root,
+                             self.router_resource(segments, owner))
+
+    def test_remote_tenant_proxied(self):
+        """
+        A request for a tenant owned by another worker is proxied to that
+        worker's private port.
+        """
+        segments = ["mimicking", "NovaApi-abc", "ORD", "v2", "tenant_0"]
+        owner = worker_for_tenant("tenant_0", 2)
+        resource = self.router_resource(segments, 1 - owner)
+        self.assertIsInstance(resource, WorkerProxy)
+        self.assertEqual([1001, 1002][owner], resource._port)
+
+    def test_no_tenant_served_locally(self):
+        """
+        Requests which address no tenant in particular are served locally.
+        """
+        self.assertIdentical(
+            self.root,
+            self.router_resource(["identity", "v2.0", "tokens"], 1))
+
+    def test_tick_broadcast(self):
+        """
+        Requests to advance the clock are delivered to every worker.
+        """
+        self.assertIsInstance(
+            self.router_resource(["mimic", "v1.1", "tick"], 0),
+            TickBroadcast)
+
+
+class ForwardedRequestTests(SynchronousTestCase):
+    """
+    Tests for :func:`forwarded_request_factory`.
+    """
+
+    def test_public_port(self):
+        """
+        Forwarded requests report that they were received on the public port.
+        """
+        request_class = forwarded_request_factory(8900)
+        request = request_class(DummyChannel(), False)
+        request.host = IPv4Address("TCP", "127.0.0.1", 12345)
+        self.assertEqual(IPv4Address("TCP", "127.0.0.1", 8900),
+                         request.getHost())
+
+
+class WorkerPoolTests(SynchronousTestCase):
+    """
+    Tests for :class:`WorkerPool`.
+    """
+
+    def test_spawns_workers(self):
+        """
+        Starting a :class:`WorkerPool` spawns one ``twistd mimic`` process per
+        worker, each told its index and the private ports of all workers.
+        """
+        spawned = []
+        signalled = []
+
+        class FakeProcess(object):
+            def signalProcess(self, signal):
+                signalled.append(signal)
+
+        class SpawningReactor(MemoryReactor):
+            def spawnProcess(self, protocol, executable, args, env, childFDs):
+                spawned.append((args, childFDs))
+                return FakeProcess()
+
+        pool = WorkerPool(SpawningReactor(), "127.0.0.1", 0, 2,
+                          ["--realtime"])
+        pool.startService()
+        self.assertEqual(2, len(spawned))
+        ports = spawned[0][0][spawned[0][0].index("--worker-ports") + 1]
+        self.assertEqual(2, len(ports.split(",")))
+        for index, (args, child_fds) in enumerate(spawned):
+            self.assertIn("mimic", args)
+            self.assertEqual(str(index),
+                             args[args.index("--worker-index") + 1])
+            self.assertEqual(ports, args[args.index("--worker-ports") + 1])
+            self.assertEqual("--realtime", args[-1])
+            self.assertEqual(set([0, 1, 2, 3, 4]), set(child_fds))
+        pool.stopService()
+        self.assertEqual(["TERM", "TERM"], signalled)
+
+
+class FakeResponse(object):
+    """
+    A response with a code and a body, as returned by :obj:`treq.post`.
+    """
+
+    def __init__(self, code, body):
+        """
+        Create a response with the given code and body.
+        """
+        self.code = code
+        self.length = len(body)
+        self._body = body
+
+    def deliverBody(self, protocol):
+        """
+        Deliver the whole body to the protocol at once.
+        """
+        protocol.dataReceived(self._body)
+        protocol.connectionLost(Failure(ResponseDone()))
+
+
+class Counter(Resource):
+    """
+    A resource which counts the requests it renders.
+    """
+
+    isLeaf = True
+
+    def __init__(self):
+        """
+        Start counting at zero.
+        """
+        Resource.__init__(self)
+        self.rendered = 0
+
+    def render(self, request):
+        """
+        Count the request.
+        """
+        self.rendered += 1
+        return b"counted"
+
+
+class TickGateTests(SynchronousTestCase):
+    """
+    Tests for :obj:`TickGate` and :obj:`GatedResource`.
+    """
+
+    def setUp(self):
+        """
+        Create a gate in front of a counting resource.
+        """
+        self.clock = Clock()
+        self.gate = TickGate(self.clock, timeout=10)
+        self.counter = Counter()
+        self.resource = GatedResource(self.gate, self.counter, control=True)
+
+    def render(self, segments):
+        """
+        Render a POST request for the given path segments.
+        """
+        request = DummyRequest(segments)
+        request.method = b"POST"
+        request.render(self.resource)
+        return request
+
+    def test_held_until_released(self):
+        """
+        Requests are held from ``tick/hold`` until as many ``tick/release``
+        requests, and then served; ticks themselves are never held.
+        """
+        self.assertEqual(204, self.render(["mimic", "v1.1", "tick",
+                                           "hold"]).responseCode)
+        self.render(["mimic", "v1.1", "tick", "hold"])
+        request = self.render(["identity", "v2.0", "tokens"])
+        self.assertEqual((0, 0), (self.counter.rendered, request.finished))
+        self.render(["mimic", "v1.1", "tick"])
+        self.assertEqual(1, self.counter.rendered)
+        self.render(["mimic", "v1.1", "tick", "release"])
+        self.assertEqual(1, self.counter.rendered)
+        self.render(["mimic", "v1.1", "tick", "release"])
+        self.assertEqual((2, [b"counted"], 1),
+                         (self.counter.rendered, request.written,
+                          request.finished))
+
+    def test_hold_times_out(self):
+        """
+        A hold which is never released is released after the timeout.
+        """
+        self.gate.hold()
+        self.render(["identity"])
+        self.clock.advance(10)
+        self.assertEqual((1, False), (self.counter.rendered, self.gate.held))
+
+    def test_no_control_on_public_socket(self):
+        """
+        Without ``control``, the hold and release endpoints are passed on to
+        the resource instead.
+        """
+        resource = GatedResource(self.gate, self.counter)
+        request = DummyRequest(["mimic", "v1.1", "tick", "hold"])
+        request.render(resource)
+        self.assertEqual((False, 1), (self.gate.held, self.counter.rendered))
+
+
+class TickBroadcastTests(SynchronousTestCase):
+    """
+    Tests for :obj:`TickBroadcast`.
+    """
+
+    def setUp(self):
+        """
+        Create a broadcast for the second of two workers, whose requests
+        are recorded and answered when the test chooses.
+        """
+        self.posted = []
+        self.broadcast = TickBroadcast([1001, 1002], 1, self.post)
+
+    def post(self, url, data):
+        """
+        Record a request, returning a Deferred for its response.
+        """
+        d = Deferred()
+        self.posted.append((url.split(":")[2], data, d))
+        return d
+
+    def respond(self, code=200, body=b"{}"):
+        """
+        Respond to every request recorded so far, returning their URLs and
+        bodies.
+        """
+        posted, self.posted = self.posted, []
+        for url, data, d in posted:
+            d.callback(FakeResponse(code, body))
+        return [(url, data) for (url, data, d) in posted]
+
+    def tick(self):
+        """
+        Start delivering a tick.
+        """
+        request = DummyRequest(["mimic", "v1.1", "tick"])
+        request.method = b"POST"
+        request.content = BytesIO(b'{"amount": 5}')
+        request.render(self.broadcast)
+        return request
+
+    def test_atomic(self):
+        """
+        Every worker is told to hold its requests, then, once all have
+        done so, to tick, and, once all have ticked, to release them; the
+        response is this worker's response to the tick.
+        """
+        request = self.tick()
+        self.assertEqual([("1001/mimic/v1.1/tick/hold", b""),
+                          ("1002/mimic/v1.1/tick/hold", b"")],
+                         self.respond(204))
+        self.assertEqual([("1001/mimic/v1.1/tick", b'{"amount": 5}'),
+                          ("1002/mimic/v1.1/tick", b'{"amount": 5}')],
+                         self.respond(200, b'{"advanced": 5}'))
+        self.assertEqual(0, request.finished)
+        self.assertEqual([("1001/mimic/v1.1/tick/release", b""),
+                          ("1002/mimic/v1.1/tick/release", b"")],
+                         self.respond(204))
+        self.assertEqual((200, [b'{"advanced": 5}'], 1),
+                         (request.responseCode, request.written,
+                          request.finished))
+
+    def test_hold_failed(self):
+        """
+        If a worker cannot be held, no worker ticks, those held are
+        released, and the tick fails.
+        """
+        self.broadcast = TickBroadcast(
+            [1001, 1002], 1,
+            lambda url, data: (fail(Exception("down")) if "1001" in url
+                               else self.post(url, data)))
+        request = self.tick()
+        self.assertEqual([("1002/mimic/v1.1/tick/hold", b"")],
+                         self.respond(204))
+        self.assertEqual([("1002/mimic/v1.1/tick/release", b"")],
+                         self.respond(204))
+        self.assertEqual((500, 1), (request.responseCode, request.finished))
+        self.flushLoggedErrors(Exception)
+
+
+class AdoptedPortTests(SynchronousTestCase):
+    """
+    Tests for :obj:`AdoptedPort`.
+    """
+
+    def test_port_number_cached(self):
+        """
+        The port number of the adopted socket is looked up once.
+        """
+        sock = socket.socket()
+        self.addCleanup(sock.close)
+        sock.bind(("127.0.0.1", 0))
+        port = AdoptedPort(MemoryReactor(), sock.fileno(), None)
+        number = sock.getsockname()[1]
+        self.assertEqual(number, port.port_number)
+        sock.close()
+        self.assertEqual(number, port.port_number)
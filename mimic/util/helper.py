@@ -5,7 +5,14 @@ Helper methods
 
 :var fmt: strftime format for datetimes used in JSON.
 """
-from datetime import datetime, timedelta
+import json
+import os
+from binascii import hexlify
+from bisect import bisect_left, insort
+from collections import deque
+from datetime import datetime
+from hashlib import sha1
+from itertools import count
 from random import randint
 
 from characteristic import Attribute
@@ -35,11 +42,253 @@ def attribute_names(attribute_list):
             for attr in attribute_list]
 
 
+class BoundedCache(object):
+    """
+    A mapping which holds at most ``max_size`` entries; once it is full,
+    adding a new key evicts the key that was added earliest.
+
+    :ivar int max_size: The maximum number of entries retained.
+    """
+
+    def __init__(self, max_size):
+        """
+        Create an empty cache which will hold up to ``max_size`` entries.
+        """
+        self.max_size = max_size
+        self._values = {}
+        self._insertion_order = deque()
+
+    def __len__(self):
+        """
+        Return the number of entries currently cached.
+        """
+        return len(self._values)
+
+    def __contains__(self, key):
+        """
+        Return whether ``key`` is currently cached.
+        """
+        return key in self._values
+
+    def get(self, key, default=None):
+        """
+        Return the value cached for ``key``, or ``default`` if there is none.
+        """
+        return self._values.get(key, default)
+
+    def set(self, key, value):
+        """
+        Cache ``value`` under ``key``, evicting the oldest entry if the cache
+        is full.
+        """
+        if key not in self._values:
+            if len(self._values) >= self.max_size:
+                del self._values[self._insertion_order.popleft()]
+            self._insertion_order.append(key)
+        self._values[key] = value
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        self._values.clear()
+        self._insertion_order.clear()
+
+
+class SubstringIndex(object):
+    """
+    An index from string keys (such as names) to the items bearing them,
+    which can find the items whose key contains a given substring or starts
+    with a given prefix without examining every key.
+
+    Each distinct key is recorded under every 3-character substring
+    ("trigram") it contains; a substring search intersects the keys
+    recorded under the trigrams of the substring, and checks only those.
+    """
+
+    def __init__(self):
+        """
+        Create an empty index.
+        """
+        self._items = {}
+        self._sorted_keys = []
+        self._trigrams = {}
+
+    @staticmethod
+    def _trigrams_of(key):
+        """
+        Get the set of 3-character substrings of ``key``.
+        """
+        return set(key[i:i + 3] for i in range(len(key) - 2))
+
+    def add(self, key, item):
+        """
+        Record ``item`` under ``key``.
+        """
+        items = self._items.get(key)
+        if items is None:
+            items = self._items[key] = set()
+            insort(self._sorted_keys, key)
+            for trigram in self._trigrams_of(key):
+                self._trigrams.setdefault(trigram, set()).add(key)
+        items.add(item)
+
+    def remove(self, key, item):
+        """
+        Forget that ``item`` was recorded under ``key``.
+        """
+        items = self._items[key]
+        items.discard(item)
+        if not items:
+            del self._items[key]
+            del self._sorted_keys[bisect_left(self._sorted_keys, key)]
+            for trigram in self._trigrams_of(key):
+                keys = self._trigrams[trigram]
+                keys.discard(key)
+                if not keys:
+                    del self._trigrams[trigram]
+
+    def _items_for_keys(self, keys):
+        """
+        Get the set of items recorded under any of the given keys.
+        """
+        result = set()
+        for key in keys:
+            result.update(self._items[key])
+        return result
+
+    def with_prefix(self, prefix):
+        """
+        Get the set of items whose key starts with ``prefix``.
+        """
+        keys = []
+        for key in self._sorted_keys[bisect_left(self._sorted_keys, prefix):]:
+            if not key.startswith(prefix):
+                break
+            keys.append(key)
+        return self._items_for_keys(keys)
+
+    def containing(self, fragment):
+        """
+        Get the set of items whose key contains ``fragment``.
+        """
+        if len(fragment) < 3:
+            candidates = self._items
+        else:
+            candidate_sets = []
+            for trigram in self._trigrams_of(fragment):
+                keys = self._trigrams.get(trigram)
+                if not keys:
+                    return set()
+                candidate_sets.append(keys)
+            candidate_sets.sort(key=len)
+            candidates = candidate_sets[0].intersection(*candidate_sets[1:])
+        return self._items_for_keys(key for key in candidates
+                                    if fragment in key)
+
+
+_versions = count(1)
+
+
+def next_version():
+    """
+    Get a new version stamp for a resource which has just been created or
+    changed.  Version stamps are never reused within a process, so a stamp
+    identifies one state of one resource.
+    """
+    return next(_versions)
+
+
+#: The number of response bodies remembered by a :obj:`ResponseCache`.
+RESPONSE_CACHE_SIZE = 1024
+
+
+class ResponseCache(object):
+    """
+    A cache of serialized JSON response bodies, each identified by a key
+    which changes whenever the body would, such as the version stamps of the
+    resources the body represents.
+
+    Responses served from the cache carry an ``ETag`` derived from their
+    key, and conditional requests with a matching ``If-None-Match`` are
+    answered with 304 (Not Modified).
+    """
+
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE):
+        """
+        Create an empty cache which will hold up to ``max_size`` bodies.
+        """
+        self._bodies = BoundedCache(max_size)
+        # Version stamps start again in every process, so entity tags are
+        # qualified by something unique to this cache.
+        self._instance = hexlify(os.urandom(8))
+
+    def respond(self, request, key, render):
+        """
+        Respond to ``request`` with the body cached for ``key``, rendering
+        and caching it first if necessary.
+
+        :param key: a hashable value identifying the body, or ``None`` if
+            the response should not be cached.
+        :param render: a callable returning a 2-tuple of a JSON-serializable
+            body and a response code; only responses with code 200 are
+            cached.
+
+        :return: the serialized body to write, if any.
+        """
+        body = None
+        if key is not None:
+            body = self._bodies.get(key)
+        if body is None:
+            data, code = render()
+            request.setResponseCode(code)
+            body = json.dumps(data)
+            if key is None or code != 200:
+                return body
+            self._bodies.set(key, body)
+        etag = '"{0}"'.format(
+            sha1(self._instance + repr(key).encode("utf-8")).hexdigest())
+        if request.setETag(etag.encode("ascii")):
+            return b''
+        return body
+
+
+#: The number of timestamps remembered by :obj:`seconds_to_timestamp`.
+TIMESTAMP_CACHE_SIZE = 4096
+
+_timestamps = BoundedCache(TIMESTAMP_CACHE_SIZE)
+
+
 def seconds_to_timestamp(seconds, format=fmt):
     """
     Return an ISO8601 Zulu timestamp given seconds since the epoch.
+
+    Resources keep their times as seconds and render the same few of them in
+    response after response, so recently formatted timestamps are remembered.
+    """
+    key = (seconds, format)
+    timestamp = _timestamps.get(key)
+    if timestamp is None:
+        timestamp = datetime.utcfromtimestamp(seconds).strftime(format)
+        _timestamps.set(key, timestamp)
+    return timestamp
+
+
+def timestamp_to_seconds(timestamp):
+    """
+    Return the seconds since the epoch given an ISO8601 Zulu timestamp, with
+    or without fractional seconds.
+
+    :raise ValueError: if the timestamp is not in either form.
     """
-    return datetime.utcfromtimestamp(seconds).strftime(format)
+    for format in (fmt, '%Y-%m-%dT%H:%M:%SZ'):
+        try:
+            delta = datetime.strptime(timestamp, format) - datetime(1970, 1, 1)
+        except ValueError:
+            continue
+        return (delta.days * 86400 + delta.seconds +
+                delta.microseconds / 1000000.0)
+    raise ValueError("Invalid timestamp: {0!r}".format(timestamp))
 
 
 def not_found_response(resource='servers'):
@@ -74,30 +323,3 @@ def invalid_resource(message, response_code=400):
     code to given response code. Defaults response code to 404, if not provided.
     """
     return {"message": message, "code": response_code}
-
-
-def set_resource_status(updated_time, time_delta, status='ACTIVE',
-                        current_timestamp=None):
-    """
-    Given the updated_time and time delta, if the updated_time + time_delta is
-    greater than the current time in UTC, returns the given status; otherwise
-    return None.
-
-    :param str updated_time: The time that the server was last updated by a
-        client.
-    :param int time_delta: The delta, in seconds, from ``updated_time``.
-    :param str status: The status to return if the time_delta has expired (i.e.
-        the wall clock has advanced more than ``time_delta`` past
-        ``updated_time``).
-    :param float current_timestamp: The current time, in seconds from the POSIX
-        epoch.
-
-    :return: ``status`` or ``None``.
-    """
-    current_datetime = datetime.utcfromtimestamp(current_timestamp)
-    last_updated_datetime = datetime.strptime(updated_time, fmt)
-    expiration_interval = timedelta(seconds=int(time_delta))
-    expiration_datetime = last_updated_datetime + expiration_interval
-
-    if current_datetime >= expiration_datetime:
-        return status
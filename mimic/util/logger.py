@@ -0,0 +1,143 @@
+# -*- test-case-name: mimic.test.test_logger -*-
+"""
+Level-gated logging for Mimic and its plugins, and a sampled access log.
+
+Messages are emitted through :obj:`twisted.python.log`, with a
+``logLevel`` (one of the :mod:`logging` levels) and a ``system`` naming
+their source, so that they can be filtered by the usual observers.
+Messages below the current level are discarded before anything is
+formatted, so disabled debug logging costs a single comparison.
+"""
+
+import logging
+from random import random
+from time import time
+
+from twisted.python import log
+from twisted.web.iweb import IRequest
+
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+#: The names of the levels accepted by :obj:`level_named`.
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+
+_level = INFO
+_access_sample_rate = 0.0
+
+
+def level_named(name):
+    """
+    Get the level with the given name.
+
+    :raise ValueError: if there is no such level.
+    """
+    try:
+        return LEVELS[name.lower()]
+    except KeyError:
+        raise ValueError("Unknown log level: " + name)
+
+
+def set_level(level):
+    """
+    Discard messages less severe than the given level from now on.
+    """
+    global _level
+    _level = level
+
+
+def set_access_sample_rate(rate):
+    """
+    Log the latency of the given fraction (from 0 to 1) of requests to Klein
+    routes from now on.
+    """
+    global _access_sample_rate
+    _access_sample_rate = rate
+
+
+class Logger(object):
+    """
+    A logger for one part of Mimic.
+
+    :ivar str system: the name of the part of Mimic logging; it is reported
+        as the ``system`` of its log events.
+    """
+
+    def __init__(self, system):
+        """
+        Create a logger for the given system.
+        """
+        self.system = system
+
+    def enabled(self, level):
+        """
+        Whether messages of the given level are currently being logged.
+        """
+        return level >= _level
+
+    def emit(self, level, format, **fields):
+        """
+        Log a message of the given level, if that level is enabled.
+
+        :param str format: a ``%``-style format string, which is only
+            interpolated with ``fields`` if the message is observed.
+        """
+        if level >= _level:
+            log.msg(format=format, system=self.system, logLevel=level,
+                    **fields)
+
+    def debug(self, format, **fields):
+        """
+        Log a message of level :obj:`DEBUG`.
+        """
+        self.emit(DEBUG, format, **fields)
+
+    def info(self, format, **fields):
+        """
+        Log a message of level :obj:`INFO`.
+        """
+        self.emit(INFO, format, **fields)
+
+    def warning(self, format, **fields):
+        """
+        Log a message of level :obj:`WARNING`.
+        """
+        self.emit(WARNING, format, **fields)
+
+    def error(self, format, **fields):
+        """
+        Log a message of level :obj:`ERROR`.
+        """
+        self.emit(ERROR, format, **fields)
+
+
+access_log = Logger("mimic.access")
+
+
+def timed_route(route, f):
+    """
+    Wrap a Klein route handler so that a sample of the requests it handles
+    are logged, with their latency, to :obj:`access_log`.
+
+    :param str route: the URL pattern of the route.
+    :param f: the handler, which takes the request as its first argument
+        (other than the instance of the class it belongs to, if any).
+    """
+    def timed(*args, **kwargs):
+        if _access_sample_rate and random() < _access_sample_rate:
+            request = [arg for arg in args[:2] if IRequest.providedBy(arg)][0]
+            started = time()
+
+            def finished(ignored):
+                access_log.emit(
+                    INFO, "%(method)s %(route)s %(code)s %(latency).3fms",
+                    method=request.method, route=route, code=request.code,
+                    latency=(time() - started) * 1000)
+            request.notifyFinish().addBoth(finished)
+        return f(*args, **kwargs)
+    timed.__name__ = f.__name__
+    timed.__doc__ = f.__doc__
+    return timed
@@ -0,0 +1,427 @@
+# -*- test-case-name: mimic.test.test_storage -*-
+"""
+Bounded-memory storage for blobs of data, such as the bodies of Swift
+objects.
+
+Small blobs are kept in memory, as long as the total kept in memory stays
+under a limit; larger blobs, and any stored once the limit is reached, are
+spilled to temporary files.  Blobs are written and read a chunk at a time,
+so storing or serving one takes no more than a chunk's worth of memory
+beyond what is kept.
+
+Blobs are addressed by their content: storing the same bytes twice yields
+the same blob, which is only discarded once it has been released as many
+times as it was stored.
+"""
+
+import atexit
+import hashlib
+import os
+import shutil
+import tempfile
+from bisect import bisect_right
+
+from zope.interface import implementer
+
+from twisted.internet.interfaces import IPushProducer
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET
+
+
+#: The number of bytes read or written at a time.
+CHUNK_SIZE = 64 * 1024
+
+#: Blobs larger than this many bytes are spilled to disk by default.
+SPILL_THRESHOLD = 1024 * 1024
+
+_memory_limit = 256 * 1024 * 1024
+
+
+def set_memory_limit(limit):
+    """
+    Keep at most the given number of bytes of blobs in memory from now on,
+    in every :obj:`BlobStore` not created with a limit of its own.
+    """
+    global _memory_limit
+    _memory_limit = limit
+
+
+class _Blob(object):
+    """
+    A blob stored in a :obj:`BlobStore`, possibly several times over.
+
+    :ivar bytes key: the SHA-256 digest of the contents of the blob, by
+        which the store identifies it.
+    :ivar str etag: the hexadecimal MD5 digest of the contents of the blob,
+        as used for the ``ETag`` of Swift objects.
+    :ivar int size: the length of the blob in bytes.
+    :ivar int references: the number of times the blob has been stored
+        and not yet released.
+    """
+
+    def __init__(self, store, key, etag, size):
+        """
+        :param BlobStore store: the store holding the blob.
+        """
+        self._store = store
+        self.key = key
+        self.etag = etag
+        self.size = size
+        self.references = 1
+
+    def retain(self):
+        """
+        Take one more reference to the blob.
+        """
+        self.references += 1
+
+    def release(self):
+        """
+        Release one reference to the blob, discarding it if it was the last.
+        """
+        self.references -= 1
+        if self.references == 0:
+            self._store._discard(self)
+
+
+class MemoryBlob(_Blob):
+    """
+    A blob kept in memory.
+    """
+
+    def __init__(self, store, key, etag, data):
+        """
+        :param bytes data: the contents of the blob.
+        """
+        _Blob.__init__(self, store, key, etag, len(data))
+        self._data = data
+
+    def chunks(self, start=0, end=None):
+        """
+        Iterate over the bytes of the blob from offset ``start`` up to (but
+        not including) offset ``end``, or the end of the blob, a chunk at a
+        time.
+        """
+        if end is None:
+            end = self.size
+        for offset in range(start, end, CHUNK_SIZE):
+            yield self._data[offset:min(offset + CHUNK_SIZE, end)]
+
+    def free(self):
+        """
+        Discard the contents of the blob.
+        """
+        self._store.memory_used -= self.size
+        self._data = b""
+
+
+class FileBlob(_Blob):
+    """
+    A blob spilled to a temporary file.
+
+    :ivar str path: the path of the file.
+    """
+
+    def __init__(self, store, key, etag, path, size):
+        """
+        :param str path: the path of the file holding the blob.
+        """
+        _Blob.__init__(self, store, key, etag, size)
+        self.path = path
+
+    def chunks(self, start=0, end=None):
+        """
+        Iterate over the bytes of the blob from offset ``start`` up to (but
+        not including) offset ``end``, or the end of the blob, a chunk at a
+        time.  The file is only open while iterating.
+        """
+        if end is None:
+            end = self.size
+        remaining = end - start
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def free(self):
+        """
+        Discard the contents of the blob, removing its file.
+        """
+        os.remove(self.path)
+
+
+class BlobStore(object):
+    """
+    Stores blobs in memory or, beyond some size, in temporary files.
+
+    :ivar int memory_used: the total size of the blobs currently kept in
+        memory.
+    :ivar int spill_threshold: the size in bytes beyond which a blob is
+        always spilled to disk.
+    """
+
+    def __init__(self, memory_limit=None, spill_threshold=SPILL_THRESHOLD):
+        """
+        :param int memory_limit: the most bytes of blobs to keep in memory
+            at once; by default, the limit given to :obj:`set_memory_limit`.
+        :param int spill_threshold: the size in bytes beyond which a blob is
+            always spilled to disk.
+        """
+        self._memory_limit = memory_limit
+        self.spill_threshold = spill_threshold
+        self.memory_used = 0
+        self._directory = None
+        self._blobs = {}
+
+    @property
+    def memory_limit(self):
+        """
+        The most bytes of blobs to keep in memory at once.
+        """
+        if self._memory_limit is None:
+            return _memory_limit
+        return self._memory_limit
+
+    def _spill_file(self):
+        """
+        Create a new temporary file to spill a blob to, in a directory which
+        is removed when the process exits.
+        """
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix="mimic-blobs-")
+            atexit.register(shutil.rmtree, self._directory, True)
+        return tempfile.NamedTemporaryFile(dir=self._directory, delete=False)
+
+    def __len__(self):
+        """
+        The number of distinct blobs in the store.
+        """
+        return len(self._blobs)
+
+    def find(self, key):
+        """
+        Get the blob with the given key, or ``None`` if the store holds no
+        such blob.  No reference to the blob is taken.
+        """
+        return self._blobs.get(key)
+
+    def store(self, source):
+        """
+        Store the remaining contents of a file-like object, reading (and
+        hashing) it a chunk at a time.  If the store already holds a blob
+        with the same contents, that blob is returned with one more
+        reference, and the new copy is dropped.
+
+        :return: a :obj:`MemoryBlob` or a :obj:`FileBlob`, which should be
+            released once it is no longer needed.
+        """
+        md5 = hashlib.md5()
+        sha256 = hashlib.sha256()
+        chunks = []
+        size = 0
+        spill = None
+        try:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                md5.update(chunk)
+                sha256.update(chunk)
+                size += len(chunk)
+                if spill is not None:
+                    spill.write(chunk)
+                    continue
+                chunks.append(chunk)
+                if (size > self.spill_threshold or
+                        self.memory_used + size > self.memory_limit):
+                    spill = self._spill_file()
+                    spill.writelines(chunks)
+                    chunks = None
+        except Exception:
+            if spill is not None:
+                spill.close()
+                os.remove(spill.name)
+            raise
+        if spill is not None:
+            spill.close()
+        key = sha256.digest()
+        blob = self._blobs.get(key)
+        if blob is not None:
+            if spill is not None:
+                os.remove(spill.name)
+            blob.retain()
+            return blob
+        if spill is None:
+            self.memory_used += size
+            blob = MemoryBlob(self, key, md5.hexdigest(), b"".join(chunks))
+        else:
+            blob = FileBlob(self, key, md5.hexdigest(), spill.name, size)
+        self._blobs[key] = blob
+        return blob
+
+    def _discard(self, blob):
+        """
+        Discard a blob which is no longer referred to.
+        """
+        del self._blobs[blob.key]
+        blob.free()
+
+
+class Concatenation(object):
+    """
+    A body made of other bodies (such as blobs) laid end to end, without
+    copying them.
+
+    :ivar int size: the total length of the parts in bytes.
+    """
+
+    def __init__(self, parts):
+        """
+        :param list parts: the bodies to concatenate, in order; each has a
+            ``size`` and ``chunks(start, end)``, ``retain`` and ``release``
+            methods, like a :obj:`MemoryBlob`.
+        """
+        self._parts = parts
+        self._offsets = []
+        self.size = 0
+        for part in parts:
+            self._offsets.append(self.size)
+            self.size += part.size
+
+    def chunks(self, start=0, end=None):
+        """
+        Iterate over the bytes of the concatenation from offset ``start`` up
+        to (but not including) offset ``end``, or the end, a chunk at a
+        time.  Parts before ``start`` are skipped without being read, by
+        searching the offsets at which each part starts.
+        """
+        if end is None:
+            end = self.size
+        index = max(bisect_right(self._offsets, start) - 1, 0)
+        while index < len(self._parts) and self._offsets[index] < end:
+            part, offset = self._parts[index], self._offsets[index]
+            part_start = max(start - offset, 0)
+            part_end = min(end - offset, part.size)
+            if part_start < part_end:
+                for chunk in part.chunks(part_start, part_end):
+                    yield chunk
+            index += 1
+
+    def retain(self):
+        """
+        Take one more reference to each part.
+        """
+        for part in self._parts:
+            part.retain()
+
+    def release(self):
+        """
+        Release one reference to each part.
+        """
+        for part in self._parts:
+            part.release()
+
+
+@implementer(IPushProducer)
+class ChunkProducer(object):
+    """
+    Writes chunks of data to a request as fast as its transport will take
+    them, and finishes the request once they have all been written.
+
+    While writing, the producer can hold a reference to the blob the chunks
+    are read from, so that the blob is not discarded (cutting the body
+    short) if the object it belongs to is replaced or deleted meanwhile.
+    """
+
+    def __init__(self, request, chunks, blob=None):
+        """
+        :param request: the :obj:`twisted.web.server.Request` to write to.
+        :param chunks: an iterable of the ``bytes`` to write.
+        :param blob: an object with ``retain`` and ``release`` methods, such
+            as a :obj:`MemoryBlob`, to retain from when writing starts until
+            it finishes or is stopped; or ``None``.
+        """
+        self._request = request
+        self._chunks = iter(chunks)
+        self._blob = blob
+        self._paused = False
+        self._stopped = False
+
+    def start(self):
+        """
+        Retain the blob, if any, and start writing.
+        """
+        if self._blob is not None:
+            self._blob.retain()
+        self._request.registerProducer(self, True)
+        if not self._paused:
+            self.resumeProducing()
+
+    def resumeProducing(self):
+        """
+        Write chunks until the transport asks for a pause, or they run out.
+        """
+        self._paused = False
+        for chunk in self._chunks:
+            self._request.write(chunk)
+            if self._paused or self._stopped:
+                return
+        self._request.unregisterProducer()
+        self._request.finish()
+        self._release()
+
+    def _release(self):
+        """
+        Release the blob, if it is still retained.
+        """
+        blob, self._blob = self._blob, None
+        if blob is not None:
+            blob.release()
+
+    def pauseProducing(self):
+        """
+        Stop writing until :obj:`resumeProducing` is called.
+        """
+        self._paused = True
+
+    def stopProducing(self):
+        """
+        Stop writing for good, since the connection has been lost, and
+        release the blob.
+        """
+        self._stopped = True
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+        self._release()
+
+
+class StreamingBody(Resource):
+    """
+    A resource which renders the given chunks of data with a
+    :obj:`ChunkProducer`, retaining the blob they are read from while it
+    does.
+    """
+
+    isLeaf = True
+
+    def __init__(self, chunks, blob=None):
+        """
+        :param chunks: an iterable of the ``bytes`` of the body.
+        :param blob: the blob the chunks are read from; see
+            :obj:`ChunkProducer`.
+        """
+        Resource.__init__(self)
+        self._chunks = chunks
+        self._blob = blob
+
+    def render(self, request):
+        """
+        Stream the chunks to the request.
+        """
+        ChunkProducer(request, self._chunks, self._blob).start()
+        return NOT_DONE_YET
@@ -0,0 +1,489 @@
+# -*- test-case-name: mimic.test.test_workers -*-
+
+"""
+Support for serving Mimic from several worker processes.
+
+A master process binds the public listening socket, plus one private
+loopback socket for each worker, and spawns the workers, which adopt those
+sockets.  Every worker accepts connections on the public socket, but each
+tenant is owned by exactly one worker: requests for a tenant are proxied to
+the private socket of the worker that owns it, so all the per-API data for a
+tenant lives in a single process.  Sessions are shared between the workers
+through a :obj:`mimic.session.SQLiteSessionBackend`.
+
+Advancing the clock is delivered to every worker by the worker which
+receives it, atomically: every worker holds its requests (see
+:obj:`TickGate`) until all of them have advanced their clocks.
+"""
+
+import os
+import shutil
+import socket
+import sys
+from json import dumps
+from zlib import crc32
+
+import treq
+
+from six import text_type
+
+from twisted.application.service import Service
+from twisted.internet.address import IPv4Address
+from twisted.internet.defer import Deferred, DeferredList
+from twisted.internet.protocol import ProcessProtocol
+from twisted.python import log
+from twisted.web.proxy import ProxyClientFactory
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET, Request
+
+
+#: The file descriptor of the public listening socket within a worker.
+PUBLIC_FD = 3
+
+#: The file descriptor of a worker's private listening socket.
+PRIVATE_FD = 4
+
+
+def worker_for_tenant(tenant_id, worker_count):
+    """
+    Get the index of the worker which owns the given tenant.
+
+    The same tenant maps to the same worker in every process, regardless of
+    hash randomization.
+    """
+    if isinstance(tenant_id, text_type):
+        tenant_id = tenant_id.encode("utf-8")
+    return (crc32(tenant_id) & 0xffffffff) % worker_count
+
+
+def tenant_for_path(segments):
+    """
+    Get the tenant ID addressed by a request, given the segments of its path.
+
+    Service endpoints are located at
+    ``/mimicking/<service ID>/<region>/<version>/<tenant ID>``; every other
+    path addresses no particular tenant.
+
+    :return: the tenant ID, or ``None``.
+    """
+    if len(segments) >= 5 and segments[0] == "mimicking" and segments[4]:
+        return segments[4]
+    return None
+
+
+class WorkerProxy(Resource):
+    """
+    A resource which forwards the request to another worker's private
+    socket, leaving the ``Host`` header intact so that the URIs generated by
+    that worker are the same as if it had received the request itself.
+    """
+
+    isLeaf = True
+
+    def __init__(self, reactor, port):
+        """
+        :param int port: the loopback port of the worker to forward to.
+        """
+        Resource.__init__(self)
+        self._reactor = reactor
+        self._port = port
+
+    def render(self, request):
+        """
+        Forward the request and relay the response.
+        """
+        request.content.seek(0, 0)
+        factory = ProxyClientFactory(
+            request.method, request.uri, request.clientproto,
+            request.getAllHeaders(), request.content.read(), request)
+        self._reactor.connectTCP("127.0.0.1", self._port, factory)
+        return NOT_DONE_YET
+
+
+def forwarded_request_factory(public_port):
+    """
+    Create a request factory for a worker's private socket, whose requests
+    report that they were received on the given public port, so that the
+    URIs Mimic generates while serving them point at the public socket.
+    """
+    class ForwardedRequest(Request):
+        """
+        A request forwarded from the public socket of some worker.
+        """
+        def getHost(self):
+            """
+            Get the address of the public socket.
+            """
+            host = Request.getHost(self)
+            return IPv4Address(host.type, host.host, public_port)
+    return ForwardedRequest
+
+
+#: The most seconds a worker holds requests for a tick, in case the worker
+#: advancing the clocks never finishes.
+HOLD_TIMEOUT = 30
+
+
+class TickGate(object):
+    """
+    Holds requests while the clocks of the workers are being advanced, so
+    that a tick is atomic: every request is served either before any worker
+    has advanced its clock, or after all of them have.
+    """
+
+    def __init__(self, reactor, timeout=HOLD_TIMEOUT):
+        """
+        :param reactor: the :obj:`IReactorTime` on which to time out holds.
+        :param timeout: the most seconds to keep each hold.
+        """
+        self._reactor = reactor
+        self._timeout = timeout
+        self._holds = []
+        self._waiting = []
+
+    @property
+    def held(self):
+        """
+        Whether requests are being held.
+        """
+        return bool(self._holds)
+
+    def hold(self):
+        """
+        Hold requests until :obj:`release` is called as many times as this
+        is, or until the hold times out.
+        """
+        self._holds.append(
+            self._reactor.callLater(self._timeout, self._expire))
+
+    def _expire(self):
+        """
+        Release a hold which has timed out.
+        """
+        self._holds = [call for call in self._holds if call.active()]
+        self._resume()
+
+    def release(self):
+        """
+        Release the oldest hold; once none are left, serve the requests
+        held.
+        """
+        if self._holds:
+            self._holds.pop(0).cancel()
+        self._resume()
+
+    def _resume(self):
+        """
+        Serve the requests held, unless requests are still being held.
+        """
+        if self._holds:
+            return
+        waiting, self._waiting = self._waiting, []
+        for d in waiting:
+            d.callback(None)
+
+    def wait(self):
+        """
+        Get a Deferred which fires once requests are no longer held.
+        """
+        d = Deferred()
+        if self._holds:
+            self._waiting.append(d)
+        else:
+            d.callback(None)
+        return d
+
+
+def _is_tick(segments):
+    """
+    Whether the given path segments address the tick endpoint, or one
+    beneath it.
+    """
+    return segments[:3] == ["mimic", "v1.1", "tick"]
+
+
+class GatedResource(Resource):
+    """
+    A resource which renders requests with another, except while its
+    :obj:`TickGate` holds requests, when it waits until the gate is released.
+    Requests to advance the clock are never held.
+    """
+
+    isLeaf = True
+
+    def __init__(self, gate, resource, control=False):
+        """
+        :param TickGate gate: the gate.
+        :param resource: the resource to render requests with.
+        :param bool control: whether ``POST /mimic/v1.1/tick/hold`` and
+            ``POST /mimic/v1.1/tick/release`` hold and release the gate, as
+            they should on a worker's private socket only.
+        """
+        Resource.__init__(self)
+        self._gate = gate
+        self._resource = resource
+        self._control = control
+
+    def render(self, request):
+        """
+        Render the request, once the gate allows it.
+        """
+        segments = request.prepath + request.postpath
+        if _is_tick(segments):
+            action = segments[3:]
+            if self._control and action in (["hold"], ["release"]):
+                getattr(self._gate, action[0])()
+                request.setResponseCode(204)
+                return b""
+            return self._resource.render(request)
+        if self._gate.held:
+            self._gate.wait().addCallback(lambda ignored: request.render(self))
+            return NOT_DONE_YET
+        return self._resource.render(request)
+
+
+class TickBroadcast(Resource):
+    """
+    A resource which delivers ``/mimic/v1.1/tick`` to every worker
+    atomically: first every worker is told to hold its requests, then each
+    advances its clock, and only once all have done so are they released.
+    It responds with this worker's response to the tick.
+    """
+
+    isLeaf = True
+
+    def __init__(self, ports, index, post=treq.post):
+        """
+        :param list ports: the private ports of all workers.
+        :param int index: the index of this worker in ``ports``.
+        :param post: the function with which to make requests; by default,
+            :obj:`treq.post`.
+        """
+        Resource.__init__(self)
+        self._ports = ports
+        self._index = index
+        self._post = post
+
+    def _broadcast(self, ports, endpoint, body=b""):
+        """
+        POST to the given tick endpoint of each of the given workers.
+
+        :return: a Deferred firing with a list of ``(port, (code, body))``
+            for the workers which responded, or ``(port, None)`` for those
+            which did not.
+        """
+        def post(port):
+            d = self._post(
+                "http://127.0.0.1:{0}/mimic/v1.1/{1}".format(port, endpoint),
+                data=body)
+            d.addCallback(
+                lambda response: treq.content(response).addCallback(
+                    lambda content: (response.code, content)))
+            return d.addErrback(
+                lambda reason: log.err(
+                    reason, "Failed to POST {0} to a worker".format(endpoint)))
+        return DeferredList([post(port) for port in ports]).addCallback(
+            lambda results: [(port, result) for (port, (_, result))
+                             in zip(ports, results)])
+
+    def render_POST(self, request):
+        """
+        Hold every worker's requests, POST the body of the request to each
+        worker's tick endpoint, and release them all.
+        """
+        body = request.content.read()
+        held = []
+
+        def hold(results):
+            held.extend(port for (port, result) in results
+                        if result is not None and result[0] == 204)
+            if len(held) < len(self._ports):
+                return None
+            return self._broadcast(self._ports, "tick", body)
+
+        def release(results):
+            return self._broadcast(held, "tick/release").addCallback(
+                lambda ignored: results)
+
+        def respond(results):
+            if results is None or None in dict(results).values():
+                log.msg("Failed to advance the clock of every worker")
+                code, content = 500, dumps({"message": "tick failed",
+                                            "code": 500})
+            else:
+                code, content = results[self._index][1]
+            request.setResponseCode(code)
+            request.write(content)
+            request.finish()
+
+        d = self._broadcast(self._ports, "tick/hold").addCallback(hold)
+        d.addCallback(release).addCallback(respond)
+        return NOT_DONE_YET
+
+
+class TenantRouter(Resource):
+    """
+    The root resource of a worker's public socket: requests for tenants
+    owned by this worker, or for no tenant in particular, are served by the
+    local Mimic root; all others are proxied to the worker which owns them.
+    """
+
+    isLeaf = True
+
+    def __init__(self, reactor, root, ports, index):
+        """
+        :param root: the local Mimic root resource.
+        :param list ports: the private ports of all workers.
+        :param int index: the index of this worker in ``ports``.
+        """
+        Resource.__init__(self)
+        self._reactor = reactor
+        self._root = root
+        self._ports = ports
+        self._index = index
+
+    def resource_for_request(self, request):
+        """
+        Get the resource which should render the given request.
+        """
+        segments = request.prepath + request.postpath
+        if _is_tick(segments) and segments[3:] in ([], [""]):
+            return TickBroadcast(self._ports, self._index)
+        tenant_id = tenant_for_path(segments)
+        if tenant_id is not None:
+            owner = worker_for_tenant(tenant_id, len(self._ports))
+            if owner != self._index:
+                return WorkerProxy(self._reactor, self._ports[owner])
+        return self._root
+
+    def render(self, request):
+        """
+        Render the request with the appropriate resource.
+        """
+        return self.resource_for_request(request).render(request)
+
+
+def _listening_socket(interface, port, backlog=128):
+    """
+    Create a TCP socket listening on the given interface and port.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((interface, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+class WorkerPool(Service):
+    """
+    A service which binds Mimic's listening sockets and runs a number of
+    ``twistd mimic`` worker processes which serve requests from them.
+    """
+
+    def __init__(self, reactor, interface, port, count, worker_arguments,
+                 temporary_directory=None):
+        """
+        :param str interface: the IPv4 interface to listen on.
+        :param int port: the TCP port to listen on.
+        :param int count: the number of worker processes.
+        :param list worker_arguments: arguments to pass to the ``mimic``
+            plugin of every worker, in addition to those which tell it which
+            worker it is.
+        :param str temporary_directory: a directory created for the workers
+            (such as one holding their session database), to remove when
+            the pool stops; or ``None``.
+        """
+        self._reactor = reactor
+        self._interface = interface
+        self._port = port
+        self._count = count
+        self._worker_arguments = worker_arguments
+        self._temporary_directory = temporary_directory
+        self._sockets = []
+        self.processes = []
+
+    def startService(self):
+        """
+        Bind the sockets and spawn the workers.
+        """
+        Service.startService(self)
+        public = _listening_socket(self._interface, self._port)
+        private = [_listening_socket("127.0.0.1", 0)
+                   for _ in range(self._count)]
+        self._sockets = [public] + private
+        ports = ",".join(str(sock.getsockname()[1]) for sock in private)
+        for index, sock in enumerate(private):
+            args = [sys.executable, "-c",
+                    "from twisted.scripts.twistd import run; run()",
+                    "--nodaemon", "--pidfile=", "mimic",
+                    "--worker-index", str(index),
+                    "--worker-ports", ports] + self._worker_arguments
+            self.processes.append(self._reactor.spawnProcess(
+                ProcessProtocol(), sys.executable, args, env=os.environ,
+                childFDs={0: 0, 1: 1, 2: 2,
+                          PUBLIC_FD: public.fileno(),
+                          PRIVATE_FD: sock.fileno()}))
+
+    def stopService(self):
+        """
+        Terminate the workers, close the sockets, and remove the temporary
+        directory, if any.
+        """
+        Service.stopService(self)
+        for process in self.processes:
+            try:
+                process.signalProcess("TERM")
+            except Exception:
+                log.err(None, "Failed to terminate a worker")
+        for sock in self._sockets:
+            sock.close()
+        self.processes = []
+        self._sockets = []
+        if self._temporary_directory is not None:
+            shutil.rmtree(self._temporary_directory, ignore_errors=True)
+            self._temporary_directory = None
+
+
+class AdoptedPort(Service):
+    """
+    A service which listens on a socket inherited from the master process.
+    """
+
+    def __init__(self, reactor, fd, factory):
+        """
+        :param int fd: the file descriptor of the listening socket.
+        :param factory: the factory to serve connections with.
+        """
+        self._reactor = reactor
+        self._fd = fd
+        self._factory = factory
+        self._port = None
+        self._port_number = None
+
+    @property
+    def port_number(self):
+        """
+        The port number of the socket, looked up once.
+        """
+        if self._port_number is None:
+            sock = socket.fromfd(self._fd, socket.AF_INET, socket.SOCK_STREAM)
+            self._port_number = sock.getsockname()[1]
+            sock.close()
+        return self._port_number
+
+    def startService(self):
+        """
+        Start accepting connections.
+        """
+        Service.startService(self)
+        self._port = self._reactor.adoptStreamPort(self._fd, socket.AF_INET,
+                                                   self._factory)
+
+    def stopService(self):
+        """
+        Stop accepting connections.
+        """
+        Service.stopService(self)
+        if self._port is not None:
+            return self._port.stopListening()
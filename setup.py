@@ -2,22 +2,28 @@
 Setup file for mimic
 """
 
+import sys
+
 from setuptools import setup, find_packages
 
+install_requires = [
+    "characteristic==14.1.0",
+    "klein==0.2.1",
+    "twisted>=13.2.0",
+    "jsonschema==2.0",
+    "treq",
+    "six",
+]
+if sys.version_info < (2, 7):
+    install_requires.append("ordereddict")
+
 setup(
     name='mimic',
     version='1.3.0',
     description='An API-compatible mock service',
     packages=find_packages(exclude=[]) + ["twisted.plugins"],
     package_dir={'mimic': 'mimic'},
-    install_requires=[
-        "characteristic==14.1.0",
-        "klein==0.2.1",
-        "twisted>=13.2.0",
-        "jsonschema==2.0",
-        "treq",
-        "six",
-    ],
+    install_requires=install_requires,
     include_package_data=True,
     license="Apache License, Version 2.0"
 )